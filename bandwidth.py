@@ -0,0 +1,380 @@
+# stdlib
+import json
+import statistics
+import subprocess
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+# lib
+from paramiko import SSHException
+# local
+from prober import OPEN, scan_many
+from ssh import pool, read_channel
+from utils import run_concurrently
+
+# Ports of the services started on VMs for the bandwidth tests: SSH, nginx and dnsmasq
+SERVICE_PORTS = [('tcp', 22), ('tcp', 80), ('udp', 5353)]
+
+
+def parse_iperf(output: str) -> Dict[str, Any]:
+    """
+    Parse the output of `iperf3 --json` into the figures the validator records.
+    :param output: The JSON printed by iperf3.
+    :return: The throughput in each direction in bits per second, bytes received, retransmits, and for UDP tests the
+             jitter and loss. 'error' is set instead if iperf3 reported an error or its output could not be parsed.
+    """
+    try:
+        report = json.loads(output)
+    except ValueError:
+        return {'error': f'Could not parse iperf3 output: {output.strip()[:200]}'}
+    if report.get('error'):
+        return {'error': report['error']}
+
+    end = report.get('end', {})
+    protocol = report.get('start', {}).get('test_start', {}).get('protocol')
+    if protocol is None:
+        # Only guessed for reports without a test_start, as newer releases also report each direction for UDP tests
+        protocol = 'TCP' if 'sum_sent' in end else 'UDP'
+    if protocol == 'TCP':
+        sent, received = end.get('sum_sent', {}), end.get('sum_received', {})
+        return {
+            'sent_bps': sent.get('bits_per_second'),
+            'received_bps': received.get('bits_per_second'),
+            'received_bytes': received.get('bytes'),
+            'retransmits': sent.get('retransmits'),
+        }
+    # UDP tests report both directions together in `sum`, and each direction separately only in newer releases
+    total = end.get('sum', {})
+    sent, received = end.get('sum_sent', total), end.get('sum_received', total)
+    return {
+        'sent_bps': sent.get('bits_per_second'),
+        'received_bps': received.get('bits_per_second'),
+        'received_bytes': received.get('bytes'),
+        'jitter_ms': received.get('jitter_ms', total.get('jitter_ms')),
+        'lost_percent': received.get('lost_percent', total.get('lost_percent')),
+    }
+
+
+def run_iperf(
+    ip: str,
+    duration: int = 10,
+    parallel: int = 4,
+    udp: bool = False,
+    bandwidth: str = '100M',
+) -> Dict[str, Any]:
+    """
+    Run an iperf3 client against a server and parse its results.
+    :param ip: The address of the iperf3 server.
+    :param duration: The number of seconds to send for.
+    :param parallel: The number of parallel streams.
+    :param udp: True to run a UDP test, which measures jitter and loss, instead of a TCP test.
+    :param bandwidth: The target bandwidth of a UDP test.
+    :return: The parsed results, see `parse_iperf`.
+    """
+    command = ['iperf3', '--json', '-c', ip, '-t', str(duration), '-P', str(parallel)]
+    if udp:
+        command.extend(['-u', '-b', bandwidth])
+    try:
+        proc = subprocess.run(command, capture_output=True, text=True, timeout=duration + 60)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return {'error': str(e)}
+    return parse_iperf(proc.stdout)
+
+
+def format_ports(ports: Dict[Tuple[str, int], Tuple[str, Optional[float]]]) -> str:
+    """
+    Format the results of a port scan for printing, e.g. 'tcp/22 open (0.52ms), udp/5353 filtered'.
+    """
+    return ', '.join(
+        f'{protocol}/{port} {status}{"" if latency is None else f" ({latency * 1000:.2f}ms)"}'
+        for (protocol, port), (status, latency) in ports.items()
+    )
+
+
+class BandwidthResult:
+    """
+    Class holding the bandwidth test results for one VM.
+    """
+
+    error: Optional[str]
+    ports: Dict[Tuple[str, int], Tuple[str, Optional[float]]]
+    public_ip: str
+    tcp: Dict[str, Any]
+    tcp_finished: Optional[float]
+    tcp_started: Optional[float]
+    udp: Dict[str, Any]
+    vm_id: int
+
+    def __init__(self, vm_id: int, public_ip: str):
+        self.vm_id = vm_id
+        self.public_ip = public_ip
+        self.ports = {}
+        self.tcp = {}
+        self.udp = {}
+        self.error = None
+        self.tcp_started = None
+        self.tcp_finished = None
+
+    def __str__(self) -> str:
+        if 'received_bps' not in self.tcp:
+            return f'VM #{self.vm_id} at IP {self.public_ip}: {self.error}'
+        received = self.tcp.get('received_bps')
+        jitter = self.udp.get('jitter_ms')
+        lost = self.udp.get('lost_percent')
+        return (
+            f'VM #{self.vm_id} at IP {self.public_ip}: '
+            f'{"-" if received is None else f"{received / 1e6:.1f} Mbit/s"}, '
+            f'{self.tcp.get("retransmits", "-")} retransmits, '
+            f'jitter {"-" if jitter is None else f"{jitter:.3f}ms"}, '
+            f'loss {"-" if lost is None else f"{lost:.2f}%"}, '
+            f'ports {format_ports(self.ports)}'
+            f'{f" ({self.error})" if self.error else ""}'
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        A JSON serialisable representation of the result.
+        """
+        return {
+            'vm_id': self.vm_id,
+            'public_ip': self.public_ip,
+            'tcp_started': self.tcp_started,
+            'tcp_finished': self.tcp_finished,
+            'ports': {
+                f'{protocol}/{port}': {'state': status, 'latency': latency}
+                for (protocol, port), (status, latency) in self.ports.items()
+            },
+            'tcp': self.tcp,
+            'udp': self.udp,
+            'error': self.error,
+        }
+
+
+class BandwidthTester:
+    """
+    Class running bandwidth tests from the validator host against VMs running an iperf3 server, after checking that
+    the services started on the VMs for the tests are reachable.
+
+    VMs are tested one at a time by default. With a concurrency above 1 several VMs are tested at once, which measures
+    the aggregate egress of the region rather than the bandwidth each VM gets on its own.
+    """
+
+    concurrency: int
+    duration: int
+    parallel: int
+
+    def __init__(self, concurrency: int = 1, duration: int = 10, parallel: int = 4):
+        """
+        Initialise an instance of the BandwidthTester class.
+        :param concurrency: The maximum number of VMs to be tested at once.
+        :param duration: The number of seconds each iperf3 test sends for.
+        :param parallel: The number of parallel streams in each TCP test.
+        """
+        self.concurrency = concurrency
+        self.duration = duration
+        self.parallel = parallel
+
+    def test(
+        self,
+        vm_id: int,
+        public_ip: str,
+        ports: Optional[Dict[Tuple[str, int], Tuple[str, Optional[float]]]] = None,
+    ) -> BandwidthResult:
+        """
+        Check the VM's service ports are open, then measure TCP throughput and UDP jitter and loss with iperf3.
+        :param vm_id: The ID of the VM.
+        :param public_ip: The IP address of the VM.
+        :param ports: The results of scanning `SERVICE_PORTS` on the VM, if it has already been scanned.
+        :return: The results of the tests.
+        """
+        result = self._test_tcp(vm_id, public_ip, ports)
+        self._test_udp(result)
+        return result
+
+    def _test_tcp(
+        self,
+        vm_id: int,
+        public_ip: str,
+        ports: Optional[Dict[Tuple[str, int], Tuple[str, Optional[float]]]] = None,
+    ) -> BandwidthResult:
+        result = BandwidthResult(vm_id, public_ip)
+        result.ports = ports if ports is not None else scan_many({public_ip: SERVICE_PORTS})[public_ip]
+        closed = [f'{protocol}/{port}' for (protocol, port), (status, _) in result.ports.items() if status != OPEN]
+        if closed:
+            result.error = f'Ports not open: {", ".join(closed)}'
+
+        result.tcp_started = time.time()
+        result.tcp = run_iperf(public_ip, self.duration, self.parallel)
+        result.tcp_finished = time.time()
+        return result
+
+    def _test_udp(self, result: BandwidthResult):
+        result.udp = run_iperf(result.public_ip, self.duration, parallel=1, udp=True)
+        for test in (result.tcp, result.udp):
+            if 'error' in test and not result.error:
+                result.error = f'Failure stressing traffic: {test["error"]}'
+
+    def test_all(
+        self,
+        targets: Dict[int, str],
+        ports: Optional[Dict[str, Dict[Tuple[str, int], Tuple[str, Optional[float]]]]] = None,
+    ) -> Tuple[List[BandwidthResult], Optional[float]]:
+        """
+        Test many VMs, up to `concurrency` at once. Every VM's TCP test is run before any UDP test, so that UDP tests do
+        not compete with, or pad out, the TCP tests the aggregate throughput is measured over.
+        :param targets: The public IP address of each VM to be tested, by VM ID.
+        :param ports: The results of scanning `SERVICE_PORTS`, by IP address. All VMs are scanned in one pass if None.
+        :return: The results for each VM in the order they were given, and the aggregate TCP throughput received by
+                 all the VMs together in bits per second, over the time any of their TCP tests were running.
+        """
+        if ports is None:
+            ports = scan_many({ip: SERVICE_PORTS for ip in targets.values()})
+        results: List[BandwidthResult] = run_concurrently(
+            [lambda vm_id=vm_id, ip=ip: self._test_tcp(vm_id, ip, ports.get(ip)) for vm_id, ip in targets.items()],
+            self.concurrency,
+        )
+        run_concurrently([lambda result=result: self._test_udp(result) for result in results], self.concurrency)
+        tested = [result for result in results if result.tcp.get('received_bytes')]
+        if not tested:
+            return results, None
+        # Only the time TCP tests were running counts, not any gaps between them
+        window = 0.0
+        end = None
+        for result in sorted(tested, key=lambda result: result.tcp_started):
+            start = result.tcp_started if end is None else max(result.tcp_started, end)
+            if result.tcp_finished > start:
+                window += result.tcp_finished - start
+                end = result.tcp_finished
+        return results, sum(result.tcp['received_bytes'] for result in tested) * 8 / window if window > 0 else None
+
+
+def round_robin(ids: List[int]) -> List[List[Tuple[int, int]]]:
+    """
+    Schedule a flow in each direction between every pair of VMs, in rounds where each VM takes part in at most one flow.
+    Uses the circle method, so N VMs need 2(N-1) rounds for N even, or 2N for N odd.
+    :param ids: The IDs of the VMs.
+    :return: The rounds, each a list of (client, server) pairs.
+    """
+    players: List[Optional[int]] = list(ids)
+    if len(players) % 2:
+        players.append(None)
+    rounds = []
+    for _ in range(len(players) - 1):
+        half = len(players) // 2
+        pairs = zip(players[:half], reversed(players[half:]))
+        rounds.append([(a, b) for a, b in pairs if a is not None and b is not None])
+        # Keep the first player fixed and rotate the rest
+        players = [players[0], players[-1]] + players[1:-1]
+    return rounds + [[(b, a) for a, b in pairs] for pairs in rounds]
+
+
+class EastWestTester:
+    """
+    Class measuring the bandwidth between VMs in a project over their private IP addresses.
+
+    Each flow runs an iperf3 client on one VM, over SSH, against the iperf3 server on another. Flows are run in rounds
+    where every VM takes part in at most one flow, so each measurement has the VMs' links to itself.
+    """
+
+    duration: int
+    parallel: int
+    password: str
+    username: str
+
+    def __init__(self, username: str, password: str, duration: int = 10, parallel: int = 4):
+        """
+        Initialise an instance of the EastWestTester class.
+        :param username: The username to log in to the VMs with.
+        :param password: The password to log in to the VMs with.
+        :param duration: The number of seconds each flow sends for.
+        :param parallel: The number of parallel streams in each flow.
+        """
+        self.username = username
+        self.password = password
+        self.duration = duration
+        self.parallel = parallel
+
+    def flow(self, client_ip: str, server_ip: str) -> Dict[str, Any]:
+        """
+        Run an iperf3 client on a VM against another VM.
+        :param client_ip: The public IP address of the VM the client runs on.
+        :param server_ip: The private IP address of the VM running the iperf3 server.
+        :return: The parsed results, see `parse_iperf`.
+        """
+        command = f'iperf3 --json -c {server_ip} -t {self.duration} -P {self.parallel}'
+        try:
+            with pool.client(client_ip, self.username, self.password) as client:
+                _, stdout, _ = client.exec_command(command)
+                response = read_channel(stdout.channel, timeout=self.duration + 60)
+        except (OSError, SSHException) as e:
+            pool.discard(client_ip, self.username)
+            return {'error': f'Could not connect to {client_ip}: {e}'}
+        if response.timed_out:
+            return {'error': f'Timed out running iperf3 on {client_ip}'}
+        return parse_iperf(response.output)
+
+    def run(self, vms: List[Dict[str, Any]]) -> Dict[Tuple[int, int], Dict[str, Any]]:
+        """
+        Measure the bandwidth in each direction between every pair of VMs.
+        :param vms: The VMs, each a dict with their 'id', 'public_ip' and 'private_ip'.
+        :return: The parsed results of each flow, by (client ID, server ID).
+        """
+        by_id = {vm['id']: vm for vm in vms}
+        flows: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        for pairs in round_robin(list(by_id)):
+            results = run_concurrently(
+                [
+                    lambda a=a, b=b: self.flow(by_id[a]['public_ip'], by_id[b]['private_ip'])
+                    for a, b in pairs
+                ],
+                len(pairs),
+            )
+            flows.update(zip(pairs, results))
+        return flows
+
+
+def east_west_matrix(vms: List[Dict[str, Any]], flows: Dict[Tuple[int, int], Dict[str, Any]]) -> List[str]:
+    """
+    Format the results of `EastWestTester.run` as matrices of throughput in Mbit/s, first between every pair of VMs and
+    then the median between every pair of servers. VMs are ordered by the server they are on.
+    :param vms: The VMs, each a dict with their 'id' and 'server_id'.
+    :param flows: The results of each flow, by (client ID, server ID).
+    :return: The lines of the matrices.
+    """
+    vms = sorted(vms, key=lambda vm: (str(vm['server_id']), vm['id']))
+
+    def mbps(flow: Optional[Dict[str, Any]]) -> Optional[float]:
+        if flow is None or flow.get('received_bps') is None:
+            return None
+        return flow['received_bps'] / 1e6
+
+    def table(labels: List[str], cell: Callable[[int, int], Optional[float]]) -> List[str]:
+        width = max([10] + [len(label) for label in labels])
+        lines = [f'{"from/to":>{width}} ' + ' '.join(f'{label:>{width}}' for label in labels)]
+        for i, label in enumerate(labels):
+            values = []
+            for j in range(len(labels)):
+                value = cell(i, j)
+                values.append(f'{"-" if value is None else f"{value:.1f}":>{width}}')
+            lines.append(f'{label:>{width}} ' + ' '.join(values))
+        return lines
+
+    lines = table(
+        [f'{vm["id"]}@{vm["server_id"]}' for vm in vms],
+        lambda i, j: mbps(flows.get((vms[i]['id'], vms[j]['id']))),
+    )
+
+    servers = list(dict.fromkeys(str(vm['server_id']) for vm in vms))
+    links: Dict[Tuple[str, str], List[float]] = {}
+    for (a, b), flow in flows.items():
+        value = mbps(flow)
+        if value is not None:
+            server_a = next(str(vm['server_id']) for vm in vms if vm['id'] == a)
+            server_b = next(str(vm['server_id']) for vm in vms if vm['id'] == b)
+            links.setdefault((server_a, server_b), []).append(value)
+
+    lines.append('')
+    lines.extend(table(
+        [f'server {server}' for server in servers],
+        lambda i, j: statistics.median(links[servers[i], servers[j]]) if (servers[i], servers[j]) in links else None,
+    ))
+    return lines
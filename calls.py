@@ -0,0 +1,138 @@
+# stdlib
+import random
+from typing import Any, Callable, Collection, Dict, Optional
+# lib
+import requests
+from requests import Response
+# local
+import clock
+from settings import VALIDATOR_API_BACKOFF, VALIDATOR_API_RETRIES
+
+# Responses worth sending a request again for: rate limited, or an error in or in front of the API
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class APIError(Exception):
+    """
+    Raised when an API call did not succeed, after retrying if the error was transient.
+    """
+
+    action: str
+    detail: str
+    status_code: Optional[int]
+
+    def __init__(self, action: str, status_code: Optional[int], detail: str):
+        """
+        Initialise an instance of the APIError class.
+        :param action: What the call was doing, e.g. 'read VM #12'.
+        :param status_code: The status code of the last response, or None if no response was received.
+        :param detail: The body of the last response, or the connection error.
+        """
+        super().__init__(action, status_code, detail)
+        self.action = action
+        self.status_code = status_code
+        self.detail = detail
+
+    def __str__(self) -> str:
+        status = 'no response' if self.status_code is None else f'HTTP {self.status_code}'
+        return f'Could not {self.action} ({status}): {self.detail}'
+
+
+class Failure:
+    """
+    Class recording an API call that failed for a resource, so that the run can carry on with the other resources.
+    """
+
+    action: str
+    at: float
+    detail: str
+    resource: str
+    status_code: Optional[int]
+
+    def __init__(self, resource: str, error: APIError):
+        """
+        Initialise an instance of the Failure class.
+        :param resource: The resource the call was for, e.g. 'VM #12'.
+        :param error: The error the call failed with.
+        """
+        self.resource = resource
+        self.action = error.action
+        self.status_code = error.status_code
+        self.detail = error.detail
+        self.at = clock.time()
+
+    def __str__(self) -> str:
+        status = 'no response' if self.status_code is None else f'HTTP {self.status_code}'
+        return f'{self.resource}: could not {self.action} ({status}): {self.detail}'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'resource': self.resource,
+            'action': self.action,
+            'status_code': self.status_code,
+            'detail': self.detail,
+            'at': self.at,
+        }
+
+
+def _detail(response: Response) -> str:
+    try:
+        return str(response.json())
+    except ValueError:
+        return response.content.decode(errors='replace')[:200]
+
+
+def backoff(attempt: int, base: float = VALIDATOR_API_BACKOFF, cap: float = 30.0) -> float:
+    """
+    The number of seconds to wait before retrying a call, with full jitter so that threads that failed together do not
+    retry together.
+    :param attempt: The number of the retry, from 0.
+    :param base: The longest wait before the first retry. Doubles with every retry after.
+    :param cap: The longest wait before any retry.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def call(
+    action: str,
+    method: Callable[..., Response],
+    ok: Collection[int] = (200,),
+    idempotent: bool = True,
+    retries: int = VALIDATOR_API_RETRIES,
+    **kwargs,
+) -> Response:
+    """
+    Make an API call, retrying it with backoff if it fails with a connection error or a transient error response.
+    :param action: What the call is doing, for error messages, e.g. 'read VM #12'.
+    :param method: The cloudcix API method, e.g. `api.IAAS.vm.read`.
+    :param ok: The status codes that mean the call succeeded.
+    :param idempotent: False if making the call twice could do something twice, e.g. create a project. Such calls are
+                       only retried when they could not have reached the API: the connection was not made, or the
+                       request was rate limited.
+    :param retries: The maximum number of times to retry the call.
+    :param kwargs: The arguments to the method.
+    :return: The response, with one of the `ok` status codes.
+    :raises APIError: If the call did not succeed.
+    """
+    attempt = 0
+    while True:
+        try:
+            response = method(**kwargs)
+        except requests.ConnectTimeout as e:
+            error = APIError(action, None, str(e))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = APIError(action, None, str(e))
+            if not idempotent:
+                raise error
+        else:
+            if response.status_code in ok:
+                return response
+            error = APIError(action, response.status_code, _detail(response))
+            transient = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUSES)
+            if not transient:
+                raise error
+
+        if attempt >= retries:
+            raise error
+        clock.sleep(backoff(attempt))
+        attempt += 1
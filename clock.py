@@ -0,0 +1,367 @@
+# stdlib
+import asyncio
+import collections
+import heapq
+import itertools
+import selectors
+import threading
+import time as _time
+from typing import Any, Deque, List, Optional
+
+
+class Clock:
+    """
+    Class telling the time and waiting for the validator's wait loops, in real time.
+
+    Everything that waits for a resource (polling the API, probing hosts, backing off and rate limiting calls) asks the
+    installed clock rather than the `time` module, so that a `VirtualClock` can be installed in its place. Threads, and
+    locks held while waiting, are this module's `Thread` and `Lock`, so that a `VirtualClock` knows when they wait too.
+    """
+
+    def time(self) -> float:
+        return _time.time()
+
+    def monotonic(self) -> float:
+        return _time.monotonic()
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            _time.sleep(seconds)
+
+    def event_loop_policy(self) -> Optional[asyncio.AbstractEventLoopPolicy]:
+        """
+        The policy creating event loops whose coroutines wait on this clock, or None for asyncio's own.
+        """
+        return None
+
+    def _acquire(self, lock: 'Lock'):
+        lock._lock.acquire()
+
+    def _release(self, lock: 'Lock'):
+        lock._lock.release()
+
+    def _start(self, thread: 'Thread'):
+        pass
+
+    def _begin(self, thread: 'Thread'):
+        pass
+
+    def _finish(self, thread: 'Thread'):
+        pass
+
+    def _join(self, thread: 'Thread', timeout: Optional[float]):
+        threading.Thread.join(thread, timeout)
+
+
+class _Waiter:
+    """
+    Class for a thread blocked on the virtual clock until a time, or until a lock or thread lets it go.
+    """
+
+    event: threading.Event
+    participant: bool
+    woken: bool
+
+    def __init__(self, participant: bool):
+        self.participant = participant
+        self.woken = False
+        self.event = threading.Event()
+
+
+class VirtualClock(Clock):
+    """
+    Class moving time forward only as far as the next waiter needs it to, so that hours of waiting take moments.
+
+    The threads taking part in the run are the thread that created the clock and every `Thread` started since. They
+    take turns: one runs until it blocks on the clock, by sleeping, waiting for a `Lock` or joining a `Thread` (and
+    coroutines by waiting on an event loop from `event_loop_policy`), and then the next one ready is let go, in the
+    order they became ready. Only once none is left running or ready does the clock jump to the earliest wake time and
+    make whoever was waiting for it ready. So time stands still for as long as any of them is working, or waiting on
+    anything else, and a run against a seeded simulator repeats exactly.
+
+    Meant for runs against the simulator, whose states and latencies follow the same clock; against a real API, time
+    would run ahead of the resources being waited on.
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        """
+        Initialise an instance of the VirtualClock class.
+        :param start: The time the clock starts at. Defaults to now.
+        """
+        self._now = _time.time() if start is None else start
+        # Sleeps by the time they end, as (wake time, order, waiter)
+        self._timers: List[tuple] = []
+        self._order = itertools.count()
+        # Participating threads that have been woken, in the order they get to run in
+        self._ready: Deque[_Waiter] = collections.deque()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._local.participant = True
+        # The number of participating threads running, which is never more than one
+        self._running = 1
+
+    def time(self) -> float:
+        return self._now
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def sleep(self, seconds: float):
+        if seconds <= 0:
+            return
+        with self._lock:
+            waiter = self._waiter()
+            self._schedule(seconds, waiter)
+            self._block(waiter)
+        waiter.event.wait()
+
+    def event_loop_policy(self) -> Optional[asyncio.AbstractEventLoopPolicy]:
+        return _EventLoopPolicy(self)
+
+    def _waiter(self) -> _Waiter:
+        return _Waiter(getattr(self._local, 'participant', False))
+
+    def _schedule(self, seconds: float, waiter: _Waiter):
+        heapq.heappush(self._timers, (self._now + seconds, next(self._order), waiter))
+
+    def _block(self, waiter: _Waiter):
+        """
+        Count a thread as blocked until its waiter is woken, letting the next one run if it was the one running.
+        Must be called holding the clock's lock, and followed by waiting on the waiter's event once it is released.
+        """
+        if waiter.participant:
+            self._running -= 1
+        self._dispatch()
+
+    def _wake(self, waiter: _Waiter):
+        """
+        Make a blocked thread ready to run. Threads not taking part in the run are let go at once.
+        """
+        if waiter.woken:
+            return
+        waiter.woken = True
+        if waiter.participant:
+            self._ready.append(waiter)
+        else:
+            waiter.event.set()
+
+    def _dispatch(self):
+        """
+        Let the next ready thread run once none is running, moving the clock forward when none is ready.
+        """
+        while self._running == 0:
+            if self._ready:
+                self._running += 1
+                self._ready.popleft().event.set()
+                return
+            if not self._timers:
+                return
+            self._now = max(self._now, self._timers[0][0])
+            # Waiters let go of by a lock or thread before their time still have a timer, which then wakes nobody
+            while self._timers and self._timers[0][0] <= self._now:
+                self._wake(heapq.heappop(self._timers)[2])
+
+    def _acquire(self, lock: 'Lock'):
+        with self._lock:
+            if not lock._held:
+                lock._held = True
+                return
+            waiter = self._waiter()
+            lock._waiting.append(waiter)
+            self._block(waiter)
+        # The lock is handed over to the waiter by `_release`, before it is woken
+        waiter.event.wait()
+
+    def _release(self, lock: 'Lock'):
+        with self._lock:
+            if lock._waiting:
+                self._wake(lock._waiting.popleft())
+            else:
+                lock._held = False
+
+    def _start(self, thread: 'Thread'):
+        # The thread waits for its turn before running anything, see `Thread.run`
+        with self._lock:
+            thread._turn = _Waiter(True)
+            self._wake(thread._turn)
+
+    def _begin(self, thread: 'Thread'):
+        self._local.participant = True
+        thread._turn.event.wait()  # type: ignore
+
+    def _finish(self, thread: 'Thread'):
+        with self._lock:
+            thread._finished = True
+            for waiter in thread._joining:
+                self._wake(waiter)
+            self._running -= 1
+            self._dispatch()
+
+    def _join(self, thread: 'Thread', timeout: Optional[float]):
+        with self._lock:
+            waiter = None
+            if not thread._finished:
+                waiter = self._waiter()
+                thread._joining.append(waiter)
+                if timeout is not None:
+                    self._schedule(max(0.0, timeout), waiter)
+                self._block(waiter)
+        if waiter is not None:
+            waiter.event.wait()
+            with self._lock:
+                thread._joining.remove(waiter)
+                if not thread._finished:
+                    return
+        # The thread is done with the clock, so this only waits for it to exit
+        threading.Thread.join(thread)
+
+
+class _Selector(selectors.DefaultSelector):  # type: ignore
+    """
+    Class for the selector of an event loop on the virtual clock, which waits on the clock for the loop's next timer
+    when none of the loop's sockets are ready.
+    """
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout: Optional[float] = None) -> List[Any]:
+        ready = super().select(0)
+        if ready or timeout == 0:
+            return ready
+        if timeout is None:
+            # Nothing is scheduled, so only the sockets can wake the loop
+            return super().select(None)
+        self.clock.sleep(timeout)
+        return super().select(0)
+
+
+class _EventLoop(asyncio.SelectorEventLoop):  # type: ignore
+    """
+    Class for an event loop on the virtual clock, whose sleeps and timeouts follow it.
+    """
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__(_Selector(clock))
+        self.clock = clock
+        # Timers are run once they are due to within the resolution, which must be coarser than the spacing of floats
+        # as large as the clock's time, or a timer due now would never be
+        self._clock_resolution = 1e-6
+
+    def time(self) -> float:
+        return self.clock.monotonic()
+
+
+class _EventLoopPolicy(asyncio.DefaultEventLoopPolicy):  # type: ignore
+    """
+    Class creating event loops on the virtual clock, e.g. for `asyncio.run`.
+    """
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self.clock = clock
+
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        return _EventLoop(self.clock)
+
+
+class Lock:
+    """
+    Class for a lock that may be held while waiting on the clock, e.g. around an API call.
+
+    Used like a `threading.Lock`, except that under a `VirtualClock` the threads waiting for it count as blocked on the
+    clock, so that the clock moves on for its holder.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._held = False
+        self._waiting: Deque[_Waiter] = collections.deque()
+
+    def acquire(self):
+        _clock._acquire(self)
+
+    def release(self):
+        _clock._release(self)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Thread(threading.Thread):
+    """
+    Class for a thread taking part in the run, which a `VirtualClock` waits for before moving forward.
+
+    Used like a `threading.Thread`, except that under a `VirtualClock` joining it counts as blocked on the clock, and
+    the timeout of a join is in the clock's time.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._clock = _clock
+        self._finished = False
+        self._joining: List[_Waiter] = []
+        self._turn: Optional[_Waiter] = None
+
+    def start(self):
+        self._clock = _clock
+        self._clock._start(self)
+        super().start()
+
+    def run(self):
+        self._clock._begin(self)
+        try:
+            super().run()
+        finally:
+            self._clock._finish(self)
+
+    def join(self, timeout: Optional[float] = None):
+        self._clock._join(self, timeout)
+
+
+# The clock used by every wait loop, see `install`
+_clock: Clock = Clock()
+
+
+def install(clock: Clock):
+    """
+    Use a different clock, e.g. a `VirtualClock`, for every wait from now on, including in event loops created from
+    now on.
+    """
+    global _clock
+    _clock = clock
+    asyncio.set_event_loop_policy(clock.event_loop_policy())
+
+
+def time() -> float:
+    """
+    The current time in seconds since the epoch, like `time.time()`.
+    """
+    return _clock.time()
+
+
+def monotonic() -> float:
+    """
+    The current time for measuring durations and deadlines, like `time.monotonic()`.
+    """
+    return _clock.monotonic()
+
+
+def sleep(seconds: float):
+    """
+    Wait for a number of seconds, like `time.sleep()`.
+    """
+    _clock.sleep(seconds)
+
+
+async def asleep(seconds: float):
+    """
+    Wait for a number of seconds in a coroutine, like `asyncio.sleep()`. Coroutines wait on the installed clock through
+    the event loop they run on, see `Clock.event_loop_policy`.
+    """
+    await asyncio.sleep(max(0.0, seconds))
@@ -6,6 +6,9 @@ import yaml
 from netaddr import IPAddress, IPNetwork, IPSet
 from sys import exit
 from typing import Any, Dict, List, Optional
+# local
+from calls import APIError, call
+from settings import VALIDATOR_SOURCE_IP
 # cloudcix
 os.environ['CLOUDCIX_SETTINGS_MODULE'] = 'settings'
 from cloudcix import api  # noqa: E402
@@ -67,13 +70,14 @@ class Data:
 
     def add_firewall_rule(self):
         """
-        Add a new firewall to the current data.
+        Add a new firewall rule to the current data, allowing traffic from VALIDATOR_SOURCE_IP if set.
         """
         subnet = random.choice(self.subnets)
         self.firewall_rules.append(
             {
                 'allow': True,
-                'source': '91.103.3.36',
+                # From the validator when its address is known, so that the rule changes what its probes get through
+                'source': VALIDATOR_SOURCE_IP or '91.103.3.36',
                 'destination': f'{subnet["address_range"]}',
                 'protocol': 'any',
                 'debug_logging': False,
@@ -90,15 +94,15 @@ class Data:
             'search[enabled]': True,
             'order': 'name',
         }
-        response = api.IAAS.image.list(token=token, params=params)
-        if response.status_code == 200:
-            self.images = response.json()['content']
-        # 500 error is known and is under investigation, we are ignoring the effect.
-        elif response.status_code == 500:
-            pass
-        else:
+        try:
+            response = call('list images', api.IAAS.image.list, token=token, params=params)
+        except APIError as e:
+            # 500 error is known and is under investigation, we are ignoring the effect.
+            if e.status_code == 500:
+                return
             print('\n\033[91m - There was an error while retrieving images for the region. \033[0m')
             exit(1)
+        self.images = response.json()['content']
 
     def choose_ip(self, subnet) -> str:
         """
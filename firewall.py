@@ -0,0 +1,153 @@
+# stdlib
+import asyncio
+import ipaddress
+from typing import Any, Dict, List, Optional, Tuple
+# local
+import clock
+from prober import FILTERED, Prober
+
+# A probe from the validator to a VM: (public IP, private IP, protocol, port). The port is None for ICMP
+Probe = Tuple[str, str, str, Optional[int]]
+
+
+def _from(rule: Dict[str, Any], source_ip: str) -> bool:
+    """
+    Check whether a firewall rule applies to traffic from the validator's address. If the address is not known, only
+    rules for any source do.
+    """
+    if rule['source'] in ('*', 'any'):
+        return True
+    return bool(source_ip) and ipaddress.ip_address(source_ip) in ipaddress.ip_network(rule['source'], False)
+
+
+def _matches(rule: Dict[str, Any], source_ip: str, private_ip: str, protocol: str, port: Optional[int]) -> bool:
+    """
+    Check whether a firewall rule applies to traffic from the validator to a VM.
+    """
+    if not _from(rule, source_ip):
+        return False
+    if ipaddress.ip_address(private_ip) not in ipaddress.ip_network(rule['destination'], False):
+        return False
+    if rule['protocol'] not in ('any', protocol):
+        return False
+    if rule.get('port') and port is not None:
+        first, _, last = str(rule['port']).partition('-')
+        return int(first) <= port <= int(last or first)
+    return True
+
+
+def expected(rules: List[Dict[str, Any]], source_ip: str, probe: Probe) -> bool:
+    """
+    Work out whether the rules allow a probe through. The first rule that applies decides, and traffic no rule applies
+    to is blocked.
+    :param rules: The firewall rules of the project, in order.
+    :param source_ip: The public IP address the validator's traffic comes from, or '' if it is not known.
+    :param probe: The probe.
+    :return: True if the probe is expected to get through.
+    """
+    _, private_ip, protocol, port = probe
+    for rule in rules:
+        if _matches(rule, source_ip, private_ip, protocol, port):
+            return bool(rule['allow'])
+    return False
+
+
+def plan(rules: List[Dict[str, Any]], vms: List[Dict[str, Any]], source_ip: str) -> Dict[Probe, bool]:
+    """
+    Turn firewall rules into the smallest set of probes that exercises each of them, with the outcome expected.
+
+    Each rule is probed once, against the first VM with a public IP that has an address in the rule's destination. A
+    rule for a protocol is probed with that protocol, on the rule's port if it has one. A rule for any protocol is
+    probed on the VM's service port, as Windows VMs do not answer ping, or with ping if the VM has no known service.
+    Rules whose source the validator's traffic does not come from cannot be probed, and are skipped.
+    :param rules: The firewall rules of the project, in order.
+    :param vms: The VMs of the project, each a dict with its 'ip_addresses' and 'service_port'.
+    :param source_ip: The public IP address the validator's traffic comes from, or '' if it is not known.
+    :return: Whether each probe is expected to get through.
+    """
+    probes: Dict[Probe, bool] = {}
+    for rule in rules:
+        if not _from(rule, source_ip):
+            continue
+        destination = ipaddress.ip_network(rule['destination'], False)
+        for vm in vms:
+            address = next(
+                (
+                    ip for ip in vm['ip_addresses']
+                    if ip['public_ip'] is not None and ipaddress.ip_address(ip['address']) in destination
+                ),
+                None,
+            )
+            if address is None:
+                continue
+            port = int(str(rule['port']).partition('-')[0]) if rule.get('port') else None
+            if rule['protocol'] in ('tcp', 'udp'):
+                probe = (address['public_ip']['address'], address['address'], rule['protocol'], port or 22)
+            elif rule['protocol'] == 'any' and vm['service_port'] is not None:
+                probe = (address['public_ip']['address'], address['address'], 'tcp', port or vm['service_port'])
+            else:
+                probe = (address['public_ip']['address'], address['address'], 'icmp', None)
+            probes[probe] = expected(rules, source_ip, probe)
+            break
+    return probes
+
+
+async def _send(prober: Prober, probe: Probe) -> bool:
+    """
+    Send a probe, returning whether it got through. A closed port still answered, so only filtered ports are blocked.
+    """
+    public_ip, _, protocol, port = probe
+    if protocol == 'icmp':
+        return await prober.probe(public_ip)
+    status, _ = await prober.scan_port(public_ip, protocol, port)  # type: ignore
+    return status != FILTERED
+
+
+async def verify(probes: Dict[Probe, bool]) -> Dict[Probe, bool]:
+    """
+    Send every probe at once and check each has the expected outcome.
+    :param probes: Whether each probe is expected to get through.
+    :return: Whether each probe had the expected outcome.
+    """
+    async with Prober(timeout=2.0) as prober:
+        results = await asyncio.gather(*(_send(prober, probe) for probe in probes))
+    return {probe: result == probes[probe] for probe, result in zip(probes, results)}
+
+
+async def time_to_effect(
+    probes: Dict[Probe, bool],
+    started: float,
+    timeout: float = 5 * 60,
+    interval: float = 1.0,
+) -> Dict[Probe, Optional[float]]:
+    """
+    Send probes repeatedly until each has its expected outcome, to measure how long a change of rules takes to apply.
+    :param probes: Whether each probe is expected to get through once the new rules apply. Should only contain probes
+                   whose outcome the change of rules affects.
+    :param started: The `clock.monotonic()` time the rules were changed at.
+    :param timeout: The number of seconds to keep probing for.
+    :param interval: The number of seconds between rounds of probes.
+    :return: The number of seconds after `started` each probe first had its expected outcome, or None if it did not.
+    """
+    effective: Dict[Probe, Optional[float]] = {probe: None for probe in probes}
+    deadline = started + timeout
+    async with Prober(timeout=interval) as prober:
+        while clock.monotonic() < deadline:
+            waiting = [probe for probe, at in effective.items() if at is None]
+            if not waiting:
+                break
+            results = await asyncio.gather(*(_send(prober, probe) for probe in waiting))
+            now = clock.monotonic()
+            for probe, result in zip(waiting, results):
+                if result == probes[probe]:
+                    effective[probe] = now - started
+            await clock.asleep(max(0.0, min(interval, deadline - clock.monotonic())))
+    return effective
+
+
+def describe(probe: Probe) -> str:
+    """
+    Describe a probe for printing, e.g. 'tcp/22 to 1.2.3.4 (192.168.123.2)'.
+    """
+    public_ip, private_ip, protocol, port = probe
+    return f'{protocol if port is None else f"{protocol}/{port}"} to {public_ip} ({private_ip})'
@@ -0,0 +1,133 @@
+# stdlib
+import getpass
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+# lib
+from paramiko import SSHException
+# local
+import settings
+from ssh import OutputSink, log_path, pool, run_sudo
+from utils import run_concurrently
+
+# Script run as root on each VM to install and start the services used by the bandwidth tests
+PREPARE_SCRIPT = '; '.join([
+    'set -e',
+    'export DEBIAN_FRONTEND=noninteractive',
+    'apt-get -y update',
+    'apt-get -q install -y nginx dnsmasq iperf3',
+    'pgrep -x nginx > /dev/null || nginx',
+    'pgrep -x dnsmasq > /dev/null || dnsmasq -p 5353',
+    'pgrep -x iperf3 > /dev/null || iperf3 -s -D',
+])
+
+
+def credentials() -> Tuple[str, str]:
+    """
+    Get the username and password used to log in to VMs.
+    Each is read from the environment variable of the same name as its setting if set, otherwise from the settings
+    module. If no password is set anywhere it is asked for once and kept for the rest of the run.
+    :return: The username and password.
+    """
+    username = os.environ.get('VALIDATOR_VM_USERNAME') or settings.VALIDATOR_VM_USERNAME
+    password = os.environ.get('VALIDATOR_VM_PASSWORD') or settings.VALIDATOR_VM_PASSWORD
+    while password == '':
+        password = getpass.getpass('[validator] Provide password for the VMs (exit quits): ')
+    if password != 'exit':
+        settings.VALIDATOR_VM_PASSWORD = password
+    return username, password
+
+
+class Preparation:
+    """
+    Class holding the outcome of preparing one VM.
+    """
+
+    duration: float
+    error: Optional[str]
+    public_ip: str
+    success: bool
+    vm_id: int
+
+    def __init__(self, vm_id: int, public_ip: str, success: bool, duration: float, error: Optional[str] = None):
+        self.vm_id = vm_id
+        self.public_ip = public_ip
+        self.success = success
+        self.duration = duration
+        self.error = error
+
+
+class FleetPreparer:
+    """
+    Class preparing many VMs for bandwidth tests at once.
+
+    Every VM is logged in to with the same credentials, and the package installs and service start-up are run as one
+    script per VM, so preparing a fleet takes about as long as preparing its slowest VM.
+    """
+
+    password: str
+    timeout: float
+    username: str
+    workers: int
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        workers: int = settings.VALIDATOR_WORKERS,
+        timeout: float = 15 * 60,
+    ):
+        """
+        Initialise an instance of the FleetPreparer class.
+        :param username: The username to log in to the VMs with.
+        :param password: The password to log in to the VMs and run sudo with.
+        :param workers: The maximum number of VMs to be prepared at once.
+        :param timeout: The number of seconds the script is given to finish on each VM.
+        """
+        self.username = username
+        self.password = password
+        self.workers = workers
+        self.timeout = timeout
+
+    def prepare(self, vm_id: int, public_ip: str) -> Preparation:
+        """
+        Install and start the services used by the bandwidth tests on a VM.
+        :param vm_id: The ID of the VM. Used for printing messages.
+        :param public_ip: The IP address to connect to the VM on.
+        :return: Whether the VM was prepared and how long it took.
+        """
+        started = time.monotonic()
+        sink = OutputSink(log_path(settings.VALIDATOR_SSH_LOG_DIR, public_ip), tail_size=4096)
+        try:
+            with pool.client(public_ip, self.username, self.password) as client:
+                response = run_sudo(client, PREPARE_SCRIPT, self.password, timeout=self.timeout, sink=sink)
+        except (OSError, SSHException) as e:
+            pool.discard(public_ip, self.username)
+            return Preparation(vm_id, public_ip, False, time.monotonic() - started, f'Could not connect: {e}')
+        finally:
+            sink.close()
+
+        duration = time.monotonic() - started
+        if response.timed_out:
+            return Preparation(vm_id, public_ip, False, duration, f'Timed out after {self.timeout:.0f}s')
+        if response.exit_status != 0:
+            error = response.error.strip().splitlines()
+            return Preparation(
+                vm_id,
+                public_ip,
+                False,
+                duration,
+                f'Exited with status {response.exit_status}: {error[-1] if error else "no error output"}',
+            )
+        return Preparation(vm_id, public_ip, True, duration)
+
+    def prepare_all(self, targets: Dict[int, str]) -> List[Preparation]:
+        """
+        Prepare many VMs at once.
+        :param targets: The public IP address of each VM to be prepared, by VM ID.
+        :return: The outcome for each VM, in the order they were given.
+        """
+        return run_concurrently(
+            [lambda vm_id=vm_id, ip=ip: self.prepare(vm_id, ip) for vm_id, ip in targets.items()],
+            self.workers,
+        )
@@ -0,0 +1,197 @@
+# stdlib
+import asyncio
+import json
+import statistics
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+# local
+import clock
+import state
+from poller import StatePoller
+from prober import Prober
+
+
+class BootLatencyRecorder:
+    """
+    Class measuring how long VMs take from reaching RUNNING in the API to actually answering on the network.
+
+    The recorder runs its own event loop on a background thread while the build is checked. As soon as a VM is handed
+    the RUNNING state, the VM's public IP is probed by ping and on its service port every `interval` seconds, without
+    waiting for earlier probes to time out, and the first answer to each is recorded.
+
+    The build checks only read the state of a VM every so often, up to a minute apart, so while any VM is BUILDING
+    the recorder reads their states itself, every `state_interval` seconds through a poller of its own. The time a VM
+    reached RUNNING is then known to within `state_interval` seconds plus the time taken to list the VMs, and the time
+    it answered to within `interval` seconds; both are given in the report.
+    """
+
+    interval: float
+    poller: StatePoller
+    results: List[Dict[str, Any]]
+    state_interval: float
+    timeout: float
+    vms: list
+
+    def __init__(
+        self,
+        vms: list,
+        project_id: Optional[int] = None,
+        interval: float = 0.2,
+        timeout: float = 10 * 60,
+        state_interval: float = 1.0,
+    ):
+        """
+        Initialise an instance of the BootLatencyRecorder class.
+        :param vms: The VMs to be measured.
+        :param project_id: The ID of the project the VMs belong to, used to narrow the listing of their states.
+        :param interval: The number of seconds between probes of each VM, once it is RUNNING.
+        :param timeout: The number of seconds after RUNNING to keep probing a VM for.
+        :param state_interval: The number of seconds between reads of the VMs' states while any of them is BUILDING.
+        """
+        self.vms = vms
+        self.interval = interval
+        self.timeout = timeout
+        self.state_interval = state_interval
+        self.poller = StatePoller(project_id=project_id, interval=state_interval)
+        self.results = []
+        self._stopping = threading.Event()
+        self._thread = clock.Thread(target=lambda: asyncio.run(self._run()), daemon=True)
+        self._watcher = clock.Thread(target=self._watch, daemon=True)
+
+    def start(self):
+        """
+        Start measuring in the background.
+        """
+        self._thread.start()
+        self._watcher.start()
+
+    def stop(self, wait: float = 0):
+        """
+        Stop measuring, giving VMs that are still being probed up to `wait` seconds to answer first.
+        :param wait: The number of seconds to wait for the measurements to finish by themselves.
+        """
+        self._thread.join(wait)
+        self._stopping.set()
+        self._thread.join()
+        self._watcher.join()
+
+    def _watch(self):
+        """
+        Read the states of the VMs every `state_interval` seconds while any of them is BUILDING, until every one that
+        is measured is RUNNING or the recorder is stopped.
+        """
+        waiting = [vm for vm in self.vms if not vm.phantom and vm.public_ip]
+        for vm in waiting:
+            self.poller.track(vm)
+        while not self._stopping.is_set():
+            waiting = [vm for vm in waiting if vm.state != state.RUNNING]
+            if not waiting:
+                return
+            building = [vm for vm in waiting if vm.state == state.BUILDING]
+            if building:
+                # Lists every tracked VM, handing each its state
+                self.poller.read(building[0])
+            clock.sleep(self.state_interval)
+
+    async def _run(self):
+        async with Prober() as prober:
+            results = await asyncio.gather(*(self._measure(prober, vm) for vm in self.vms))
+        self.results = [result for result in results if result is not None]
+
+    async def _measure(self, prober: Prober, vm: Any) -> Optional[Dict[str, Any]]:
+        """
+        Wait for a VM to be RUNNING and then measure how long it takes to answer ping and on its service port.
+        """
+        public_ip = vm.public_ip
+        if vm.phantom or not public_ip:
+            return None
+        while vm.state != state.RUNNING:
+            if self._stopping.is_set():
+                return None
+            await clock.asleep(0.1)
+
+        running_at = vm.state_changed
+        deadline = running_at + self.timeout
+        port = vm.service_port
+        probes = [self._first(lambda: prober.probe(public_ip), deadline)]
+        if port is not None:
+            probes.append(self._first(lambda: prober.probe_tcp(public_ip, port, banner=port == 22), deadline))
+        answers = await asyncio.gather(*probes)
+        icmp_at = answers[0]
+        tcp_at = answers[1] if port is not None else None
+
+        return {
+            'id': vm.obj['id'],
+            'image': vm.obj['image']['display_name'],
+            'server_id': vm.obj.get('server_id'),
+            'public_ip': public_ip,
+            'port': port,
+            'running_at': running_at,
+            'icmp': None if icmp_at is None else round(icmp_at - running_at, 3),
+            'tcp': None if tcp_at is None else round(tcp_at - running_at, 3),
+        }
+
+    async def _first(self, probe: Callable[[], Awaitable[bool]], deadline: float) -> Optional[float]:
+        """
+        Start a probe every `interval` seconds until one succeeds, the deadline passes or the recorder is stopped.
+        :return: The time the first successful probe answered, or None if none did.
+        """
+        found = asyncio.get_running_loop().create_future()
+
+        async def attempt():
+            if await probe() and not found.done():
+                found.set_result(clock.time())
+
+        tasks = set()
+        while clock.time() < deadline and not found.done() and not self._stopping.is_set():
+            task = asyncio.ensure_future(attempt())
+            tasks.add(task)
+            # Attempts that have answered are let go of, so that a long wait does not keep every one of them
+            task.add_done_callback(tasks.discard)
+            try:
+                await asyncio.wait_for(asyncio.shield(found), self.interval)
+            except asyncio.TimeoutError:
+                pass
+        pending = list(tasks)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        return found.result() if found.done() else None
+
+    def report(self) -> Dict[str, Any]:
+        """
+        The measurements for each VM, along with summaries grouped by image and by server.
+        """
+        return {
+            # How far off the times from RUNNING may be, in seconds, not counting the time taken to list the VMs
+            'resolution': {'running': self.state_interval, 'answer': self.interval},
+            'vms': self.results,
+            'images': self._summarise('image'),
+            'servers': self._summarise('server_id'),
+        }
+
+    def _summarise(self, field: str) -> Dict[str, Any]:
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for result in self.results:
+            groups.setdefault(str(result[field]), []).append(result)
+
+        summary = {}
+        for name, results in groups.items():
+            summary[name] = {'count': len(results)}
+            for probe in ('icmp', 'tcp'):
+                values = [result[probe] for result in results if result[probe] is not None]
+                summary[name][probe] = {
+                    'answered': len(values),
+                    'min': min(values) if values else None,
+                    'median': statistics.median(values) if values else None,
+                    'max': max(values) if values else None,
+                }
+        return summary
+
+    def write(self, path: str):
+        """
+        Write the report to a JSON file.
+        :param path: The path of the file to be written.
+        """
+        with open(path, 'w') as report:
+            json.dump(self.report(), report, indent=2)
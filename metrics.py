@@ -0,0 +1,237 @@
+# stdlib
+import json
+import math
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Latencies are counted in buckets whose upper bounds grow by this factor from `BUCKET_START` seconds, so percentiles
+# are estimated to within 10% however many calls are recorded
+BUCKET_GROWTH = 1.1
+BUCKET_START = 0.001
+
+# The phase calls made outside of any phase are recorded against
+NO_PHASE = 'other'
+
+
+class Histogram:
+    """
+    Class counting durations in buckets, to estimate percentiles of any number of them in constant memory.
+    """
+
+    buckets: Dict[int, int]
+    count: int
+    longest: float
+    total: float
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.longest = 0.0
+
+    def add(self, seconds: float):
+        bucket = 0 if seconds <= BUCKET_START else math.ceil(math.log(seconds / BUCKET_START, BUCKET_GROWTH))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.longest = max(self.longest, seconds)
+
+    def merge(self, other: 'Histogram'):
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.longest = max(self.longest, other.longest)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """
+        Estimate a percentile of the durations, as the upper bound of the bucket it falls in.
+        :param percent: The percentile, e.g. 99.
+        :return: The number of seconds, or None if no durations were counted.
+        """
+        if not self.count:
+            return None
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(BUCKET_START * BUCKET_GROWTH ** bucket, self.longest)
+        return self.longest
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.longest if self.count else None,
+            # The number of durations up to each bucket's upper bound, in seconds
+            'buckets': {
+                round(BUCKET_START * BUCKET_GROWTH ** bucket, 6): count
+                for bucket, count in sorted(self.buckets.items())
+            },
+        }
+
+
+class EndpointStats:
+    """
+    Class summarising the calls made to an endpoint: how many, what they were answered with, how much was sent and
+    received, and how long they took.
+    """
+
+    calls: int
+    latency: Histogram
+    received: int
+    sent: int
+    statuses: Dict[str, int]
+
+    def __init__(self):
+        self.calls = 0
+        self.statuses = {}
+        self.sent = 0
+        self.received = 0
+        self.latency = Histogram()
+
+    def add(self, status: Optional[int], sent: int, received: int, seconds: float):
+        """
+        Count a call.
+        :param status: The status code of the response, or None if no response was received.
+        :param sent: The number of bytes in the body of the request.
+        :param received: The number of bytes in the body of the response.
+        :param seconds: The number of seconds the call took.
+        """
+        name = 'error' if status is None else str(status)
+        self.calls += 1
+        self.statuses[name] = self.statuses.get(name, 0) + 1
+        self.sent += sent
+        self.received += received
+        self.latency.add(seconds)
+
+    def merge(self, other: 'EndpointStats'):
+        self.calls += other.calls
+        for status, count in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+        self.sent += other.sent
+        self.received += other.received
+        self.latency.merge(other.latency)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'statuses': dict(sorted(self.statuses.items())),
+            'sent_bytes': self.sent,
+            'received_bytes': self.received,
+            'latency': self.latency.to_dict(),
+        }
+
+
+def _size(count: float) -> str:
+    if count < 1000:
+        return f'{count:.0f}B'
+    for unit in ('KB', 'MB', 'GB'):
+        count /= 1000
+        if count < 1000:
+            break
+    return f'{count:.1f}{unit}'
+
+
+def _ms(seconds: Optional[float]) -> str:
+    return '-' if seconds is None else f'{seconds * 1000:.0f}ms'
+
+
+class CallRecorder:
+    """
+    Class recording every API call by the phase of the run it was made in (e.g. 'create') and the endpoint it was
+    made to (e.g. 'IAAS.vm.read'), to show where a run's API calls go and how quickly the API answers them.
+
+    Phases are entered with `phase`, either around the code making the calls or as a decorator of it. The phase is
+    shared by every thread, as the validator runs one phase at a time and spreads its work over threads within it.
+    """
+
+    current: str
+    stats: Dict[Tuple[str, str], EndpointStats]
+
+    def __init__(self):
+        self.current = NO_PHASE
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Record the calls made within the block, or the decorated function, against a phase.
+        :param name: The name of the phase, e.g. 'create'.
+        """
+        previous = self.current
+        self.current = name
+        try:
+            yield
+        finally:
+            self.current = previous
+
+    def record(self, endpoint: str, status: Optional[int], sent: int, received: int, seconds: float):
+        """
+        Record a call against the current phase. See `EndpointStats.add` for the parameters.
+        """
+        with self._lock:
+            stats = self.stats.setdefault((self.current, endpoint), EndpointStats())
+            stats.add(status, sent, received, seconds)
+
+    def _grouped(self, by: int) -> Dict[str, EndpointStats]:
+        with self._lock:
+            stats = list(self.stats.items())
+        grouped: Dict[str, EndpointStats] = {}
+        for key, endpoint_stats in stats:
+            grouped.setdefault(key[by], EndpointStats()).merge(endpoint_stats)
+        return grouped
+
+    def report(self):
+        """
+        Print the calls made to each endpoint, busiest first, and the calls made in each phase.
+        """
+        endpoints = self._grouped(1)
+        if not endpoints:
+            print(' - No API calls were made')
+            return
+        for endpoint, stats in sorted(endpoints.items(), key=lambda item: -item[1].calls):
+            self._print(endpoint, stats)
+        print('\nAPI calls by phase:')
+        # In the order the phases were run in
+        for phase, stats in self._grouped(0).items():
+            self._print(phase, stats)
+
+    @staticmethod
+    def _print(name: str, stats: EndpointStats):
+        statuses = ', '.join(f'{status}: {count}' for status, count in sorted(stats.statuses.items()))
+        latency = stats.latency
+        print(
+            f' - {name}: {stats.calls} calls ({statuses}), {_size(stats.sent)} sent, {_size(stats.received)} received, '
+            f'p50 {_ms(latency.percentile(50))}, p90 {_ms(latency.percentile(90))}, p99 {_ms(latency.percentile(99))}, '
+            f'longest {_ms(latency.longest)}',
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        The calls made to each endpoint, in total and in each phase, and the calls made in each phase.
+        """
+        with self._lock:
+            stats = list(self.stats.items())
+        phases: Dict[str, Dict[str, Any]] = {}
+        for (phase, endpoint), endpoint_stats in stats:
+            phases.setdefault(phase, {})[endpoint] = endpoint_stats.to_dict()
+        return {
+            'endpoints': {endpoint: value.to_dict() for endpoint, value in sorted(self._grouped(1).items())},
+            'phases': {phase: value.to_dict() for phase, value in self._grouped(0).items()},
+            'by_phase': phases,
+        }
+
+    def write(self, path: str):
+        """
+        Write the recorded calls to a JSON file.
+        :param path: The path of the file to be written.
+        """
+        with open(path, 'w') as report:
+            json.dump(self.to_dict(), report, indent=2)
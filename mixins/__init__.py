@@ -1,5 +1,7 @@
+from .failures import FailureMixin
 from .hardware import HardwareMixin
 
 __all__ = [
+    'FailureMixin',
     'HardwareMixin',
 ]
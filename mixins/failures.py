@@ -0,0 +1,24 @@
+# stdlib
+from typing import List
+# local
+from calls import APIError, Failure
+
+
+class FailureMixin:
+    """
+    Mixin for recording the API calls of a resource that failed, instead of exiting.
+    """
+
+    failures: List[Failure]
+
+    def record_failure(self, resource: str, error: APIError) -> Failure:
+        """
+        Record and print an API call that failed.
+        :param resource: The resource the call was for, e.g. 'VM #12'.
+        :param error: The error the call failed with.
+        :return: The failure recorded.
+        """
+        failure = Failure(resource, error)
+        self.failures.append(failure)
+        print(f'\r\033[91m - {failure}{" " * 20} \033[0m')
+        return failure
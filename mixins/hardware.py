@@ -1,12 +1,14 @@
 # stdlib
-import getpass
-import os
-import subprocess
-import time
-from collections import deque
-from typing import Deque
+from typing import Dict, Hashable, Optional, Tuple
 # lib
-from paramiko import AutoAddPolicy, Channel, SSHClient, SSHException
+from paramiko import SSHException
+# local
+from bandwidth import BandwidthTester
+from fleet import FleetPreparer, credentials
+from polling import PollingPolicy
+from prober import ping_many, reach_many
+from settings import VALIDATOR_SSH_LOG_DIR
+from ssh import OutputSink, log_path, pool, read_channel
 
 
 class HardwareMixin:
@@ -14,28 +16,33 @@ class HardwareMixin:
     Mixin for providing access to ping the server.
     """
 
-    def ping(self, type: str, id: str, ip: str, response: bool):
+    def ping(
+        self,
+        type: str,
+        id: str,
+        ip: str,
+        response: bool,
+        policy: Optional[PollingPolicy] = None,
+        key: Optional[Hashable] = None,
+    ):
         """
         Ping the hardware.
         :param type: The hardware type being pinged e.g 'VM'. Used for printing messages.
         :param id: The ID number of the hardware being pinged.
         :param ip: The IP address of the hardware being pinged.
         :param response: True if receiving a response from the server is the successful scenario.
+        :param policy: The polling policy to use. Defaults to `polling.PING`.
+        :param key: The key previous pings are recorded against in the policy, e.g. an image name. Defaults to `type`.
         """
 
-        timeout = time.time() + 10 * 60
-        loop_count = 0
-        while time.time() < timeout:
-            loop_count += 1
-            print(f'\r - Trying to ping {type} #{id} at IP {ip}{"." * loop_count}', end='')
-            ping = subprocess.Popen(['ping', '-c', '1', '-W', '1', str(ip)], stdout=subprocess.PIPE)
-            if not ping.wait() and response:
-                print(f'\r\033[92m - {type} #{id} is pingable at IP {ip}{" " * 100} \033[0m')
-                return
-            elif ping.wait() and not response:
-                print(f'\r\033[92m - {type} #{id} is not pingable at IP {ip} \033[0m')
-                return
-            time.sleep(10)
+        print(f'\r - Trying to ping {type} #{id} at IP {ip}...', end='')
+        reached = ping_many([ip], expect_up=response, policy=policy, keys={ip: (key or type, response)})[ip]
+        if reached and response:
+            print(f'\r\033[92m - {type} #{id} is pingable at IP {ip}{" " * 100} \033[0m')
+            return
+        elif reached:
+            print(f'\r\033[92m - {type} #{id} is not pingable at IP {ip} \033[0m')
+            return
 
         if response:
             print(f'\r\033[91m - {type} #{id} is not pingable at IP {ip}{" " * 100} \033[0m')
@@ -43,104 +50,103 @@ class HardwareMixin:
             print(f'\r\033[91m - {type} #{id} is still pingable at IP {ip} \033[0m')
         exit(1)
 
+    def reach(
+        self,
+        type: str,
+        id: str,
+        ip: str,
+        port: int,
+        policy: Optional[PollingPolicy] = None,
+        key: Optional[Hashable] = None,
+    ) -> Optional[float]:
+        """
+        Ping the hardware and try to connect to its service port at the same time. The hardware is up if either answers.
+        :param type: The hardware type being probed e.g 'VM'. Used for printing messages.
+        :param id: The ID number of the hardware being probed.
+        :param ip: The IP address of the hardware being probed.
+        :param port: The service port to connect to, e.g. 22 for SSH.
+        :param policy: The polling policy to use for ping. Defaults to `polling.PING`.
+        :param key: The key previous pings are recorded against in the policy, e.g. an image name. Defaults to `type`.
+        :return: The number of seconds the service took to accept a connection, or None if it did not.
+        """
+
+        print(f'\r - Trying to reach {type} #{id} at IP {ip} by ping and port {port}...', end='')
+        pinged, service_time = reach_many({ip: port}, policy=policy, keys={ip: (key or type, True)})[ip]
+        if pinged:
+            print(f'\r\033[92m - {type} #{id} is pingable at IP {ip}{" " * 100} \033[0m')
+        if service_time is not None:
+            print(f'\r\033[92m - {type} #{id} accepted a connection on port {port} after {service_time:.2f}s \033[0m')
+        elif pinged:
+            print(f'\r\033[93m - {type} #{id} did not accept a connection on port {port} \033[0m')
+        else:
+            print(f'\r\033[91m - {type} #{id} is not reachable at IP {ip}{" " * 100} \033[0m')
+            exit(1)
+        return service_time
+
     def fetcher(self, data: dict):
         """
         This method is used to get the out put of a command from the unix based servers
-        :param data: dict contains detials like user name, server ip, password, command
+        :param data: dict contains detials like user name, server ip, password, command, and optionally a timeout and
+                     max_size in characters of the command's output kept, from the end of the output
         :return: result: string contains out put of the command from server
         """
         result = {}
-        client = SSHClient()
-        client.set_missing_host_key_policy(AutoAddPolicy())
+        sink = OutputSink(log_path(VALIDATOR_SSH_LOG_DIR, data['server_ip']), data.get('max_size', 64 * 1024))
         try:
-            client.connect(data['server_ip'], port=22, username=data['user_name'], password=data['password'])
-            # Run the command via the client
-            _, stdout, stderr = client.exec_command(data['command'])
-            # Block until command finishes
-            stdout.channel.recv_exit_status()
-            # Read the full response from both channels
-            output = self.get_full_response(stdout.channel)
-            error = self.get_full_response(stderr.channel)
-            if output:
-                result['output'] = output
-            if error:
-                result['error'] = error
-        except SSHException:
+            # Reuse the pooled connection to the server, the command runs on a new channel over it
+            with pool.client(data['server_ip'], data['user_name'], data['password']) as client:
+                # Run the command via the client
+                _, stdout, _ = client.exec_command(data['command'])
+                # Read the full response from both streams until the command finishes, streaming it to the host's log
+                response = read_channel(stdout.channel, timeout=data.get('timeout'), sink=sink)
+            if response.output:
+                result['output'] = response.output
+            if response.error:
+                result['error'] = response.error
+        except (OSError, SSHException):
             print(f'Failed to connect the client server at {data["server_ip"]}')
+            pool.discard(data['server_ip'], data['user_name'])
         finally:
-            client.close()
+            sink.close()
         return result
 
-    def stress_test(self, public_ip: str, vm_id: int):
+    def stress_test(
+        self,
+        public_ip: str,
+        vm_id: int,
+        prepare: bool = True,
+        ports: Optional[Dict[Tuple[str, int], Tuple[str, Optional[float]]]] = None,
+    ) -> bool:
         """
-        Test concurrent connections to the VM
+        Test concurrent connections to the VM, recording the results in `self.bandwidth`.
+        :param prepare: False if the VM has already been prepared for the tests, e.g. by a `FleetPreparer`.
+        :param ports: The results of scanning the VM's service ports, if it has already been scanned.
+        :return: True if the VM was prepared and passed the tests.
         """
         print(' - Checking bandwidth of VM')
-        success = self.prepare_for_test(public_ip, vm_id)
-        if not success:
+        if prepare and not self.prepare_for_test(public_ip, vm_id):
             print(f'\r\033[91m - VM #{vm_id} Could not be set up for bandwidth tests.\033[0m')
-            return
+            return False
 
-        os.system('clear')
         print('Testing traffic')
-        proc = subprocess.run(f'nping -c 3 -p 22,5353,80 {public_ip}', shell=True)
-        if proc.returncode != 0:
-            print(f'Failure pinging open ports for VM at {public_ip}')
-        proc = subprocess.run(f'iperf3 -P 4 -c {public_ip}', shell=True)
-        if proc.returncode != 0:
-            print(f'Failure stressing traffic for VM at {public_ip}')
-
-    def prepare_for_test(self, public_ip, vm_id):
-        password = ''
-        while password == '':
-            password = getpass.getpass(f'[validator] Provide password for VM {vm_id} (exit quits): ')
-        if password == 'exit':
+        self.bandwidth = BandwidthTester().test(vm_id, public_ip, ports)
+        if self.bandwidth.error:
+            print(f'\r\033[91m - {self.bandwidth} \033[0m')
             return False
-        print('Password set')
-
-        cmds = [
-            f"echo '{password}' | sudo -S apt-get -y update",
-            f"echo '{password}' | sudo -S apt-get -q install -y nginx dnsmasq iperf3",
-            f"echo '{password}' | sudo -S nginx",
-            f"echo '{password}' | sudo -S dnsmasq -p 5353",
-            f"echo '{password}' | sudo -S iperf3 -s -D",
-        ]
+        print(f'\r\033[92m - {self.bandwidth} \033[0m')
+        return True
 
-        # Get an ssh session to the VM
-        success = True
-        client = SSHClient()
-        client.set_missing_host_key_policy(AutoAddPolicy())
-        try:
-            print(f'Connecting to host {public_ip}')
-            client.connect(public_ip, username='administrator', password=password)
-
-            for cmd in cmds:
-                print(cmd)
-                _, stdout, stderr = client.exec_command(cmd)
-                # Block until command finishes
-                stdout.channel.recv_exit_status()
-                # Read any errors
-                error = self.get_full_response(stderr.channel, wait_time=1)
-                if error:
-                    print(error)
-        except SSHException:
-            print('Failed to set up VM for bandwidth tests')
-            success = False
-        finally:
-            client.close()
-        return success
-
-    @staticmethod
-    def get_full_response(channel: Channel, read_size: int = 1476) -> str:
+    def prepare_for_test(self, public_ip: str, vm_id: int) -> bool:
         """
-        Get the full response from the specified paramiko channel, waiting a given number of seconds before trying to
-        read from it each time.
-        :param channel: The channel to be read from
-        :param read_size: How many bytes to be read from the channel each time
-        :return: The full output from the channel, or as much as can be read given the parameters.
+        Install and start the services used by the bandwidth tests on the VM, using the credentials from `credentials`.
+        :return: True if the VM was prepared.
         """
-        fragments: Deque[str] = deque()
-        while not channel.exit_status_ready():
-            if channel.recv_ready():
-                fragments.append(channel.recv(read_size).decode())
-        return ''.join(fragments)
+        username, password = credentials()
+        if password == 'exit':
+            return False
+
+        print(f'Connecting to host {public_ip}')
+        preparation = FleetPreparer(username, password).prepare(vm_id, public_ip)
+        if not preparation.success:
+            print(f'Failed to set up VM for bandwidth tests: {preparation.error}')
+        return preparation.success
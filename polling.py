@@ -0,0 +1,105 @@
+# stdlib
+import random
+import statistics
+import threading
+from collections import deque
+from typing import Deque, Dict, Hashable, Optional, Tuple
+# local
+import state
+
+
+class PollingPolicy:
+    """
+    Class deciding how long to wait between reads of a resource that is moving between states.
+
+    Waits back off exponentially from a floor to a ceiling, with some jitter so that many resources being waited on at
+    once do not read in lockstep. Each state can have its own floor and ceiling. The policy also remembers how long
+    previous transitions took for each key (e.g. an image), and polls at the floor once a transition is expected so
+    that the end of a transition is seen soon after it happens.
+    """
+
+    ceiling: float
+    factor: float
+    floor: float
+    history: Dict[Hashable, Deque[float]]
+    jitter: float
+    states: Dict[int, Tuple[float, float]]
+
+    def __init__(
+        self,
+        floor: float,
+        ceiling: float,
+        factor: float = 1.5,
+        jitter: float = 0.1,
+        states: Optional[Dict[int, Tuple[float, float]]] = None,
+        history_size: int = 20,
+    ):
+        """
+        Initialise an instance of the PollingPolicy class.
+        :param floor: The shortest number of seconds to wait between reads.
+        :param ceiling: The longest number of seconds to wait between reads.
+        :param factor: The amount the wait is multiplied by after each read.
+        :param jitter: The fraction by which each wait is randomly lengthened or shortened.
+        :param states: The floor and ceiling to use instead of the defaults while a resource is in a given state.
+        :param history_size: The number of previous transition durations remembered for each key.
+        """
+        self.floor = floor
+        self.ceiling = ceiling
+        self.factor = factor
+        self.jitter = jitter
+        self.states = states or {}
+        self.history = {}
+        self._history_size = history_size
+        self._lock = threading.Lock()
+
+    def expected(self, key: Optional[Hashable]) -> Optional[float]:
+        """
+        The expected number of seconds a transition takes for the given key, based on previous transitions.
+        :param key: The key the transitions were recorded against, e.g. an image name.
+        :return: The median of the recorded durations, or None if none were recorded.
+        """
+        with self._lock:
+            durations = list(self.history.get(key, ()))
+        if not durations:
+            return None
+        return statistics.median(durations)
+
+    def record(self, key: Optional[Hashable], duration: float):
+        """
+        Remember how long a transition took.
+        :param key: The key to record the transition against, e.g. an image name.
+        :param duration: The number of seconds the transition took.
+        """
+        with self._lock:
+            self.history.setdefault(key, deque(maxlen=self._history_size)).append(duration)
+
+    def interval(self, status: Optional[int], attempt: int, elapsed: float, key: Optional[Hashable] = None) -> float:
+        """
+        Calculate how long to wait before the next read.
+        :param status: The state the resource was in at the latest read.
+        :param attempt: The number of reads made so far, starting at 0.
+        :param elapsed: The number of seconds since the transition started.
+        :param key: The key previous transitions were recorded against, e.g. an image name.
+        :return: The number of seconds to wait.
+        """
+        floor, ceiling = self.states.get(status, (self.floor, self.ceiling))  # type: ignore
+        delay = min(ceiling, floor * self.factor ** attempt)
+
+        # Do not sleep past the point the transition is expected to end, and poll quickly around that point
+        expected = self.expected(key)
+        if expected is not None and elapsed < 2 * expected:
+            remaining = expected - elapsed
+            delay = min(delay, max(floor, remaining))
+
+        delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return min(ceiling, max(floor, delay))
+
+
+# Default policies for each kind of wait, shared so that transition history builds up over a run
+BUILD = PollingPolicy(floor=10, ceiling=60, states={state.REQUESTED: (10, 60), state.BUILDING: (5, 60)})
+UPDATE = PollingPolicy(floor=5, ceiling=60)
+STOP = PollingPolicy(floor=1, ceiling=5)
+START = PollingPolicy(floor=1, ceiling=5)
+DELETE = PollingPolicy(floor=10, ceiling=60)
+PING = PollingPolicy(floor=1, ceiling=10)
+ROUTER = PollingPolicy(floor=5, ceiling=30)
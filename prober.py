@@ -0,0 +1,493 @@
+# stdlib
+import asyncio
+import itertools
+import os
+import socket
+import struct
+import time
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+# local
+import clock
+import polling
+from polling import PollingPolicy
+from settings import VALIDATOR_PROBE_CONCURRENCY
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+# States of a scanned port
+OPEN = 'open'
+CLOSED = 'closed'
+FILTERED = 'filtered'
+
+# Payloads sent to UDP ports that only answer valid requests. Other ports are sent a single null byte, as asyncio does
+# not send empty datagrams
+DNS_QUERY = b'\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00\x02\x00\x01'
+UDP_PAYLOADS = {53: DNS_QUERY, 5353: DNS_QUERY}
+
+# The identifiers of the echo requests sent by each Prober. Every raw ICMP socket receives every echo reply, so each
+# Prober in the process, e.g. in each thread of `run_concurrently`, needs its own to tell its replies from the others'
+_idents = itertools.count(os.getpid())
+
+# When set, answers every probe instead of the network, e.g. for hosts that only exist in the simulator. Called with the
+# IP address, protocol ('icmp', 'tcp' or 'udp') and port (None for ICMP) probed, and returns whether the host answers
+responder: Optional[Callable[[str, str, Optional[int]], bool]] = None
+
+
+def checksum(data: bytes) -> int:
+    """
+    Calculate the internet checksum of the given data, as used in ICMP headers.
+    """
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+class Prober:
+    """
+    Class for pinging many hosts at once from a single asyncio event loop.
+
+    When the process is allowed to, echo requests are sent over one ICMP socket (an unprivileged datagram socket, or a
+    raw socket when running as root) and replies are matched back to the waiting probe. Otherwise each probe runs a
+    `ping` subprocess. Either way the number of probes in flight is bounded by `concurrency`.
+
+    Must be used as an async context manager so the socket is opened and closed on the running event loop.
+    """
+
+    concurrency: int
+    timeout: float
+
+    def __init__(self, concurrency: int = VALIDATOR_PROBE_CONCURRENCY, timeout: float = 1.0):
+        """
+        Initialise an instance of the Prober class.
+        :param concurrency: The maximum number of probes in flight at once.
+        :param timeout: The number of seconds to wait for a reply to each probe.
+        """
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._ident = next(_idents) & 0xFFFF
+        self._raw = False
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._sequence = itertools.count()
+        self._socket: Optional[socket.socket] = None
+        self._waiting: Dict[Tuple[str, int], asyncio.Future] = {}
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._socket = self._open_socket()
+        if self._socket is not None:
+            asyncio.get_running_loop().add_reader(self._socket.fileno(), self._receive)
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._socket is not None:
+            asyncio.get_running_loop().remove_reader(self._socket.fileno())
+            self._socket.close()
+            self._socket = None
+
+    def _open_socket(self) -> Optional[socket.socket]:
+        """
+        Open an ICMP socket, preferring an unprivileged datagram socket over a raw one.
+        :return: The socket, or None if the process is not allowed to open either kind.
+        """
+        for kind in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+            try:
+                sock = socket.socket(socket.AF_INET, kind, socket.IPPROTO_ICMP)
+            except OSError:
+                continue
+            sock.setblocking(False)
+            self._raw = kind == socket.SOCK_RAW
+            return sock
+        return None
+
+    def _receive(self):
+        """
+        Read every reply waiting on the ICMP socket and resolve the probes they answer.
+        """
+        while True:
+            try:
+                data, (address, _) = self._socket.recvfrom(2048)  # type: ignore
+            except OSError:
+                return
+            # Raw sockets receive the IP header as well, and every ICMP packet sent to the host, so replies are matched
+            # on the identifier too. Datagram sockets only receive the replies to their own requests, whose identifier
+            # the kernel replaces with its own
+            if self._raw:
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < 8:
+                continue
+            kind, _, _, ident, sequence = struct.unpack('!BBHHH', data[:8])
+            if kind != ICMP_ECHO_REPLY or (self._raw and ident != self._ident):
+                continue
+            future = self._waiting.get((address, sequence))
+            if future is not None and not future.done():
+                future.set_result(True)
+
+    async def probe(self, ip: str) -> bool:
+        """
+        Send a single echo request to a host.
+        :param ip: The IP address of the host.
+        :return: True if the host replied within the timeout.
+        """
+        if responder is not None:
+            return responder(ip, 'icmp', None)
+        async with self._semaphore:  # type: ignore
+            if self._socket is None or ':' in ip:
+                return await self._probe_subprocess(ip)
+            return await self._probe_socket(ip)
+
+    async def _probe_socket(self, ip: str) -> bool:
+        sequence = next(self._sequence) & 0xFFFF
+        payload = struct.pack('!d', time.time())
+        header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, self._ident, sequence)
+        packet = struct.pack(
+            '!BBHHH',
+            ICMP_ECHO_REQUEST,
+            0,
+            checksum(header + payload),
+            self._ident,
+            sequence,
+        ) + payload
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[(ip, sequence)] = future
+        try:
+            self._socket.sendto(packet, (ip, 0))  # type: ignore
+            return await asyncio.wait_for(future, self.timeout)
+        except (asyncio.TimeoutError, OSError):
+            return False
+        finally:
+            self._waiting.pop((ip, sequence), None)
+
+    async def _probe_subprocess(self, ip: str) -> bool:
+        process = await asyncio.create_subprocess_exec(
+            'ping', '-c', '1', '-W', str(max(1, round(self.timeout))), ip,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        return await process.wait() == 0
+
+    async def wait_for(
+        self,
+        ip: str,
+        expect_up: bool,
+        timeout: float,
+        policy: Optional[PollingPolicy] = None,
+        key: Optional[Hashable] = None,
+    ) -> bool:
+        """
+        Probe a host until it is in the expected state or the timeout passes.
+        :param ip: The IP address of the host.
+        :param expect_up: True if the host replying is the successful scenario.
+        :param timeout: The number of seconds to keep probing for.
+        :param policy: The polling policy deciding how long to wait between probes. Defaults to `polling.PING`.
+        :param key: The key the time taken is recorded against in the policy.
+        :return: True if the host reached the expected state in time.
+        """
+        policy = policy or polling.PING
+        started = clock.monotonic()
+        deadline = started + timeout
+        attempt = 0
+        while clock.monotonic() < deadline:
+            if await self.probe(ip) == expect_up:
+                policy.record(key, clock.monotonic() - started)
+                return True
+            interval = policy.interval(None, attempt, clock.monotonic() - started, key)
+            await clock.asleep(max(0.0, min(interval, deadline - clock.monotonic())))
+            attempt += 1
+        return False
+
+    async def ping_many(
+        self,
+        targets: Iterable[str],
+        expect_up: bool,
+        timeout: float = 10 * 60,
+        policy: Optional[PollingPolicy] = None,
+        keys: Optional[Dict[str, Hashable]] = None,
+    ) -> Dict[str, bool]:
+        """
+        Probe many hosts at once until each is in the expected state or the timeout passes.
+        :param targets: The IP addresses of the hosts.
+        :param expect_up: True if the hosts replying is the successful scenario.
+        :param timeout: The number of seconds to keep probing each host for.
+        :param policy: The polling policy deciding how long to wait between probes. Defaults to `polling.PING`.
+        :param keys: The key the time taken is recorded against in the policy, for each host.
+        :return: Whether each host reached the expected state in time.
+        """
+        targets = list(dict.fromkeys(targets))
+        keys = keys or {}
+        results = await asyncio.gather(*(
+            self.wait_for(ip, expect_up, timeout, policy, keys.get(ip, expect_up)) for ip in targets
+        ))
+        return dict(zip(targets, results))
+
+    async def probe_tcp(self, ip: str, port: int, banner: bool = False) -> bool:
+        """
+        Try to open a TCP connection to a port on a host.
+        :param ip: The IP address of the host.
+        :param port: The port to connect to.
+        :param banner: If True, the service must also send some data (e.g. the SSH version banner) within the timeout.
+        :return: True if the connection was accepted, and the banner received if requested, within the timeout.
+        """
+        if responder is not None:
+            return responder(ip, 'tcp', port)
+        async with self._semaphore:  # type: ignore
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), self.timeout)
+            except (asyncio.TimeoutError, OSError):
+                return False
+            success = True
+            if banner:
+                try:
+                    success = bool(await asyncio.wait_for(reader.read(256), self.timeout))
+                except (asyncio.TimeoutError, OSError):
+                    success = False
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+            return success
+
+    async def scan_port(self, ip: str, protocol: str, port: int, attempts: int = 2) -> Tuple[str, Optional[float]]:
+        """
+        Find out whether a port on a host is open, closed or filtered.
+
+        A TCP port is open if a connection is accepted, closed if it is refused and filtered if there is no answer. A
+        UDP port is open if the probe is answered, closed if an ICMP port unreachable comes back and filtered if there
+        is no answer, so a UDP service that ignores the probe looks filtered. A filtered port is probed `attempts`
+        times in case the probe or its answer was lost.
+        :param ip: The IP address of the host.
+        :param protocol: 'tcp' or 'udp'.
+        :param port: The port to probe.
+        :param attempts: The number of times to probe a port that does not answer.
+        :return: The state of the port, and the number of seconds the answer took if there was one.
+        """
+        if responder is not None:
+            return (OPEN, 0.0) if responder(ip, protocol, port) else (FILTERED, None)
+        scan = self._scan_udp if protocol == 'udp' else self._scan_tcp
+        result: Tuple[str, Optional[float]] = (FILTERED, None)
+        for _ in range(max(1, attempts)):
+            async with self._semaphore:  # type: ignore
+                result = await scan(ip, port)
+            if result[0] != FILTERED:
+                break
+        return result
+
+    async def _scan_tcp(self, ip: str, port: int) -> Tuple[str, Optional[float]]:
+        started = time.monotonic()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), self.timeout)
+        except ConnectionRefusedError:
+            return CLOSED, time.monotonic() - started
+        except (asyncio.TimeoutError, OSError):
+            return FILTERED, None
+        latency = time.monotonic() - started
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return OPEN, latency
+
+    async def _scan_udp(self, ip: str, port: int) -> Tuple[str, Optional[float]]:
+        loop = asyncio.get_running_loop()
+        answer = loop.create_future()
+
+        class Protocol(asyncio.DatagramProtocol):
+            def datagram_received(self, data, addr):
+                if not answer.done():
+                    answer.set_result(OPEN)
+
+            def error_received(self, exc):
+                if not answer.done():
+                    answer.set_result(CLOSED if isinstance(exc, ConnectionRefusedError) else FILTERED)
+
+        started = time.monotonic()
+        try:
+            transport, _ = await loop.create_datagram_endpoint(Protocol, remote_addr=(ip, port))
+        except OSError:
+            return FILTERED, None
+        try:
+            transport.sendto(UDP_PAYLOADS.get(port, b'\x00'))
+            status = await asyncio.wait_for(answer, self.timeout)
+        except asyncio.TimeoutError:
+            return FILTERED, None
+        finally:
+            transport.close()
+        return status, time.monotonic() - started if status != FILTERED else None
+
+    async def scan_many(
+        self,
+        targets: Dict[str, List[Tuple[str, int]]],
+        attempts: int = 2,
+    ) -> Dict[str, Dict[Tuple[str, int], Tuple[str, Optional[float]]]]:
+        """
+        Scan ports on many hosts at once.
+        :param targets: The (protocol, port) pairs to scan for each host IP address.
+        :param attempts: The number of times to probe a port that does not answer.
+        :return: The state of each port and how long its answer took, for each host, see `scan_port`.
+        """
+        probes = [(ip, port) for ip, ports in targets.items() for port in ports]
+        results = await asyncio.gather(*(self.scan_port(ip, *port, attempts=attempts) for ip, port in probes))
+        scanned: Dict[str, Dict[Tuple[str, int], Tuple[str, Optional[float]]]] = {ip: {} for ip in targets}
+        for (ip, port), result in zip(probes, results):
+            scanned[ip][port] = result
+        return scanned
+
+    async def wait_for_service(self, ip: str, port: int, timeout: float, interval: float = 0.25) -> Optional[float]:
+        """
+        Try to connect to a port on a host until a connection is accepted or the timeout passes.
+        :param ip: The IP address of the host.
+        :param port: The port to connect to.
+        :param timeout: The number of seconds to keep trying for.
+        :param interval: The number of seconds to wait between failed attempts.
+        :return: The number of seconds it took for the service to accept a connection, or None if it never did.
+        """
+        started = clock.monotonic()
+        deadline = started + timeout
+        while clock.monotonic() < deadline:
+            if await self.probe_tcp(ip, port):
+                return clock.monotonic() - started
+            await clock.asleep(max(0.0, min(interval, deadline - clock.monotonic())))
+        return None
+
+    async def reach(
+        self,
+        ip: str,
+        port: Optional[int],
+        timeout: float,
+        grace: float = 60,
+        policy: Optional[PollingPolicy] = None,
+        key: Optional[Hashable] = None,
+    ) -> Tuple[bool, Optional[float]]:
+        """
+        Ping a host and wait for its service port at the same time.
+        The host is reachable as soon as either answers. The other probe is then given a grace period to answer too, so
+        that the time to service is still measured for hosts that answer ping before their services are up.
+        :param ip: The IP address of the host.
+        :param port: The service port to connect to. If None, the host is only pinged.
+        :param timeout: The number of seconds to keep probing for.
+        :param grace: The number of seconds to keep probing for the other probe once one has answered.
+        :param policy: The polling policy deciding how long to wait between pings. Defaults to `polling.PING`.
+        :param key: The key the time taken to answer ping is recorded against in the policy.
+        :return: Whether the host answered ping, and the number of seconds the service took to accept a connection (or
+                 None if it did not).
+        """
+        ping = asyncio.ensure_future(self.wait_for(ip, True, timeout, policy, key))
+        if port is None:
+            return await ping, None
+        service = asyncio.ensure_future(self.wait_for_service(ip, port, timeout))
+
+        pending = {ping, service}
+        wait: Optional[float] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            answered = (ping in done and ping.result()) or (service in done and service.result() is not None)
+            if wait is None and answered:
+                wait = grace
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        pinged = ping.done() and not ping.cancelled() and ping.result()
+        service_time = service.result() if service.done() and not service.cancelled() else None
+        return pinged, service_time
+
+    async def reach_many(
+        self,
+        targets: Dict[str, Optional[int]],
+        timeout: float = 10 * 60,
+        grace: float = 60,
+        policy: Optional[PollingPolicy] = None,
+        keys: Optional[Dict[str, Hashable]] = None,
+    ) -> Dict[str, Tuple[bool, Optional[float]]]:
+        """
+        Ping many hosts and wait for their service ports, all at once.
+        :param targets: The service port to connect to for each host IP address, or None to only ping the host.
+        :param timeout: The number of seconds to keep probing each host for.
+        :param grace: The number of seconds to keep probing a host for the other probe once one has answered.
+        :param policy: The polling policy deciding how long to wait between pings. Defaults to `polling.PING`.
+        :param keys: The key the time taken to answer ping is recorded against in the policy, for each host.
+        :return: Whether each host answered ping, and the number of seconds its service took to accept a connection.
+        """
+        ips = list(targets)
+        keys = keys or {}
+        results = await asyncio.gather(*(
+            self.reach(ip, targets[ip], timeout, grace, policy, keys.get(ip, True)) for ip in ips
+        ))
+        return dict(zip(ips, results))
+
+
+def ping_many(
+    targets: Iterable[str],
+    expect_up: bool,
+    timeout: float = 10 * 60,
+    policy: Optional[PollingPolicy] = None,
+    keys: Optional[Dict[str, Hashable]] = None,
+) -> Dict[str, bool]:
+    """
+    Probe many hosts at once until each is in the expected state or the timeout passes, blocking until every host is
+    done. Runs its own event loop, so it must not be called from a coroutine; use `Prober.ping_many` there instead.
+    :param targets: The IP addresses of the hosts.
+    :param expect_up: True if the hosts replying is the successful scenario.
+    :param timeout: The number of seconds to keep probing each host for.
+    :param policy: The polling policy deciding how long to wait between probes. Defaults to `polling.PING`.
+    :param keys: The key the time taken is recorded against in the policy, for each host.
+    :return: Whether each host reached the expected state in time.
+    """
+    async def run() -> Dict[str, bool]:
+        async with Prober() as prober:
+            return await prober.ping_many(targets, expect_up, timeout, policy, keys)
+
+    return asyncio.run(run())
+
+
+def reach_many(
+    targets: Dict[str, Optional[int]],
+    timeout: float = 10 * 60,
+    grace: float = 60,
+    policy: Optional[PollingPolicy] = None,
+    keys: Optional[Dict[str, Hashable]] = None,
+) -> Dict[str, Tuple[bool, Optional[float]]]:
+    """
+    Ping many hosts and wait for their service ports at the same time, blocking until every host is done.
+    Used to check hosts are up when some of them may block ping, or may answer ping before their services are up.
+    :param targets: The service port to connect to for each host IP address, or None to only ping the host.
+    :param timeout: The number of seconds to keep probing each host for.
+    :param grace: The number of seconds to keep probing a host for the other probe once one has answered.
+    :param policy: The polling policy deciding how long to wait between pings. Defaults to `polling.PING`.
+    :param keys: The key the time taken to answer ping is recorded against in the policy, for each host.
+    :return: Whether each host answered ping, and the number of seconds its service took to accept a connection (or
+             None if it did not).
+    """
+    async def run() -> Dict[str, Tuple[bool, Optional[float]]]:
+        async with Prober() as prober:
+            return await prober.reach_many(targets, timeout, grace, policy, keys)
+
+    return asyncio.run(run())
+
+
+def scan_many(
+    targets: Dict[str, List[Tuple[str, int]]],
+    timeout: float = 2.0,
+    attempts: int = 2,
+) -> Dict[str, Dict[Tuple[str, int], Tuple[str, Optional[float]]]]:
+    """
+    Scan ports on many hosts at once, blocking until every port is scanned.
+    :param targets: The (protocol, port) pairs to scan for each host IP address, e.g. {'1.2.3.4': [('tcp', 22)]}.
+    :param timeout: The number of seconds to wait for each port to answer.
+    :param attempts: The number of times to probe a port that does not answer.
+    :return: The state of each port (`OPEN`, `CLOSED` or `FILTERED`) and the number of seconds its answer took, for
+             each host.
+    """
+    async def run() -> Dict[str, Dict[Tuple[str, int], Tuple[str, Optional[float]]]]:
+        async with Prober(timeout=timeout) as prober:
+            return await prober.scan_many(targets, attempts)
+
+    return asyncio.run(run())
@@ -1,12 +1,38 @@
 # stdlib
 import asyncio
+import json
 import os
-import time
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from requests import Response
 # local
+import clock
+import firewall
 import state
+from bandwidth import SERVICE_PORTS, BandwidthTester, EastWestTester, east_west_matrix, format_ports, round_robin
+from calls import APIError, Failure, call
 from dataclasses.data import Data
+from fleet import FleetPreparer, credentials
+from latency import BootLatencyRecorder
+from mixins import FailureMixin
+from poller import StatePoller
+from prober import Prober, ping_many, reach_many, scan_many
+from settings import (
+    VALIDATOR_BANDWIDTH_CONCURRENCY,
+    VALIDATOR_BANDWIDTH_REPORT,
+    VALIDATOR_BOOT_LATENCY_REPORT,
+    VALIDATOR_EAST_WEST,
+    VALIDATOR_RESTART_WAVE_SIZE,
+    VALIDATOR_SERVICE_PROBES,
+    VALIDATOR_SOURCE_IP,
+    VALIDATOR_STORAGE_BENCHMARK,
+    VALIDATOR_STORAGE_REPORT,
+    VALIDATOR_WORKERS,
+)
+from storage import StorageBenchmark, summarise
+from tokens import tokens
+from transport import transport
+from utils import run_concurrently
 from virtual_router import VirtualRouter
 from vm import VM
 # cloudcix
@@ -14,23 +40,24 @@ os.environ['CLOUDCIX_SETTINGS_MODULE'] = 'settings'
 from cloudcix import api  # noqa: E402
 
 
-class Project:
+class Project(FailureMixin):
     """
     Class representing a project on the cloudcix platform.
     """
 
     data: Data
+    failures: List[Failure]
+    poller: StatePoller
     project_id: int
     region: str
     subnets: list
-    token: str
     virtual_router: VirtualRouter
     vms: list
+    workers: int
 
     def __init__(
         self,
         region: str,
-        token: str,
         file: str = '',
         heavy: bool = False,
         cores: int = 0,
@@ -38,14 +65,16 @@ class Project:
         storage: int = 0,
         unix: bool = False,
         storage_type_id: int = 1,
+        workers: int = VALIDATOR_WORKERS,
     ):
         """
-        Initialise the project with a region and access token.
+        Initialise the project with a region.
         :param region: The region in which the project should be built.
-        :param token: The access token for the cloudcix api.
+        :param workers: The maximum number of resources to be checked at once. 1 checks them one after another.
         """
         self.region = region
-        self.token = token
+        self.workers = workers
+        self.failures = []
         timestamp = datetime.now().strftime('%d-%m-%Y--%H-%M-%S.%f')[:-3]
         if file:
             self.data = Data.validator_custom(
@@ -71,14 +100,33 @@ class Project:
                 token=self.token,
             )
 
+    @property
+    def token(self) -> str:
+        """
+        The access token for the cloudcix API, from the shared token manager.
+        """
+        return tokens.admin
+
+    @transport.phase('create')
     def create(self) -> bool:
         """
         Build the project in the cloud.
+        :return: False if the request to build the project failed.
         """
 
-        # Create a project with token and data.
-
-        response: Response = api.IAAS.cloud.create(token=self.token, data=vars(self.data))
+        # Create a project with token and data. Not retried once it may have reached the API, as that could build two.
+        try:
+            response: Response = call(
+                'create project',
+                api.IAAS.cloud.create,
+                ok=(201, 500),
+                idempotent=False,
+                token=self.token,
+                data=vars(self.data),
+            )
+        except APIError as e:
+            self.record_failure(f'Project {self.data.project["name"]}', e)
+            return False
 
         if response.status_code == 201:
             content = response.json()['content']
@@ -87,18 +135,14 @@ class Project:
             self.virtual_router = VirtualRouter(
                 obj=content['virtual_router'],
                 vpns=content['vpns'],
-                token=self.token,
                 project_id=self.project_id,
             )
-            self.vms = [VM(token=self.token, obj=vm) for vm in content['vms']]
+            self.poller = StatePoller(project_id=self.project_id)
+            self.vms = [VM(obj=vm, poller=self.poller) for vm in content['vms']]
 
         # 500 error is known and is under investigation, we are ignoring the effect.
-        elif response.status_code == 500:
-            print(f'\033[91m {response} \033[0m')
-
         else:
-            print(f'\033[91m {response.json()} \033[0m')
-            exit(1)
+            print(f'\033[91m {response} \033[0m')
 
         return True
 
@@ -112,12 +156,207 @@ class Project:
         print('└──────────────────────┘')
         print()
 
-        # Verify VMs build using API
-        failures = [vm.check_bandwidth() for vm in self.vms].count(False)
+        # Prepare every VM with a public IP at once, then test the prepared ones
+        username, password = credentials()
+        if password == 'exit':
+            return
+        targets = {vm.obj['id']: vm.public_ip for vm in self.vms if vm.public_ip}
+        print(f' - Preparing {len(targets)} VMs for bandwidth tests...')
+        preparations = FleetPreparer(username, password, workers=self.workers).prepare_all(targets)
+        prepared = set()
+        failures = 0
+        for preparation in preparations:
+            if preparation.success:
+                prepared.add(preparation.vm_id)
+                print(
+                    f'\r\033[92m - VM #{preparation.vm_id} at IP {preparation.public_ip} was prepared in '
+                    f'{preparation.duration:.1f}s \033[0m',
+                )
+            else:
+                failures += 1
+                print(
+                    f'\r\033[91m - VM #{preparation.vm_id} at IP {preparation.public_ip} could not be prepared after '
+                    f'{preparation.duration:.1f}s: {preparation.error} \033[0m',
+                )
+
+        # Check the services started for the tests are reachable on every prepared VM in one pass
+        scanned = self.scan_ports([vm for vm in self.vms if vm.obj['id'] in prepared])
+
+        aggregate = None
+        if VALIDATOR_BANDWIDTH_CONCURRENCY > 1:
+            # Test the prepared VMs together to measure the aggregate egress of the region
+            tester = BandwidthTester(concurrency=VALIDATOR_BANDWIDTH_CONCURRENCY)
+            print(f' - Testing traffic to {len(prepared)} VMs, {VALIDATOR_BANDWIDTH_CONCURRENCY} at a time...')
+            results, aggregate = tester.test_all(
+                {vm_id: targets[vm_id] for vm_id in targets if vm_id in prepared},
+                scanned,
+            )
+            by_id = {result.vm_id: result for result in results}
+            for vm in self.vms:
+                if vm.obj['id'] not in by_id:
+                    continue
+                vm.bandwidth = by_id[vm.obj['id']]
+                if vm.bandwidth.error:
+                    failures += 1
+                    print(f'\r\033[91m - {vm.bandwidth} \033[0m')
+                else:
+                    print(f'\r\033[92m - {vm.bandwidth} \033[0m')
+            if aggregate is not None:
+                print(f'\r - Aggregate throughput to all VMs: {aggregate / 1e6:.1f} Mbit/s')
+        else:
+            for vm in self.vms:
+                if vm.public_ip and vm.obj['id'] not in prepared:
+                    continue
+                if vm.check_bandwidth(prepared=True, ports=scanned.get(vm.public_ip)) is False:
+                    failures += 1
         if failures:
             print(f'{failures} VMs failed the bandwidth test')
+
+        east_west = {}
+        if VALIDATOR_EAST_WEST and len(prepared) > 1:
+            east_west = self._check_east_west([vm for vm in self.vms if vm.obj['id'] in prepared], username, password)
+
+        if VALIDATOR_BANDWIDTH_REPORT:
+            path = VALIDATOR_BANDWIDTH_REPORT.format(project_id=self.project_id)
+            with open(path, 'w') as report:
+                json.dump(
+                    {
+                        'concurrency': VALIDATOR_BANDWIDTH_CONCURRENCY,
+                        'aggregate_bps': aggregate,
+                        'vms': [vm.bandwidth.to_dict() for vm in self.vms if vm.bandwidth is not None],
+                        'east_west': [
+                            {'client': client, 'server': server, **flow} for (client, server), flow in east_west.items()
+                        ],
+                    },
+                    report,
+                    indent=2,
+                )
+            print(f'\r - Bandwidth report written to {path}')
         print()
 
+    def check_firewall(self, probes: Dict[firewall.Probe, bool]):
+        """
+        Send the probes planned from the project's firewall rules, all at once, and check each is allowed or blocked
+        as the rules say it should be.
+        :param probes: Whether each probe is expected to get through, from `firewall.plan`.
+        """
+        print(f'\r - Checking the firewall rules with {len(probes)} probes...')
+        results = asyncio.run(firewall.verify(probes))
+        for probe, correct in results.items():
+            outcome = 'allowed' if probes[probe] else 'blocked'
+            if correct:
+                print(f'\r\033[92m - {firewall.describe(probe)} is {outcome} as expected \033[0m')
+            else:
+                print(f'\r\033[91m - {firewall.describe(probe)} should be {outcome} but is not \033[0m')
+        if not all(results.values()):
+            exit(1)
+
+    def scan_ports(
+        self,
+        vms: Optional[List[VM]] = None,
+        ports: List[Tuple[str, int]] = SERVICE_PORTS,
+    ) -> Dict[str, Dict[Tuple[str, int], Tuple[str, Optional[float]]]]:
+        """
+        Scan ports on the public IPs of VMs, all in one pass, printing the state of each port.
+        :param vms: The VMs to be scanned. Defaults to every VM in the project.
+        :param ports: The (protocol, port) pairs to be scanned on each VM. Defaults to the bandwidth test services.
+        :return: The state of each port and how long its answer took, by IP address.
+        """
+        vms = [vm for vm in (self.vms if vms is None else vms) if vm.public_ip]
+        print(f' - Scanning {len(ports)} ports on {len(vms)} VMs...')
+        scanned = scan_many({vm.public_ip: ports for vm in vms})
+        for vm in vms:
+            print(f'\r - VM #{vm.obj["id"]} at IP {vm.public_ip}: {format_ports(scanned[vm.public_ip])}')
+        return scanned
+
+    def check_storage(self):
+        """
+        Benchmark the storages attached to the project's Linux VMs, on every VM at once, and print the results grouped
+        by storage type and server.
+        """
+        if not VALIDATOR_STORAGE_BENCHMARK:
+            return
+
+        print('┌──────────────────────┐')
+        print(f'│{"Checking Storage":^22}│')
+        print('└──────────────────────┘')
+        print()
+
+        username, password = credentials()
+        if password == 'exit':
+            return
+        vms = [
+            {
+                'id': vm.obj['id'],
+                'public_ip': vm.public_ip,
+                'server_id': vm.obj.get('server_id'),
+                'storage_type_id': vm.storage_type_id,
+                'storages': vm.obj['storages'],
+            }
+            for vm in self.vms
+            if vm.public_ip and vm.service_port == 22
+        ]
+        print(f' - Benchmarking the storages of {len(vms)} VMs...')
+        results = StorageBenchmark(username, password, workers=self.workers).run_all(vms)
+        for result in results:
+            name = f'VM #{result["vm_id"]} storage {result["storage"]} ({result["gb"]}GB)'
+            if 'error' in result:
+                print(f'\r\033[91m - {name}: {result["error"]} \033[0m')
+                continue
+            iops = result.get('iops')
+            bw = result.get('bw_bytes')
+            p99 = result.get('lat_p99_ms')
+            print(
+                f'\r\033[92m - {name} on {result["device"]}: {"-" if iops is None else f"{iops:.0f}"} IOPS, '
+                f'{"-" if bw is None else f"{bw / 1e6:.1f}"} MB/s, '
+                f'p99 latency {"-" if p99 is None else f"{p99:.2f}ms"} ({result["tool"]}) \033[0m',
+            )
+
+        summary = summarise(results)
+        for name, group in summary.items():
+            iops = group['iops']
+            p99 = group['lat_p99_ms']
+            bw = group['bw_bytes']
+            print(
+                f'\r - {name}: median {"-" if iops is None else f"{iops:.0f}"} IOPS, '
+                f'{"-" if bw is None else f"{bw / 1e6:.1f}"} MB/s, '
+                f'p99 latency {"-" if p99 is None else f"{p99:.2f}ms"} ({group["count"]} storages)',
+            )
+
+        if VALIDATOR_STORAGE_REPORT:
+            path = VALIDATOR_STORAGE_REPORT.format(project_id=self.project_id)
+            with open(path, 'w') as report:
+                json.dump({'storages': results, 'summary': summary}, report, indent=2)
+            print(f'\r - Storage report written to {path}')
+        print()
+
+    def _check_east_west(self, vms: List[VM], username: str, password: str) -> Dict[Tuple[int, int], dict]:
+        """
+        Measure the bandwidth between every pair of the given VMs over their private IP addresses and print it as a
+        matrix grouped by the server each VM is on.
+        :return: The parsed iperf3 results of each flow, by (client VM ID, server VM ID).
+        """
+        targets = [
+            {
+                'id': vm.obj['id'],
+                'public_ip': vm.public_ip,
+                'private_ip': vm.obj['ip_addresses'][0]['address'],
+                'server_id': vm.obj.get('server_id'),
+            }
+            for vm in vms
+        ]
+        rounds = len(round_robin([target['id'] for target in targets]))
+        print(f' - Testing traffic between {len(targets)} VMs over their private IPs in {rounds} rounds...')
+        flows = EastWestTester(username, password).run(targets)
+        for (client, server), flow in flows.items():
+            if 'error' in flow:
+                print(f'\r\033[91m - VM #{client} to VM #{server}: {flow["error"]} \033[0m')
+        print('\r - Throughput between VMs in Mbit/s, by VM ID @ server ID:')
+        for line in east_west_matrix(targets, flows):
+            print(f'   {line}')
+        return flows
+
+    @transport.phase('check_create')
     def check_create(self):
         """
         Verify that the project Virtual Router and VMs are successfully built.
@@ -128,28 +367,157 @@ class Project:
         print('└──────────────────────┘')
         print()
 
-        # Verify Virtual Router build using API
-        self.virtual_router.software_check_build()
+        recorder = None
+        if VALIDATOR_BOOT_LATENCY_REPORT:
+            recorder = BootLatencyRecorder(self.vms, project_id=self.project_id)
+            recorder.start()
 
-        # Verify VMs build using API
-        success = [vm.software_check_build() for vm in self.vms]
+        if self.workers > 1:
+            self._check_create_concurrently()
+        else:
+            # Verify Virtual Router build using API
+            self.virtual_router.software_check_build()
+
+            # Verify VMs build using API
+            success = [vm.software_check_build() for vm in self.vms]
+            if not all(success):
+                exit(1)
+            print()
+
+            # Verify the Virtual Router build using ping
+            self.virtual_router.hardware_check_build()
+
+            # Verify the VMs build using ping/rdp
+            for vm in self.vms:
+                vm.hardware_check_build()
+
+            print()
+
+        if recorder is not None:
+            self._report_boot_latency(recorder)
+
+    def _report_boot_latency(self, recorder: BootLatencyRecorder):
+        """
+        Stop measuring boot latency, print a summary per image and write the full report to a JSON file.
+        """
+        recorder.stop(wait=60)
+        report = recorder.report()
+        for image, summary in report['images'].items():
+            icmp = summary['icmp']['median']
+            tcp = summary['tcp']['median']
+            print(
+                f'\r - {image}: median time from RUNNING to ping {"-" if icmp is None else f"{icmp:.2f}s"}, '
+                f'to service {"-" if tcp is None else f"{tcp:.2f}s"} ({summary["count"]} VMs)',
+            )
+        path = VALIDATOR_BOOT_LATENCY_REPORT.format(project_id=self.project_id)
+        recorder.write(path)
+        print(f'\r - Boot latency report written to {path}')
+        print()
+
+    def _check_create_concurrently(self):
+        """
+        Verify the Virtual Router and VMs build, waiting on all of them at once.
+        Results are reported in the order of the project's VMs once every check has finished.
+        """
+
+        # Verify Virtual Router and VMs build using API, quietly, as their progress lines would overwrite each other
+        print(f'\r - Building Virtual Router #{self.virtual_router.obj["id"]} and {len(self.vms)} VMs...')
+        tasks = [lambda: self.virtual_router.software_check_build(quiet=True)]
+        tasks += [lambda vm=vm: vm.software_check_build(quiet=True) for vm in self.vms]
+        success = run_concurrently(tasks, self.workers)[1:]
+        print(f'\r - Virtual Router #{self.virtual_router.obj["id"]} was built{" " * 100}')
+        for vm, built in zip(self.vms, success):
+            image = vm.obj['image']['display_name']
+            if built:
+                print(f'\r - VM #{vm.obj["id"]} was built with image \'{image}\'!{" " * 100}')
+            else:
+                print(f'\r\033[91m - VM #{vm.obj["id"]} was not built with image \'{image}\' in time. \033[0m')
         if not all(success):
             exit(1)
         print()
 
-        # Verify the Virtual Router build using ping
-        self.virtual_router.hardware_check_build()
-
-        # Verify the VMs build using ping/rdp
-        for vm in self.vms:
-            vm.hardware_check_build()
+        # Verify the Virtual Router and VMs build using ping, probing all of them at once
+        self._hardware_check(self.vms, expect_up=True, virtual_router=True)
 
         print()
 
-    def restart(self):
+    def _hardware_check(self, vms: List[VM], expect_up: bool, virtual_router: bool = False):
+        """
+        Verify that the given VMs, and optionally the Virtual Router, respond or stop responding to ping, probing all
+        of them at once. When checking that VMs are up, their service ports are also probed and a VM is up if either
+        answers. Results are reported in the order of the VMs once every probe has finished.
+        :param vms: The VMs to be probed.
+        :param expect_up: True if receiving a response is the successful scenario.
+        :param virtual_router: True if the Virtual Router should be probed as well.
+        """
+        targets: Dict[str, str] = {}
+        ports: Dict[str, Optional[int]] = {}
+        keys: Dict[str, Tuple[str, bool]] = {}
+        if virtual_router:
+            ip = self.virtual_router.obj['ip_address']['address']
+            targets[ip] = f'VirtualRouter #{self.virtual_router.obj["id"]}'
+            ports[ip] = None
+            keys[ip] = ('VirtualRouter', expect_up)
+
+        skipped = False
+        for vm in vms:
+            image = vm.obj['image']['display_name']
+            if vm.phantom:
+                print(
+                    f'\r\033[91m - VM #{vm.obj["id"]} ({image}) is phantom, '
+                    f'sleeping for 1 minute.{" " * 100} \033[0m',
+                )
+                skipped = True
+            elif not vm.public_ip:
+                print(
+                    f'\r\033[91m - VM #{vm.obj["id"]} does not have a public ip, '
+                    f'sleeping for 1 minute.{" " * 100} \033[0m',
+                )
+                skipped = True
+            else:
+                targets[vm.public_ip] = f'VM #{vm.obj["id"]}'
+                ports[vm.public_ip] = vm.service_port if VALIDATOR_SERVICE_PROBES else None
+                keys[vm.public_ip] = (image, expect_up)
+
+        results: Dict[str, bool] = {}
+        if targets and expect_up:
+            print(f'\r - Trying to reach {len(targets)} resources...', end='')
+            reached = reach_many(ports, keys=keys)  # type: ignore
+            for ip, name in targets.items():
+                pinged, service_time = reached[ip]
+                results[ip] = pinged or service_time is not None
+                if pinged:
+                    print(f'\r\033[92m - {name} is pingable at IP {ip}{" " * 100} \033[0m')
+                else:
+                    print(f'\r\033[91m - {name} is not pingable at IP {ip}{" " * 100} \033[0m')
+                if service_time is not None:
+                    print(
+                        f'\r\033[92m - {name} accepted a connection on port {ports[ip]} '
+                        f'after {service_time:.2f}s \033[0m',
+                    )
+                elif ports[ip] is not None:
+                    print(f'\r\033[93m - {name} did not accept a connection on port {ports[ip]} \033[0m')
+        elif targets:
+            print(f'\r - Trying to ping {len(targets)} resources...', end='')
+            results = ping_many(targets.keys(), expect_up=expect_up, keys=keys)  # type: ignore
+            for ip, name in targets.items():
+                if results[ip]:
+                    print(f'\r\033[92m - {name} is not pingable at IP {ip}{" " * 100} \033[0m')
+                else:
+                    print(f'\r\033[91m - {name} is still pingable at IP {ip}{" " * 100} \033[0m')
+
+        # Phantom VMs and VMs without a public IP can't be probed, so give them time to settle instead
+        if skipped:
+            clock.sleep(60)
+        if not all(results.values()):
+            exit(1)
+
+    @transport.phase('restart')
+    def restart(self, wave_size: int = VALIDATOR_RESTART_WAVE_SIZE):
         """
         Restart the project in the cloud.
         Changes state to stopping (5) and then to starting (7).
+        :param wave_size: When checking concurrently, the number of VMs restarted together. 0 restarts every VM at once.
         """
 
         print('┌──────────────────────┐')
@@ -157,21 +525,63 @@ class Project:
         print('└──────────────────────┘')
         print()
 
+        if self.workers > 1:
+            self._restart_concurrently(wave_size)
+            return
+
         for vm in self.vms:
             print(f'\033[36m - Restarting VM #{vm.obj["id"]}\033[0m')
 
-            # Stop VM and verify state.
-            vm.stop()
+            # Stop VM and verify state. A VM whose request failed is left as it is and the next one restarted.
+            if not vm.stop():
+                print()
+                continue
             vm.software_check_stopped()
             vm.hardware_check_stopped()
 
             # Start VM and verify state
-            vm.start()
+            if not vm.start():
+                print()
+                continue
             vm.software_check_started()
             vm.hardware_check_started()
 
             print()
 
+    def _restart_concurrently(self, wave_size: int):
+        """
+        Restart the VMs in rolling waves, sending the stop requests for a wave as a batch and then waiting on the stop
+        and start transitions of every VM in the wave at once.
+        :param wave_size: The number of VMs restarted together. 0 restarts every VM at once.
+        """
+        wave_size = wave_size if wave_size > 0 else max(1, len(self.vms))
+        for i in range(0, len(self.vms), wave_size):
+            wave = self.vms[i:i + wave_size]
+            ids = ', '.join(f'#{vm.obj["id"]}' for vm in wave)
+            print(f'\033[36m - Restarting VMs {ids}\033[0m')
+
+            # Stop the VMs in the wave, leaving out any VM whose request failed
+            stopped = [vm for vm in wave if vm.stop()]
+
+            # Verify each VM stops and then start it and verify it starts, without waiting on the rest of the wave
+            run_concurrently([lambda vm=vm: self._cycle(vm) for vm in stopped], self.workers)
+
+            print()
+
+    @staticmethod
+    def _cycle(vm: VM):
+        """
+        Verify a stopped VM, then start it and verify it is running.
+        """
+        vm.software_check_stopped()
+        vm.hardware_check_stopped()
+
+        if not vm.start():
+            return
+        vm.software_check_started()
+        vm.hardware_check_started()
+
+    @transport.phase('update')
     def update(self):
         """
         Update the project in the cloud.
@@ -220,72 +630,116 @@ class Project:
 
         # Updating only virtual_router and test if VM restarts by the state from database
         print('\r  Updating the virtual_router only and testing if VM restarts')
+        rules = list(self.data.firewall_rules)
         self.data.add_firewall_rule()
-        update = api.IAAS.cloud.update(token=self.token, pk=self.project_id, data=vars(self.data))
-        if update.status_code == 200:
+        # Plan the probes checking the firewall rules, and find the ones whose outcome the new rule changes
+        targets = [{'ip_addresses': vm.obj['ip_addresses'], 'service_port': vm.service_port} for vm in self.vms]
+        probes = firewall.plan(self.data.firewall_rules, targets, VALIDATOR_SOURCE_IP)
+        changed = {
+            probe: outcome for probe, outcome in probes.items()
+            if firewall.expected(rules, VALIDATOR_SOURCE_IP, probe) != outcome
+        }
+        if not VALIDATOR_SOURCE_IP:
+            print('\r - Not timing the firewall rule change, as VALIDATOR_SOURCE_IP is not set')
+        elif not changed:
+            print('\r - Not timing the firewall rule change, as it changes the outcome of no probe')
+        try:
+            call('update project', api.IAAS.cloud.update, token=self.token, pk=self.project_id, data=vars(self.data))
+        except APIError as e:
+            self.record_failure(f'Project #{self.project_id}', e)
+            print()
+            return
+        updated = clock.monotonic()
 
-            vms = [VM(token=self.token, obj=vm.obj) for vm in self.vms]
-            # ping check VMs for 5min
-            # asyncio.run(self.main(vms))
+        vms = [VM(obj=vm.obj) for vm in self.vms]
 
-            # db state check
-            for vm in vms:
-                print(f'\r - Checking the state of VM # {vm.obj["id"]} from database')
-                vm.sofware_check_state()
-        else:
-            print(update.content)
-            print(update.json())
+        async def check() -> Tuple[bool, Dict[firewall.Probe, Optional[float]]]:
+            # Measure how long the new rule takes to apply while the VMs are checked
+            pinged, effective = await asyncio.gather(self.main(vms), firewall.time_to_effect(changed, updated))
+            return pinged, effective
+
+        # ping check VMs for 5min
+        pinged, effective = asyncio.run(check())
+        if not pinged:
             exit(1)
+        for probe, seconds in effective.items():
+            if seconds is None:
+                print(f'\r\033[91m - Firewall rule change did not apply to {firewall.describe(probe)} \033[0m')
+            else:
+                print(
+                    f'\r\033[92m - Firewall rule change applied to {firewall.describe(probe)} after '
+                    f'{seconds:.1f}s \033[0m',
+                )
+
+        # db state check
+        for vm in vms:
+            print(f'\r - Checking the state of VM # {vm.obj["id"]} from database')
+            checked = vm.sofware_check_state()
+            self.failures.extend(vm.failures)
+            if not checked:
+                # The VM may have restarted, so the update has not passed
+                print(f'\r\033[91m - Could not check that VM #{vm.obj["id"]} is still running after the update \033[0m')
+                print()
+                return
 
         print('\r  Checking the virtual_router has updated before proceeding')
         # Verify Virtual Router updated using API
         self.virtual_router.software_check_update()
+        self.check_firewall(probes)
 
         # Update the data and send request for update
         existing_vm_count = len(vms)
         self.data.add_vm()
         # Updating only virtual_router and test if VM restarts by the state from database
         print('\r  Adding VM to project')
-        update = api.IAAS.cloud.update(token=self.token, pk=self.project_id, data=vars(self.data))
-
-        params = {'project_id': self.project_id, 'exclude[id__in]': [vm.obj['id'] for vm in self.vms]}
-
-        response = api.IAAS.vm.list(token=self.token, params=params)
-        if response.status_code == 200:
-            vms = response.json()['content']
-        else:
-            print(response.status_code)
-            print(response.json())
-            exit()
-
-        self.vms.extend([VM(token=self.token, obj=vm) for vm in vms])
+        try:
+            # Not retried once it may have reached the API, as that could add two VMs
+            call(
+                'add a VM to project',
+                api.IAAS.cloud.update,
+                idempotent=False,
+                token=self.token,
+                pk=self.project_id,
+                data=vars(self.data),
+            )
+        except APIError as e:
+            self.record_failure(f'Project #{self.project_id}', e)
+            print()
+            return
 
-        if update.status_code == 200:
+        params = {'search[project_id]': self.project_id, 'exclude[id__in]': [vm.obj['id'] for vm in self.vms]}
+        try:
+            response = call('list the new VMs', api.IAAS.vm.list, token=self.token, params=params)
+        except APIError as e:
+            self.record_failure(f'Project #{self.project_id}', e)
+            print()
+            return
 
-            old_vms = self.vms[:existing_vm_count]
-            new_vms = self.vms[existing_vm_count:]
+        self.vms.extend([VM(obj=vm, poller=self.poller) for vm in response.json()['content']])
+        # The listing held by the poller predates the update request
+        self.poller.invalidate()
 
-            # Verify VMs were updated using api
-            for vm in old_vms:
-                vm.software_check_updating()
-            print()
+        old_vms = self.vms[:existing_vm_count]
+        new_vms = self.vms[existing_vm_count:]
 
-            # Verify VMs build using API
-            success = [vm.software_check_build() for vm in new_vms]
-            if not all(success):
-                exit(1)
-            print()
+        # Verify VMs were updated using api
+        for vm in old_vms:
+            vm.software_check_updating()
+        print()
 
-            # Verify the VMs build using ping/rdp
-            for vm in new_vms:
-                vm.hardware_check_build()
-        else:
-            print(update.status_code)
-            print(update.json())
+        # Verify VMs build using API
+        success = [vm.software_check_build() for vm in new_vms]
+        if not all(success):
             exit(1)
+        print()
+
+        # Verify the VMs build using ping/rdp
+        for vm in new_vms:
+            vm.hardware_check_build()
 
         print()
 
+    @transport.phase('delete')
     def delete(self):
         """
         Delete the project from the cloud.
@@ -298,28 +752,29 @@ class Project:
 
         # Delete project from cloud
         data = {'state': state.SCRUB}
-        response = api.IAAS.project.partial_update(token=self.token, pk=self.project_id, data=data)
-
-        # Server response is successful
-        if response.status_code == 200:
-
-            # Check if virtual_router, VMs and Project are deleted.
-            self.virtual_router.software_check_delete()
+        try:
+            call(
+                'delete project',
+                api.IAAS.project.partial_update,
+                token=self.token,
+                pk=self.project_id,
+                data=data,
+            )
+        except APIError as e:
+            self.record_failure(f'Project #{self.project_id}', e)
+            print()
+            return
 
-            for vm in self.vms:
-                vm.software_check_delete()
-                vm.hardware_check_delete()
+        # Check if virtual_router, VMs and Project are deleted.
+        self.virtual_router.software_check_delete()
 
-            self.check_delete()
+        for vm in self.vms:
+            vm.software_check_delete()
+            vm.hardware_check_delete()
 
-            print(f'\033[32m - Project #{self.project_id} was successfully deleted via the API.\033[0m')
+        self.check_delete()
 
-        elif response.status_code == 400 and 'errors' in response.json():
-            print(response.json())
-        else:
-            print(response.status_code)
-            print(response.json())
-            exit()
+        print(f'\033[32m - Project #{self.project_id} was successfully deleted via the API.\033[0m')
 
         print()
 
@@ -328,45 +783,90 @@ class Project:
         Check if project has been deleted.
         """
 
-        timeout = time.time() + 20 * 60
+        timeout = clock.time() + 20 * 60
         loop_count = 0
 
         # Read until response shows correct state
-        while time.time() < timeout:
+        while clock.time() < timeout:
             loop_count += 1
-            response = api.IAAS.project.read(token=self.token, pk=self.project_id)
-            if response.status_code == 200:
-                project = response.json()['content']
-            else:
-                print(response.status_code)
-                print(response.json())
-                exit()
+            try:
+                response = call(
+                    f'read Project #{self.project_id}',
+                    api.IAAS.project.read,
+                    token=self.token,
+                    pk=self.project_id,
+                )
+            except APIError as e:
+                self.record_failure(f'Project #{self.project_id}', e)
+                clock.sleep(60)
+                continue
+            project = response.json()['content']
             print(f'\r - Marking Project #{self.project_id} for deletion.{"." * loop_count}', end='')
             if project['shut_down']:
                 print(f'\r\033[32m - Successfully marked Project #{self.project_id} for deletion.{" " * 50}\033[0m')
                 break
-            time.sleep(60)
+            clock.sleep(60)
 
-        if time.time() > timeout:
+        if clock.time() > timeout:
             print(f'\r\033[91m - Project #{self.project_id} was unsuccessfully deleted.{" " * 100} \033[0m')
             exit(1)
 
-    def update_token(self, token: str):
+    def report_timelines(self):
         """
-        Method for updating tokens of project, vms and virtual_router.
-        Used for when Validator runs exceed 2 hours.
+        Print the timeline of states seen for the Virtual Router and every VM during each phase, with the time spent
+        in each state.
         """
 
-        self.token = token
-        self.virtual_router.update_token(token=token)
+        print('┌──────────────────────┐')
+        print(f'│{"Timelines":^22}│')
+        print('└──────────────────────┘')
+        print()
 
-        for vm in self.vms:
-            vm.update_token(token=token)
+        resources = [(f'Virtual Router #{self.virtual_router.obj["id"]}', self.virtual_router.timelines)]
+        resources.extend((f'VM #{vm.obj["id"]} ({vm.obj["image"]["display_name"]})', vm.timelines) for vm in self.vms)
+        for name, timelines in resources:
+            for phase, timeline in timelines.items():
+                print(f' - {name} {phase}: {timeline}')
+        print()
+
+    def all_failures(self) -> List[Failure]:
+        """
+        The API calls that failed for the project and every resource in it, in the order they failed.
+        """
+        failures = list(self.failures)
+        # The project has no resources if it failed to be created
+        resources = [getattr(self, 'poller', None), getattr(self, 'virtual_router', None), *getattr(self, 'vms', [])]
+        for resource in resources:
+            if resource is not None:
+                failures.extend(resource.failures)
+        return sorted(failures, key=lambda failure: failure.at)
+
+    def report_failures(self) -> int:
+        """
+        Print the API calls that failed for the project and every resource in it, even after being retried.
+        :return: The number of failed calls.
+        """
+        failures = self.all_failures()
+        if not failures:
+            return 0
+
+        print('┌──────────────────────┐')
+        print(f'│{"Failed API Calls":^22}│')
+        print('└──────────────────────┘')
+        print()
+
+        for failure in failures:
+            print(f'\033[91m - {failure} \033[0m')
+        print()
+        return len(failures)
 
     @staticmethod
-    async def main(vms):
+    async def main(vms) -> bool:
         """
         Runs all vms Ping check parallel.
+        :return: True if every VM replied to ping.
         """
         # ping check VMs for 5min
-        await asyncio.gather(*(vm.hardware_check_state() for vm in vms))
+        async with Prober() as prober:
+            results = await asyncio.gather(*(vm.hardware_check_state(prober) for vm in vms))
+        return all(results)
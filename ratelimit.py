@@ -0,0 +1,147 @@
+# stdlib
+import threading
+from typing import Dict, Optional
+# local
+import clock
+from settings import VALIDATOR_API_BURST, VALIDATOR_API_ENDPOINT_RATES, VALIDATOR_API_RATE
+
+
+class TokenBucket:
+    """
+    Class spacing out requests to a rate, while letting a burst of them through at once after a quiet spell.
+
+    Rather than keeping a count of tokens, the bucket keeps the time the next request would be sent at if requests were
+    sent at exactly the rate, and lets a request through up to `burst` intervals ahead of it. Requests reserve their
+    slot when they ask, so waiting requests are let through in the order they asked.
+    """
+
+    burst: int
+    rate: float
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Initialise an instance of the TokenBucket class.
+        :param rate: The number of requests let through per second, on average.
+        :param burst: The number of requests let through at once after a quiet spell.
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, at: float) -> float:
+        """
+        Reserve the earliest slot for a request at or after a given time.
+        :param at: The `clock.monotonic()` time the request could be sent at.
+        :return: The `clock.monotonic()` time the request may be sent at.
+        """
+        interval = 1 / self.rate
+        with self._lock:
+            ready = max(at, self._next - (self.burst - 1) * interval)
+            self._next = max(self._next, ready) + interval
+        return ready
+
+
+class DelayStats:
+    """
+    Class summarising how long the calls to an endpoint were held back for.
+    """
+
+    calls: int
+    held: int
+    longest: float
+    total: float
+
+    def __init__(self):
+        self.calls = 0
+        self.held = 0
+        self.total = 0.0
+        self.longest = 0.0
+
+    def add(self, delay: float):
+        """
+        Count a call.
+        :param delay: The number of seconds the call was held back for, 0 if it was not.
+        """
+        self.calls += 1
+        if delay > 0:
+            self.held += 1
+            self.total += delay
+            self.longest = max(self.longest, delay)
+
+
+class RateLimiter:
+    """
+    Class holding back API calls so that the validator as a whole stays under a request rate, and each endpoint under
+    its own rate if it has one.
+
+    Every thread making calls shares the limiter, so the limits hold however many resources are checked at once. The
+    time each call was held back for is recorded per endpoint, to show whether the limits are slowing the run down.
+    """
+
+    buckets: Dict[str, TokenBucket]
+    delays: Dict[str, DelayStats]
+    overall: Optional[TokenBucket]
+    rate: float
+
+    def __init__(
+        self,
+        rate: float = VALIDATOR_API_RATE,
+        burst: int = VALIDATOR_API_BURST,
+        endpoints: Optional[Dict[str, float]] = None,
+    ):
+        """
+        Initialise an instance of the RateLimiter class.
+        :param rate: The number of calls per second allowed across every endpoint. 0 allows any number.
+        :param burst: The number of calls allowed at once, overall and to each endpoint, after a quiet spell.
+        :param endpoints: The number of calls per second allowed to each limited endpoint, by endpoint name, e.g.
+                          {'IAAS.cloud.create': 0.5}. Defaults to `VALIDATOR_API_ENDPOINT_RATES`.
+        """
+        self.rate = rate
+        self.overall = TokenBucket(rate, burst) if rate > 0 else None
+        self.buckets = {
+            name: TokenBucket(endpoint_rate, burst)
+            for name, endpoint_rate in (VALIDATOR_API_ENDPOINT_RATES if endpoints is None else endpoints).items()
+            if endpoint_rate > 0
+        }
+        self.delays = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, endpoint: str) -> float:
+        """
+        Wait until a call to an endpoint is allowed.
+        :param endpoint: The name of the endpoint, e.g. 'IAAS.vm.read'.
+        :return: The number of seconds the call was held back for.
+        """
+        now = clock.monotonic()
+        ready = now
+        bucket = self.buckets.get(endpoint)
+        if bucket is not None:
+            ready = bucket.reserve(ready)
+        if self.overall is not None:
+            # Reserve the overall slot for when the endpoint allows the call, so no slot is held unused meanwhile
+            ready = self.overall.reserve(ready)
+        delay = ready - now
+        if delay > 0:
+            clock.sleep(delay)
+
+        with self._lock:
+            self.delays.setdefault(endpoint, DelayStats()).add(delay)
+        return max(0.0, delay)
+
+    def report(self):
+        """
+        Print how long calls to each endpoint were held back for, for the endpoints whose calls were.
+        """
+        with self._lock:
+            delays = dict(self.delays)
+        held_back = {endpoint: stats for endpoint, stats in delays.items() if stats.held}
+        if not held_back:
+            print(' - No API calls were held back by the rate limits')
+            return
+        for endpoint, stats in sorted(held_back.items()):
+            average = stats.total / stats.held
+            print(
+                f' - {endpoint}: {stats.held} of {stats.calls} calls held back, for {average * 1000:.0f}ms on average '
+                f'and {stats.longest * 1000:.0f}ms at longest',
+            )
@@ -12,3 +12,64 @@ CLOUDCIX_API_V2_URL = ''
 ROBOT_USERNAME = ''
 ROBOT_PASSWORD = ''
 ROBOT_API_KEY = ''
+
+# Validator
+# Maximum number of resources to be checked at once. Set to 1 to check resources one after another.
+VALIDATOR_WORKERS = 10
+# Number of VMs restarted together in each rolling wave. Set to 0 to restart every VM in the project at once.
+VALIDATOR_RESTART_WAVE_SIZE = 0
+# Maximum number of keep-alive connections to each COP host shared by all API calls. Should be at least
+# VALIDATOR_WORKERS, as each thread making calls at once needs its own connection.
+VALIDATOR_HTTP_POOL_SIZE = 20
+# Number of seconds an API token is valid for. Tokens are replaced in the background 10 minutes before they expire.
+VALIDATOR_TOKEN_LIFETIME = 2 * 60 * 60
+# Maximum number of times an API call is retried after a connection error or a transient error response (429 or 5xx).
+VALIDATOR_API_RETRIES = 5
+# Longest number of seconds to wait before the first retry of an API call. Doubles with every retry, up to 30 seconds,
+# and the actual wait is picked at random up to it so that threads failing together do not retry together.
+VALIDATOR_API_BACKOFF = 1.0
+# Maximum average number of API calls per second made by the whole validator, however many workers are making them.
+# 0 allows any number.
+VALIDATOR_API_RATE = 20.0
+# Number of API calls allowed at once after a quiet spell, overall and to each endpoint in VALIDATOR_API_ENDPOINT_RATES.
+VALIDATOR_API_BURST = 10
+# Maximum average number of calls per second to individual endpoints, by endpoint name, e.g. {'IAAS.vm.read': 10.0}.
+# Endpoints are named after the cloudcix client and method used, e.g. 'IAAS.cloud.create' or 'IAAS.vm.list'.
+VALIDATOR_API_ENDPOINT_RATES = {}
+# Path of the JSON report of the API calls made to each endpoint in each phase of the run, e.g. 'api_calls.json'.
+# Leave empty to not write one.
+VALIDATOR_API_REPORT = ''
+# Maximum number of network probes in flight at once.
+VALIDATOR_PROBE_CONCURRENCY = 200
+# Whether VM hardware checks also connect to the VM's service port (SSH or RDP, chosen by image) as well as pinging it.
+VALIDATOR_SERVICE_PROBES = True
+# Path of the JSON report of VM boot latency written after each build, e.g. 'boot_latency_{project_id}.json'.
+# Leave empty to not measure boot latency.
+VALIDATOR_BOOT_LATENCY_REPORT = ''
+# Directory the output of commands run on VMs and routers over SSH is streamed to, in one log file per host.
+# Leave empty to only keep the end of each command's output in memory.
+VALIDATOR_SSH_LOG_DIR = ''
+# Credentials used to log in to VMs over SSH, e.g. to prepare them for bandwidth tests. Either can also be set by the
+# environment variable of the same name. If no password is set it is asked for once.
+VALIDATOR_VM_USERNAME = 'administrator'
+VALIDATOR_VM_PASSWORD = ''
+# Maximum number of VMs whose bandwidth is tested at once. Above 1 the aggregate throughput to the VMs is measured too.
+VALIDATOR_BANDWIDTH_CONCURRENCY = 1
+# Path of the JSON report of bandwidth test results, e.g. 'bandwidth_{project_id}.json'. Leave empty to not write one.
+VALIDATOR_BANDWIDTH_REPORT = ''
+# Whether the bandwidth tests also measure the bandwidth between every pair of VMs over their private IPs.
+VALIDATOR_EAST_WEST = False
+# Whether the storages attached to Linux VMs are benchmarked with fio after the bandwidth tests.
+VALIDATOR_STORAGE_BENCHMARK = False
+# Path of the JSON report of storage benchmark results, e.g. 'storage_{project_id}.json'. Leave empty to not write one.
+VALIDATOR_STORAGE_REPORT = ''
+# Public IP address the validator's traffic reaches the virtual routers from, used to work out which firewall rules
+# apply to it, and as the source of the rule added when updating a project to time how long it takes to apply. Leave
+# empty to only check rules that apply to any source, and to not time the rule change.
+VALIDATOR_SOURCE_IP = ''
+# Whether to run against a simulated region in process instead of a real one, to benchmark the validator offline.
+VALIDATOR_SIMULATE = False
+# Keyword arguments for the simulated region, see `simulator.Simulator`, e.g. {'servers': 8, 'failure_rate': 0.01}.
+VALIDATOR_SIMULATOR = {}
+# Whether runs against the simulated region wait on a virtual clock, which skips ahead whenever everything is waiting.
+VALIDATOR_VIRTUAL_CLOCK = False
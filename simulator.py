@@ -0,0 +1,659 @@
+# stdlib
+import ast
+import copy
+import ipaddress
+import itertools
+import json
+import math
+import random
+import threading
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+# lib
+from requests import PreparedRequest, Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+# local
+import clock
+import firewall
+import prober
+import state
+from settings import VALIDATOR_SOURCE_IP
+from transport import OPERATIONS, TimedSession, Transport
+
+# The ID of the region the simulator serves
+REGION_ID = 1
+
+# Server types, and the storage types servers have
+HYPERV = 1
+KVM = 2
+HDD = 1
+SSD = 2
+
+# The hardware of each simulated server: cores, RAM in GB and storage in GB
+SERVER_SIZE = (32, 256, 4000)
+# How many VM cores share each physical core, and the RAM and storage each server keeps for itself
+OVERSUBSCRIPTION = 8
+RAM_RESERVED = 8
+STORAGE_RESERVED = 100
+# The error given when a project does not fit on the servers
+FULL = 'There are not enough resources in the region.'
+
+# The images available in the simulated region
+IMAGES = [
+    {'id': 1, 'display_name': 'Ubuntu 22.04', 'answer_file_name': 'ubuntu', 'multiple_ips': True},
+    {'id': 2, 'display_name': 'CentOS 7', 'answer_file_name': 'centos', 'multiple_ips': True},
+    {'id': 3, 'display_name': 'Windows Server 2022', 'answer_file_name': 'windows', 'multiple_ips': False},
+]
+
+# The median number of seconds resources spend in each transitional state, and the spread around it, see `Latency`
+TRANSITIONS = {
+    state.REQUESTED: (2.0, 0.3),
+    state.BUILDING: (60.0, 0.4),
+    state.QUIESCE: (2.0, 0.3),
+    state.QUIESCING: (20.0, 0.4),
+    state.RESTART: (2.0, 0.3),
+    state.RESTARTING: (30.0, 0.4),
+    state.UPDATE: (2.0, 0.3),
+    state.UPDATING: (20.0, 0.4),
+    state.SCRUB: (2.0, 0.3),
+    state.SCRUB_PREP: (20.0, 0.4),
+}
+
+# The addresses given out as public IPs, from the range set aside for benchmarking so that they are never real hosts
+PUBLIC_NETWORK = ipaddress.ip_network('198.18.0.0/15')
+
+
+class Latency:
+    """
+    Class describing a random duration with a log-normal distribution, which like real API calls and builds is mostly
+    close to its median with a long tail of slow ones.
+    """
+
+    median: float
+    sigma: float
+
+    def __init__(self, median: float, sigma: float = 0.5):
+        """
+        Initialise an instance of the Latency class.
+        :param median: The median number of seconds.
+        :param sigma: The spread. 0 always gives the median, 0.5 gives one in twenty over 2.3 times the median.
+        """
+        self.median = median
+        self.sigma = sigma
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(rng.gauss(0, self.sigma))
+
+
+class Resource:
+    """
+    Class holding a simulated VM or Virtual Router and the states it is scheduled to move through.
+    """
+
+    answers_from: Optional[float]
+    kind: str
+    obj: Dict[str, Any]
+    schedule: List[Tuple[float, int]]
+    walks: int
+
+    def __init__(self, kind: str, obj: Dict[str, Any], now: float):
+        """
+        Initialise an instance of the Resource class.
+        :param kind: 'vm' or 'virtual_router'.
+        :param obj: The resource as the API returns it.
+        :param now: The time the resource is created at.
+        """
+        self.kind = kind
+        self.obj = obj
+        self.schedule = [(now, obj['state'])]
+        self.answers_from = None
+        # The number of times the resource has been scheduled through states, see `Simulator._walk`
+        self.walks = 0
+
+    def state(self, now: float) -> int:
+        """
+        The state the resource is in at a given time.
+        """
+        current = self.schedule[0][1]
+        for at, status in self.schedule:
+            if at > now:
+                break
+            current = status
+        return current
+
+    def finished(self) -> float:
+        """
+        The time the resource reaches the last state it is scheduled to move to.
+        """
+        return self.schedule[-1][0]
+
+    def read(self, now: float) -> Dict[str, Any]:
+        """
+        A copy of the resource as the API would return it at a given time.
+        """
+        obj = copy.deepcopy(self.obj)
+        obj['state'] = self.state(now)
+        return obj
+
+
+class Simulator:
+    """
+    Class simulating the COP API of a region, in process, for running the validator without a real region.
+
+    The simulator answers the cloudcix API calls the validator makes: projects are created, updated and scrubbed, and
+    their Virtual Routers and VMs move through the states in `state` with durations drawn from `transitions`. VMs are
+    placed on simulated servers, and a project that does not fit is refused so that Validator Heavy stops filling the
+    region. Every call takes `api_latency` and fails with a 503 at `failure_rate`.
+
+    Probes of simulated hosts are answered by the simulator too: a VM answers once it has been RUNNING for its boot
+    time, a Virtual Router while it is up, and only where the project's firewall rules let the validator in. SSH based
+    tests (bandwidth and storage benchmarks) are not simulated.
+    """
+
+    api_latency: Latency
+    boot: Latency
+    failure_rate: float
+    seed: int
+    transitions: Dict[int, Latency]
+    unresourced_rate: float
+
+    def __init__(
+        self,
+        servers: int = 4,
+        api_latency: Tuple[float, float] = (0.05, 0.5),
+        failure_rate: float = 0.0,
+        unresourced_rate: float = 0.0,
+        transitions: Optional[Dict[int, Tuple[float, float]]] = None,
+        boot: Tuple[float, float] = (20.0, 0.5),
+        seed: Optional[int] = None,
+    ):
+        """
+        Initialise an instance of the Simulator class.
+        :param servers: The number of servers of each type (HyperV or KVM) and storage type (HDD or SSD).
+        :param api_latency: The median number of seconds each API call takes, and the spread, see `Latency`.
+        :param failure_rate: The fraction of API calls that fail with a 503 Service Unavailable.
+        :param unresourced_rate: The fraction of VM builds that end UNRESOURCED instead of RUNNING.
+        :param transitions: The median number of seconds and spread of the time spent in each transitional state, by
+                            state, overriding those in `TRANSITIONS`.
+        :param boot: The median number of seconds and spread of the time a RUNNING VM takes to answer probes.
+        :param seed: The seed for the random numbers, to repeat a run exactly. Defaults to a random one.
+        """
+        self.api_latency = Latency(*api_latency)
+        self.failure_rate = failure_rate
+        self.unresourced_rate = unresourced_rate
+        self.transitions = {
+            status: Latency(*distribution)
+            for status, distribution in {**TRANSITIONS, **(transitions or {})}.items()
+        }
+        self.boot = Latency(*boot)
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        # The number of times each API call has been made, see `request_rng`
+        self.calls: Dict[str, int] = {}
+        self.ids: Dict[str, Iterator[int]] = {}
+        self.projects: Dict[int, Dict[str, Any]] = {}
+        self.virtual_routers: Dict[int, Resource] = {}
+        self.vms: Dict[int, Resource] = {}
+        self.hosts: Dict[str, Resource] = {}
+        self.public_ips = PUBLIC_NETWORK.hosts()
+        self.servers: List[Dict[str, Any]] = []
+        self.used: Dict[int, List[float]] = {}
+        for server_type, storage_type in itertools.product((HYPERV, KVM), (HDD, SSD)):
+            for _ in range(servers):
+                self._add_server(server_type, storage_type)
+        self._lock = threading.RLock()
+
+    def install(self, transport: Transport):
+        """
+        Answer every API call sent over the transport, and every probe, from the simulator instead of the network.
+        Must be called after the transport is installed.
+        """
+        adapter = SimulatorAdapter(self, transport.session)
+        transport.session.mount('https://', adapter)
+        transport.session.mount('http://', adapter)
+        prober.responder = self.answers
+        # The validator's own random numbers, e.g. the jitter of its polling, are seeded too so that a run repeats
+        random.seed(self.seed)
+
+    def rng(self, *key: Any) -> random.Random:
+        """
+        The random numbers for one thing the simulator decides, e.g. how long a VM's build takes.
+
+        Each decision draws from its own generator, seeded from the run's seed and the key, so that a seeded run makes
+        the same decisions whichever order threads make their calls in.
+        :param key: What is being decided, e.g. ('vm', 3, 0) for the first states VM 3 is scheduled through.
+        """
+        return random.Random(':'.join(str(part) for part in (self.seed, *key)))
+
+    def request_rng(self, method: str, url: str) -> random.Random:
+        """
+        The random numbers for an API call, keyed by the call and the number of times it has been made before.
+        """
+        call = f'{method} {url}'
+        with self._lock:
+            count = self.calls[call] = self.calls.get(call, -1) + 1
+        return self.rng('request', call, count)
+
+    def _next_id(self, kind: str) -> int:
+        return next(self.ids.setdefault(kind, itertools.count(1)))
+
+    def _add_server(self, server_type: int, storage_type: int):
+        cores, ram, gb = SERVER_SIZE
+        server_id = self._next_id('server')
+        self.servers.append({
+            'id': server_id,
+            'region_id': REGION_ID,
+            'model': 'Simulated',
+            'host': True,
+            'enabled': True,
+            'asset_tag': None,
+            'type': {'id': server_type},
+            'storage_type': {'id': storage_type},
+            'cores': cores,
+            'ram': ram,
+            'gb': gb,
+            'hdd': gb if storage_type == HDD else 0,
+            'flash': gb if storage_type == SSD else 0,
+        })
+        self.used[server_id] = [0, 0, 0]
+
+    def _walk(self, resource: Resource, steps: List[int], final: int):
+        """
+        Schedule a resource to move through transitional states, spending a random time in each, to a final state.
+        """
+        rng = self.rng(resource.kind, resource.obj['id'], resource.walks)
+        resource.walks += 1
+        at = clock.monotonic()
+        resource.schedule = [(at, resource.state(at))]
+        for status in steps:
+            resource.schedule.append((at, status))
+            at += self.transitions[status].sample(rng) if status in self.transitions else 0
+        resource.schedule.append((at, final))
+        resource.answers_from = at + self.boot.sample(rng) if final == state.RUNNING else None
+
+    # Hosts
+
+    def answers(self, ip: str, protocol: str, port: Optional[int]) -> bool:
+        """
+        Whether a simulated host answers a probe from the validator, used in place of sending the probe.
+        :param ip: The IP address probed.
+        :param protocol: 'icmp', 'tcp' or 'udp'.
+        :param port: The port probed, or None for ICMP.
+        """
+        now = clock.monotonic()
+        with self._lock:
+            resource = self.hosts.get(ip)
+            if resource is None:
+                return False
+            if 'ip_address' in resource.obj:
+                # Virtual Routers keep routing while they are being updated
+                return resource.state(now) in (state.RUNNING, state.UPDATE, state.UPDATING)
+            if resource.state(now) != state.RUNNING or resource.answers_from is None or now < resource.answers_from:
+                return False
+            address = next(ip_address for ip_address in resource.obj['ip_addresses'] if ip_address['public_ip'])
+            rules = self._firewall_rules(self.projects[resource.obj['project_id']], now)
+            return firewall.expected(rules, VALIDATOR_SOURCE_IP, (ip, address['address'], protocol, port))
+
+    @staticmethod
+    def _firewall_rules(project: Dict[str, Any], now: float) -> List[Dict[str, Any]]:
+        rules = project['firewall_rules'][0][1]
+        for at, applied in project['firewall_rules']:
+            if at <= now:
+                rules = applied
+        return rules
+
+    # Requests
+
+    def handle(self, endpoint: str, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        """
+        Answer an API call.
+        :param endpoint: The endpoint called, e.g. 'IAAS.vm.read'.
+        :param pk: The ID in the URL, or '' if there is none.
+        :param params: The query parameters.
+        :param data: The body sent, parsed from JSON.
+        :return: The status code and body of the response.
+        """
+        handler = getattr(self, '_' + endpoint.replace('.', '_').lower(), None)
+        if handler is None:
+            return 404, {'detail': f'{endpoint} is not simulated'}
+        with self._lock:
+            return handler(pk=pk, params=params, data=data)
+
+    @staticmethod
+    def _listing(objects: List[Dict[str, Any]], params: Dict[str, Any]) -> Tuple[int, Any]:
+        """
+        Filter and page a list of objects the way the API does for the parameters the validator sends. Only filters
+        of the form 'search[<field>]' or 'exclude[<field>]' are applied, as any other parameter is ignored by the API.
+        """
+        for key, value in params.items():
+            if not (key.startswith('search[') or key.startswith('exclude[')) or not key.endswith(']'):
+                continue
+            exclude = key.startswith('exclude[')
+            field, _, lookup = key[key.index('[') + 1:-1].partition('__')
+            values = value if lookup == 'in' else [value]
+            wanted = {str(item).lower() for item in values}
+            objects = [
+                obj for obj in objects
+                if field not in obj or (str(obj[field]).lower() in wanted) != exclude
+            ]
+        limit = int(params.get('limit', 50))
+        page = int(params.get('page', 0))
+        return 200, {
+            'content': objects[page * limit:(page + 1) * limit],
+            '_metadata': {'total_records': len(objects), 'limit': limit, 'page': page},
+        }
+
+    def _membership_token_create(self, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        return 201, {'token': uuid.uuid4().hex}
+
+    def _membership_address_list(self, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        return 200, {'content': [{'id': REGION_ID, 'name': 'Simulated Region'}]}
+
+    def _asset_asset_list(self, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        return 200, {'content': []}
+
+    def _iaas_image_list(self, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        return 200, {'content': copy.deepcopy(IMAGES)}
+
+    def _iaas_server_list(self, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        return self._listing(copy.deepcopy(self.servers), params)
+
+    def _iaas_router_read(self, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        return 200, {'content': {'id': int(pk), 'management_ip': '::1', 'username': 'robot', 'credentials': ''}}
+
+    def _iaas_project_list(self, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        return self._listing([self._project(project) for project in self.projects.values()], params)
+
+    def _iaas_project_read(self, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        project = self.projects.get(int(pk))
+        if project is None:
+            return 404, {'detail': 'Not found.'}
+        return 200, {'content': self._project(project)}
+
+    def _project(self, project: Dict[str, Any]) -> Dict[str, Any]:
+        now = clock.monotonic()
+        shut_down = project['shut_down_at'] is not None and now >= project['shut_down_at']
+        return {
+            'id': project['id'],
+            'name': project['name'],
+            'region_id': project['region_id'],
+            'address_id': REGION_ID,
+            'closed': shut_down,
+            'shut_down': shut_down,
+        }
+
+    def _iaas_project_partial_update(self, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        project = self.projects.get(int(pk))
+        if project is None:
+            return 404, {'detail': 'Not found.'}
+        if (data or {}).get('state') != state.SCRUB:
+            return 400, {'errors': {'state': 'Only scrubbing a project is simulated.'}}
+        if project['shut_down_at'] is not None:
+            return 400, {'errors': {'state': 'The project is already being scrubbed.'}}
+
+        resources = [self.virtual_routers[project['virtual_router_id']]]
+        resources.extend(self.vms[vm_id] for vm_id in project['vm_ids'])
+        for resource in resources:
+            self._walk(resource, [state.SCRUB, state.SCRUB_PREP], state.SCRUB_QUEUE)
+            self._release(resource)
+        project['shut_down_at'] = max(resource.finished() for resource in resources)
+        return 200, {'content': self._project(project)}
+
+    def _iaas_virtual_router_read(self, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        resource = self.virtual_routers.get(int(pk))
+        if resource is None:
+            return 404, {'detail': 'Not found.'}
+        return 200, {'content': resource.read(clock.monotonic())}
+
+    def _iaas_vm_read(self, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        resource = self.vms.get(int(pk))
+        if resource is None:
+            return 404, {'detail': 'Not found.'}
+        return 200, {'content': resource.read(clock.monotonic())}
+
+    def _iaas_vm_list(self, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        now = clock.monotonic()
+        project_id = params.get('search[project_id]')
+        if project_id is not None and int(project_id) in self.projects:
+            # Most listings are of one project, so avoid reading every VM in the region for them
+            resources = [self.vms[vm_id] for vm_id in self.projects[int(project_id)]['vm_ids']]
+        else:
+            resources = list(self.vms.values())
+        return self._listing([resource.read(now) for resource in resources], params)
+
+    def _iaas_vm_partial_update(self, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        resource = self.vms.get(int(pk))
+        if resource is None:
+            return 404, {'detail': 'Not found.'}
+        current = resource.state(clock.monotonic())
+        requested = (data or {}).get('state')
+        if requested == state.QUIESCE and current == state.RUNNING:
+            self._walk(resource, [state.QUIESCE, state.QUIESCING], state.QUIESCED)
+        elif requested == state.RESTART and current == state.QUIESCED:
+            self._walk(resource, [state.RESTART, state.RESTARTING], state.RUNNING)
+        else:
+            return 400, {'errors': {'state': f'Cannot change the state of a VM from {current} to {requested}.'}}
+        return 200, {'content': resource.read(clock.monotonic())}
+
+    def _iaas_cloud_create(self, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        placements = self._place(data.get('vms', []))
+        if placements is None:
+            return 400, {'error_code': 'iaas_cloud_create_001', 'detail': FULL}
+
+        now = clock.monotonic()
+        project_id = self._next_id('project')
+        router_id = self._next_id('virtual_router')
+        subnets = [
+            {
+                'id': self._next_id('subnet'),
+                'address_id': REGION_ID,
+                'vlan': 1000 + project_id,
+                'vxlan': 1000 + project_id,
+                **subnet,
+            }
+            for subnet in data.get('subnets', [])
+        ]
+        virtual_router = Resource(
+            'virtual_router',
+            {
+                'id': router_id,
+                'project_id': project_id,
+                'router_id': 1,
+                'state': state.REQUESTED,
+                'ip_address': {'address': self._public_ip()},
+                'subnets': subnets,
+            },
+            now,
+        )
+        self._walk(virtual_router, [state.REQUESTED, state.BUILDING], state.RUNNING)
+        self.virtual_routers[router_id] = virtual_router
+        self.hosts[virtual_router.obj['ip_address']['address']] = virtual_router
+        vpns = [{'id': self._next_id('vpn'), **vpn} for vpn in data.get('vpns') or [] if vpn]
+
+        self.projects[project_id] = {
+            'id': project_id,
+            'name': data.get('project', {}).get('name', ''),
+            'region_id': data.get('project', {}).get('region_id', REGION_ID),
+            'virtual_router_id': router_id,
+            'vm_ids': [],
+            'firewall_rules': [(now, list(data.get('firewall_rules', [])))],
+            'shut_down_at': None,
+        }
+        vms = [self._build(project_id, vm, server) for vm, server in zip(data.get('vms', []), placements)]
+        return 201, {
+            'content': {
+                'project': self._project(self.projects[project_id]),
+                'virtual_router': virtual_router.read(now),
+                'vpns': vpns,
+                'vms': [vm.read(now) for vm in vms],
+            },
+        }
+
+    def _iaas_cloud_update(self, pk: str, params: Dict[str, Any], data: Any) -> Tuple[int, Any]:
+        project = self.projects.get(int(pk))
+        if project is None:
+            return 404, {'detail': 'Not found.'}
+        new = [vm for vm in data.get('vms', []) if not vm.get('id')]
+        placements = self._place(new)
+        if placements is None:
+            return 400, {'error_code': 'iaas_cloud_update_001', 'detail': FULL}
+
+        # The Virtual Router is updated, and the new firewall rules apply once it has been
+        virtual_router = self.virtual_routers[project['virtual_router_id']]
+        self._walk(virtual_router, [state.UPDATE, state.UPDATING], state.RUNNING)
+        project['firewall_rules'].append((virtual_router.finished(), list(data.get('firewall_rules', []))))
+
+        # VMs whose hardware changed are updated, and VMs without an ID are built
+        for vm in data.get('vms', []):
+            resource = self.vms.get(int(vm['id'])) if vm.get('id') else None
+            if resource is not None and (vm.get('cpu'), vm.get('ram')) != (resource.obj['cpu'], resource.obj['ram']):
+                resource.obj.update(cpu=vm['cpu'], ram=vm['ram'])
+                self._walk(resource, [state.UPDATE, state.UPDATING], state.RUNNING)
+        for vm, server in zip(new, placements):
+            self._build(project['id'], vm, server)
+        return 200, {'content': self._project(project)}
+
+    # VMs
+
+    def _public_ip(self) -> str:
+        return str(next(self.public_ips))
+
+    def _place(self, vms: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Choose a server with room for each VM, of the server type its image needs and with its storage type.
+        :return: The server for each VM, or None if they do not all fit.
+        """
+        used = {server_id: list(usage) for server_id, usage in self.used.items()}
+        placements = []
+        for vm in vms:
+            image = next((image for image in IMAGES if str(image['id']) == str(vm['image_id'])), IMAGES[0])
+            server_type = HYPERV if image['answer_file_name'] == 'windows' else KVM
+            needed = (vm['cpu'], vm['ram'], sum(storage['gb'] for storage in vm['storages']))
+            for server in self.servers:
+                if server['type']['id'] != server_type or server['storage_type']['id'] != vm['storage_type_id']:
+                    continue
+                limits = (
+                    server['cores'] * OVERSUBSCRIPTION,
+                    server['ram'] - RAM_RESERVED,
+                    server['gb'] - STORAGE_RESERVED,
+                )
+                usage = used[server['id']]
+                if all(usage[i] + needed[i] <= limits[i] for i in range(3)):
+                    for i in range(3):
+                        usage[i] += needed[i]
+                    placements.append(server)
+                    break
+            else:
+                return None
+        self.used = used
+        return placements
+
+    def _release(self, resource: Resource):
+        server_id = resource.obj.get('server_id')
+        if server_id is not None:
+            gb = sum(storage['gb'] for storage in resource.obj['storages'])
+            for i, amount in enumerate((resource.obj['cpu'], resource.obj['ram'], gb)):
+                self.used[server_id][i] -= amount
+
+    def _build(self, project_id: int, vm: Dict[str, Any], server: Dict[str, Any]) -> Resource:
+        vm_id = self._next_id('vm')
+        image = next((image for image in IMAGES if str(image['id']) == str(vm['image_id'])), IMAGES[0])
+        ip_addresses = []
+        for ip_address in vm['ip_addresses']:
+            public_ip = {'id': self._next_id('ip'), 'address': self._public_ip()} if ip_address.get('nat') else None
+            ip_addresses.append({'id': self._next_id('ip'), **ip_address, 'public_ip': public_ip})
+        resource = Resource(
+            'vm',
+            {
+                'id': vm_id,
+                'name': vm['name'],
+                'project_id': project_id,
+                'server_id': server['id'],
+                'state': state.REQUESTED,
+                'cpu': vm['cpu'],
+                'ram': vm['ram'],
+                'storage_type_id': vm['storage_type_id'],
+                'storage_type': {'id': vm['storage_type_id']},
+                'image': copy.deepcopy(image),
+                'ip_addresses': ip_addresses,
+                'storages': [{'id': self._next_id('storage'), 'vm_id': vm_id, **storage} for storage in vm['storages']],
+            },
+            clock.monotonic(),
+        )
+        unresourced = self.rng('unresourced', vm_id).random() < self.unresourced_rate
+        self._walk(resource, [state.REQUESTED, state.BUILDING], state.UNRESOURCED if unresourced else state.RUNNING)
+        if unresourced:
+            self._release(resource)
+        self.vms[vm_id] = resource
+        self.projects[project_id]['vm_ids'].append(vm_id)
+        for ip_address in ip_addresses:
+            if ip_address['public_ip'] is not None:
+                self.hosts[ip_address['public_ip']['address']] = resource
+        return resource
+
+
+class SimulatorAdapter(BaseAdapter):
+    """
+    Transport adapter sending requests to the simulator rather than over the network.
+    """
+
+    def __init__(self, simulator: Simulator, session: TimedSession):
+        """
+        Initialise an instance of the SimulatorAdapter class.
+        :param simulator: The simulator answering the requests.
+        :param session: The session the adapter is mounted on, which knows the URL of each cloudcix client.
+        """
+        super().__init__()
+        self.simulator = simulator
+        self.session = session
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:  # type: ignore
+        simulator = self.simulator
+        rng = simulator.request_rng(request.method or '', request.url or '')
+        clock.sleep(simulator.api_latency.sample(rng))
+
+        resolved = self.session.resolve(request.url or '')
+        if resolved is None:
+            status, body = 404, {'detail': f'{request.url} is not simulated'}
+        elif rng.random() < simulator.failure_rate:
+            status, body = 503, {'detail': 'Service Unavailable'}
+        else:
+            client, pk = resolved
+            operation = OPERATIONS.get((request.method or '').upper(), '')
+            if operation == 'read' and not pk:
+                operation = 'list'
+            params = {key: _parse(value) for key, value in parse_qsl(urlsplit(request.url).query)}
+            body_text = request.body.decode() if isinstance(request.body, bytes) else request.body
+            data = json.loads(body_text) if body_text else None
+            status, body = simulator.handle(f'{client}.{operation}', pk, params, data)
+
+        response = Response()
+        response.status_code = status
+        response._content = json.dumps(body).encode()
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json'})
+        response.encoding = 'utf-8'
+        response.url = request.url or ''
+        response.request = request
+        response.reason = 'Simulated'
+        return response
+
+    def close(self):
+        pass
+
+
+def _parse(value: str) -> Any:
+    """
+    Turn a query parameter back into the value the cloudcix client was given: lists are sent as their Python repr and
+    booleans in lower case.
+    """
+    if value.startswith('['):
+        try:
+            return ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return value
+    if value in ('true', 'false'):
+        return value == 'true'
+    return value
@@ -0,0 +1,375 @@
+# stdlib
+import atexit
+import codecs
+import os
+import select
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+# lib
+from paramiko import AutoAddPolicy, Channel, SSHClient, SSHException
+
+
+class CommandOutput:
+    """
+    Class holding everything read from the channel of a remote command.
+    """
+
+    error: str
+    exit_status: Optional[int]
+    output: str
+    timed_out: bool
+    truncated: bool
+
+    def __init__(self, output: str, error: str, exit_status: Optional[int], timed_out: bool, truncated: bool):
+        self.output = output
+        self.error = error
+        self.exit_status = exit_status
+        self.timed_out = timed_out
+        self.truncated = truncated
+
+
+class OutputSink:
+    """
+    Class taking the output of remote commands as it arrives, so that it never has to be held in memory in full.
+
+    Output is decoded incrementally and appended to a log file, if one is given, while only the last `tail_size`
+    characters of each stream are kept in memory for printing a summary to the console.
+    """
+
+    log: Optional[TextIO]
+    tail_size: int
+    tails: List[str]
+    truncated: bool
+
+    def __init__(self, path: Optional[str] = None, tail_size: int = 64 * 1024):
+        """
+        Initialise an instance of the OutputSink class.
+        :param path: The path of the log file output is appended to. Output is only kept in the tail if None.
+        :param tail_size: The number of characters kept in memory from the end of each stream.
+        """
+        self.tail_size = tail_size
+        self.tails = ['', '']
+        self.truncated = False
+        self._decoders = [codecs.getincrementaldecoder('utf-8')(errors='replace') for _ in range(2)]
+        self.log = None
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self.log = open(path, 'a')
+
+    def begin(self):
+        """
+        Start taking the output of a new command, clearing the tails kept for the previous one.
+        """
+        self.tails = ['', '']
+        self.truncated = False
+
+    def write(self, stream: int, data: bytes, final: bool = False):
+        """
+        Take the next chunk of a stream.
+        :param stream: 0 for stdout, 1 for stderr.
+        :param data: The bytes read from the stream.
+        :param final: True if this is the end of the stream, flushing any incomplete character left in the decoder.
+        """
+        text = self._decoders[stream].decode(data, final)
+        if not text:
+            return
+        if self.log is not None:
+            self.log.write(text)
+        tail = self.tails[stream] + text
+        if len(tail) > self.tail_size:
+            tail = tail[-self.tail_size:]
+            self.truncated = True
+        self.tails[stream] = tail
+
+    def close(self):
+        """
+        Close the log file, if there is one.
+        """
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+
+def log_path(directory: str, host: str) -> Optional[str]:
+    """
+    The path of the log file for a host's command output in a directory, or None if no directory is set.
+    """
+    return os.path.join(directory, f'{host}.log') if directory else None
+
+
+def read_channel(
+    channel: Channel,
+    timeout: Optional[float] = None,
+    max_size: Optional[int] = None,
+    read_size: int = 32768,
+    sink: Optional[OutputSink] = None,
+) -> CommandOutput:
+    """
+    Read the stdout and stderr of a remote command until the command exits and both streams reach EOF.
+
+    The reader blocks in `select` on the channel's file descriptor, which paramiko sets whenever either stream has data
+    or the channel is closed, so it uses no CPU while the command is running. Both streams are drained together so the
+    command can never stall on a full SSH window, and output arriving just before the exit status is not lost.
+    :param channel: The channel the command was started on.
+    :param timeout: The number of seconds to wait for the command to finish. Waits forever if None. The channel is
+                    closed if the command is still running when it passes.
+    :param max_size: The maximum number of bytes to keep from each stream. Anything after that is read and dropped.
+    :param read_size: How many bytes to be read from the channel each time.
+    :param sink: The sink output is streamed to as it arrives. If given, only the tail the sink keeps of this command
+                 is returned and `max_size` is ignored.
+    :return: The output, errors and exit status of the command.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    if sink is not None:
+        sink.begin()
+    streams: Tuple[List[bytes], List[bytes]] = ([], [])
+    sizes = [0, 0]
+    truncated = False
+
+    def keep(index: int, data: bytes):
+        nonlocal truncated
+        if sink is not None:
+            sink.write(index, data)
+            return
+        if max_size is not None and sizes[index] + len(data) > max_size:
+            data = data[:max_size - sizes[index]]
+            truncated = True
+        streams[index].append(data)
+        sizes[index] += len(data)
+
+    timed_out = False
+    while True:
+        # Check for EOF before draining, all output arrives before it so none can be left behind
+        finished = channel.closed or channel.eof_received
+        while channel.recv_ready():
+            keep(0, channel.recv(read_size))
+        while channel.recv_stderr_ready():
+            keep(1, channel.recv_stderr(read_size))
+        if finished:
+            break
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            timed_out = True
+            break
+        select.select([channel], [], [], remaining)
+
+    exit_status = None
+    if not timed_out:
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if channel.status_event.wait(remaining):
+            exit_status = channel.exit_status
+        else:
+            timed_out = True
+    if timed_out:
+        channel.close()
+
+    if sink is not None:
+        sink.write(0, b'', final=True)
+        sink.write(1, b'', final=True)
+        return CommandOutput(
+            output=sink.tails[0],
+            error=sink.tails[1],
+            exit_status=exit_status,
+            timed_out=timed_out,
+            truncated=sink.truncated,
+        )
+    return CommandOutput(
+        output=b''.join(streams[0]).decode(errors='replace'),
+        error=b''.join(streams[1]).decode(errors='replace'),
+        exit_status=exit_status,
+        timed_out=timed_out,
+        truncated=truncated,
+    )
+
+
+class PooledClient:
+    """
+    Class holding a pooled connection, the password it was authenticated with, and who is using it.
+    """
+
+    client: SSHClient
+    password: str
+    used: float
+    users: int
+
+    def __init__(self, client: SSHClient, password: str):
+        self.client = client
+        self.password = password
+        self.used = time.monotonic()
+        self.users = 0
+
+
+class SSHPool:
+    """
+    Class keeping authenticated SSH connections open so that repeated commands on the same host reuse them.
+
+    Connections are keyed by host, port and username. Each command runs on a new channel over the pooled transport, so
+    after the first command a host only costs a channel open rather than a full key exchange and authentication, and
+    threads running commands on the same host at once share its connection. Connections are checked out with `client`
+    for as long as they are used, checked before being reused, and closed once nobody has used them for `idle_timeout`
+    seconds. A connection replaced or discarded while in use is closed once its last user is done with it.
+    """
+
+    connect_timeout: float
+    idle_timeout: float
+
+    def __init__(self, idle_timeout: float = 5 * 60, connect_timeout: float = 30):
+        """
+        Initialise an instance of the SSHPool class.
+        :param idle_timeout: The number of seconds an unused connection is kept open for.
+        :param connect_timeout: The number of seconds to wait for a new connection to be established.
+        """
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self._clients: Dict[Tuple[str, int, str], PooledClient] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def client(self, host: str, username: str, password: str, port: int = 22) -> Iterator[SSHClient]:
+        """
+        Check out a connected client for a host for the duration of the block, reusing a pooled connection if there is
+        a healthy one.
+        :param host: The address of the host.
+        :param username: The username to authenticate with.
+        :param password: The password to authenticate with.
+        :param port: The port the SSH server listens on.
+        :return: A connected and authenticated client. It belongs to the pool and must not be closed by the caller.
+        """
+        key = (host, port, username)
+        pooled = self._checkout(key, host, username, password, port)
+        try:
+            yield pooled.client
+        finally:
+            self._return(key, pooled)
+
+    def _checkout(self, key: Tuple[str, int, str], host: str, username: str, password: str, port: int) -> PooledClient:
+        self.evict_idle()
+        with self._lock:
+            pooled = self._clients.get(key)
+            if pooled is not None and pooled.password == password:
+                pooled.users += 1
+            else:
+                pooled = None
+        if pooled is not None:
+            if self._healthy(pooled.client):
+                return pooled
+            self._remove(key, pooled)
+            self._return(key, pooled)
+
+        client = SSHClient()
+        client.set_missing_host_key_policy(AutoAddPolicy())
+        client.connect(
+            host,
+            port=port,
+            username=username,
+            password=password,
+            timeout=self.connect_timeout,
+            banner_timeout=self.connect_timeout,
+            auth_timeout=self.connect_timeout,
+        )
+        pooled = PooledClient(client, password)
+        pooled.users = 1
+        with self._lock:
+            # Another thread may have connected to the host meanwhile, or its password may have changed
+            displaced = self._clients.get(key)
+            self._clients[key] = pooled
+        if displaced is not None:
+            self._return(key, displaced, checked_out=False)
+        return pooled
+
+    def _return(self, key: Tuple[str, int, str], pooled: PooledClient, checked_out: bool = True):
+        """
+        Hand a connection back to the pool, closing it if it is no longer pooled and nobody else is using it.
+        :param checked_out: False when the connection is not being handed back by a user, only checked for closing.
+        """
+        with self._lock:
+            if checked_out:
+                pooled.users -= 1
+                pooled.used = time.monotonic()
+            close = pooled.users == 0 and self._clients.get(key) is not pooled
+        if close:
+            pooled.client.close()
+
+    def _remove(self, key: Tuple[str, int, str], pooled: PooledClient):
+        with self._lock:
+            if self._clients.get(key) is pooled:
+                del self._clients[key]
+
+    @staticmethod
+    def _healthy(client: SSHClient) -> bool:
+        """
+        Check that a pooled connection is still usable by sending an SSH ignore message over it.
+        """
+        transport = client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        try:
+            transport.send_ignore()
+        except (EOFError, OSError, SSHException):
+            return False
+        return True
+
+    def discard(self, host: str, username: str, port: int = 22):
+        """
+        Remove the pooled connection for a host, e.g. after a command on it failed, closing it once nobody is using it.
+        """
+        key = (host, port, username)
+        with self._lock:
+            pooled = self._clients.pop(key, None)
+        if pooled is not None:
+            self._return(key, pooled, checked_out=False)
+
+    def evict_idle(self):
+        """
+        Close every connection that nobody has used for `idle_timeout` seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            idle = [
+                key for key, pooled in self._clients.items()
+                if pooled.users == 0 and now - pooled.used > self.idle_timeout
+            ]
+            clients = [self._clients.pop(key).client for key in idle]
+        for client in clients:
+            client.close()
+
+    def close_all(self):
+        """
+        Close every pooled connection.
+        """
+        with self._lock:
+            clients = [pooled.client for pooled in self._clients.values()]
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+
+# Pool shared by everything connecting to VMs and routers
+pool = SSHPool()
+atexit.register(pool.close_all)
+
+
+def run_sudo(
+    client: SSHClient,
+    script: str,
+    password: str,
+    timeout: Optional[float] = None,
+    sink: Optional[OutputSink] = None,
+) -> CommandOutput:
+    """
+    Run a shell script as root on a host with sudo.
+    The password is given to sudo on stdin so that it does not show up in the process list or logs.
+    :param client: The connected client for the host.
+    :param script: The script to be run by `sh -c`. Must not contain single quotes.
+    :param password: The password for sudo.
+    :param timeout: The number of seconds to wait for the script to finish. Waits forever if None.
+    :param sink: The sink the output of the script is streamed to, see `read_channel`.
+    :return: The output, errors and exit status of the script.
+    """
+    stdin, stdout, _ = client.exec_command(f"sudo -S -p '' sh -c '{script}'")
+    stdin.write(f'{password}\n')
+    stdin.flush()
+    stdin.channel.shutdown_write()
+    return read_channel(stdout.channel, timeout=timeout, sink=sink)
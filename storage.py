@@ -0,0 +1,221 @@
+# stdlib
+import json
+import re
+import statistics
+from typing import Any, Dict, List, Tuple
+# lib
+from paramiko import SSHClient, SSHException
+# local
+import settings
+from ssh import OutputSink, log_path, pool, read_channel, run_sudo
+from utils import run_concurrently
+
+# Installs fio if it is missing, then prints its path if it is available
+INSTALL_SCRIPT = '; '.join([
+    'command -v fio > /dev/null || DEBIAN_FRONTEND=noninteractive apt-get -q install -y fio > /dev/null 2>&1 '
+    '|| yum -y -q install fio > /dev/null 2>&1',
+    'command -v fio || true',
+])
+
+# The fio jobs run against each storage, read only so that the data on the storage is left untouched
+FIO_JOBS = {
+    'randread': '--rw=randread --bs=4k --iodepth=32',
+    'read': '--rw=read --bs=1M --iodepth=8',
+}
+
+# dd's summary, e.g. '1073741824 bytes (1.1 GB, 1.0 GiB) copied, 2.1 s, 511 MB/s'
+DD_SUMMARY = re.compile(r'(\d+) bytes .*copied, ([\d.]+) s')
+
+
+def parse_fio(output: str) -> Dict[str, Any]:
+    """
+    Parse the output of `fio --output-format=json` for a read job.
+    :param output: The JSON printed by fio.
+    :return: The IOPS, bandwidth in bytes per second and completion latency percentiles in milliseconds of the job.
+             'error' is set instead if the output could not be parsed.
+    """
+    try:
+        read = json.loads(output)['jobs'][0]['read']
+    except (ValueError, KeyError, IndexError):
+        return {'error': f'Could not parse fio output: {output.strip()[:200]}'}
+    percentiles = read.get('clat_ns', {}).get('percentile', {})
+    # Older releases of fio only report the bandwidth in KiB/s
+    bw_bytes = read.get('bw_bytes', read['bw'] * 1024 if 'bw' in read else None)
+    return {
+        'iops': read.get('iops'),
+        'bw_bytes': bw_bytes,
+        'lat_p50_ms': percentiles['50.000000'] / 1e6 if '50.000000' in percentiles else None,
+        'lat_p99_ms': percentiles['99.000000'] / 1e6 if '99.000000' in percentiles else None,
+        'lat_p999_ms': percentiles['99.900000'] / 1e6 if '99.900000' in percentiles else None,
+    }
+
+
+def parse_dd(output: str) -> Dict[str, Any]:
+    """
+    Parse the summary dd prints when it finishes.
+    :param output: The output of dd.
+    :return: The bandwidth in bytes per second. 'error' is set instead if the summary could not be found.
+    """
+    match = DD_SUMMARY.search(output)
+    if match is None or float(match.group(2)) == 0:
+        return {'error': f'Could not parse dd output: {output.strip()[:200]}'}
+    return {'bw_bytes': int(match.group(1)) / float(match.group(2))}
+
+
+def match_devices(storages: List[Dict[str, Any]], disks: List[Tuple[str, int]]) -> Dict[str, str]:
+    """
+    Work out which block device in a VM each of its storages is, by size.
+    :param storages: The storages of the VM, each with its 'name' and size in 'gb'.
+    :param disks: The name and size in bytes of each disk in the VM.
+    :return: The device path of each storage that could be matched, by storage name.
+    """
+    devices = {}
+    unmatched = list(disks)
+    for storage in sorted(storages, key=lambda storage: storage['gb'], reverse=True):
+        if not unmatched:
+            break
+        name, _ = min(unmatched, key=lambda disk: abs(disk[1] - storage['gb'] * 1024 ** 3))
+        unmatched = [disk for disk in unmatched if disk[0] != name]
+        devices[storage['name']] = f'/dev/{name}'
+    return devices
+
+
+class StorageBenchmark:
+    """
+    Class benchmarking the storages attached to VMs, on every VM at once.
+
+    Each storage is found among the VM's block devices by size and read with a fixed fio profile: 4k random reads for
+    IOPS and latency and 1M sequential reads for bandwidth. If fio is not available and cannot be installed, dd is used
+    to measure sequential bandwidth only. The storages of a VM are benchmarked one after another so that they do not
+    compete with each other.
+    """
+
+    password: str
+    runtime: int
+    username: str
+    workers: int
+
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        workers: int = settings.VALIDATOR_WORKERS,
+        runtime: int = 30,
+    ):
+        """
+        Initialise an instance of the StorageBenchmark class.
+        :param username: The username to log in to the VMs with.
+        :param password: The password to log in to the VMs and run sudo with.
+        :param workers: The maximum number of VMs to be benchmarked at once.
+        :param runtime: The number of seconds each fio job runs for.
+        """
+        self.username = username
+        self.password = password
+        self.workers = workers
+        self.runtime = runtime
+
+    def _disks(self, client: SSHClient) -> List[Tuple[str, int]]:
+        _, stdout, _ = client.exec_command('lsblk -bdno NAME,SIZE,TYPE')
+        disks = []
+        for line in read_channel(stdout.channel, timeout=60).output.splitlines():
+            fields = line.split()
+            if len(fields) == 3 and fields[2] == 'disk':
+                disks.append((fields[0], int(fields[1])))
+        return disks
+
+    def _benchmark(self, client: SSHClient, device: str, fio: bool, sink: OutputSink) -> Dict[str, Any]:
+        if not fio:
+            response = run_sudo(
+                client,
+                f'dd if={device} of=/dev/null bs=1M count=1024 iflag=direct 2>&1',
+                self.password,
+                timeout=10 * 60,
+                sink=sink,
+            )
+            return {'tool': 'dd', **parse_dd(response.output)}
+
+        result: Dict[str, Any] = {'tool': 'fio'}
+        for job, options in FIO_JOBS.items():
+            response = run_sudo(
+                client,
+                f'fio --name={job} --filename={device} --readonly --direct=1 --ioengine=libaio {options} '
+                f'--runtime={self.runtime} --time_based --output-format=json',
+                self.password,
+                timeout=self.runtime + 5 * 60,
+                sink=sink,
+            )
+            parsed = parse_fio(response.output)
+            if 'error' in parsed:
+                return {**result, **parsed}
+            if job == 'randread':
+                result.update({key: value for key, value in parsed.items() if key != 'bw_bytes'})
+            else:
+                result['bw_bytes'] = parsed['bw_bytes']
+        return result
+
+    def run(self, vm: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Benchmark every storage attached to a VM.
+        :param vm: The VM, a dict with its 'id', 'public_ip', 'server_id', 'storage_type_id' and 'storages'.
+        :return: The results for each storage.
+        """
+        results = [
+            {
+                'vm_id': vm['id'],
+                'server_id': vm['server_id'],
+                'storage_type_id': vm['storage_type_id'],
+                'storage': storage['name'],
+                'gb': storage['gb'],
+            }
+            for storage in vm['storages']
+        ]
+        sink = OutputSink(log_path(settings.VALIDATOR_SSH_LOG_DIR, vm['public_ip']), tail_size=64 * 1024)
+        try:
+            with pool.client(vm['public_ip'], self.username, self.password) as client:
+                fio = bool(run_sudo(client, INSTALL_SCRIPT, self.password, timeout=10 * 60).output.strip())
+                devices = match_devices(vm['storages'], self._disks(client))
+                for result in results:
+                    device = devices.get(result['storage'])
+                    if device is None:
+                        result['error'] = 'No block device found for the storage'
+                        continue
+                    result['device'] = device
+                    result.update(self._benchmark(client, device, fio, sink))
+        except (OSError, SSHException) as e:
+            pool.discard(vm['public_ip'], self.username)
+            for result in results:
+                result.setdefault('error', f'Could not connect: {e}')
+        finally:
+            sink.close()
+        return results
+
+    def run_all(self, vms: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Benchmark the storages of many VMs, up to `workers` VMs at once.
+        :param vms: The VMs, see `run`.
+        :return: The results for each storage of each VM.
+        """
+        results = run_concurrently([lambda vm=vm: self.run(vm) for vm in vms], self.workers)
+        return [result for vm_results in results for result in vm_results]
+
+
+def summarise(results: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Summarise storage benchmark results by storage type and server.
+    :param results: The results from `StorageBenchmark.run_all`.
+    :return: The number of storages benchmarked and the median IOPS, bandwidth and p99 latency of each group, by
+             'storage type <id> on server <id>'.
+    """
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for result in results:
+        if 'error' not in result:
+            name = f'storage type {result["storage_type_id"]} on server {result["server_id"]}'
+            groups.setdefault(name, []).append(result)
+
+    summary = {}
+    for name, group in sorted(groups.items()):
+        summary[name] = {'count': len(group)}
+        for field in ('iops', 'bw_bytes', 'lat_p99_ms'):
+            values = [result[field] for result in group if result.get(field) is not None]
+            summary[name][field] = statistics.median(values) if values else None
+    return summary
@@ -0,0 +1,29 @@
+# stdlib
+import os
+import sys
+# lib
+import pytest
+
+# The validator's modules are imported from the root of the repository. It is added to the end of the path rather than
+# the start, as its `dataclasses` package would otherwise hide the standard library's from pytest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+# local
+import clock  # noqa: E402
+import settings  # noqa: E402
+
+# The cloudcix client refuses to be imported without API URLs, which are only filled in to run against a region
+settings.CLOUDCIX_API_URL = settings.CLOUDCIX_API_URL or 'https://api.example.com/'
+settings.CLOUDCIX_API_V2_URL = settings.CLOUDCIX_API_V2_URL or 'https://api.example.com/'
+
+
+@pytest.fixture
+def virtual():
+    """
+    Wait on a virtual clock starting at 0 for the duration of the test.
+    """
+    virtual_clock = clock.VirtualClock(start=0)
+    clock.install(virtual_clock)
+    yield virtual_clock
+    clock.install(clock.Clock())
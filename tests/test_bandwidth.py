@@ -0,0 +1,115 @@
+# stdlib
+import itertools
+import json
+# lib
+import pytest
+
+pytest.importorskip('cloudcix')
+# local
+import bandwidth  # noqa: E402
+from bandwidth import OPEN, SERVICE_PORTS, BandwidthTester, east_west_matrix, parse_iperf, round_robin  # noqa: E402
+
+
+@pytest.mark.parametrize('count', [2, 3, 4, 5, 8])
+def test_round_robin_covers_every_flow_once(count):
+    ids = list(range(1, count + 1))
+    rounds = round_robin(ids)
+    flows = [flow for pairs in rounds for flow in pairs]
+    assert sorted(flows) == sorted(itertools.permutations(ids, 2))
+    assert len(rounds) == (2 * (count - 1) if count % 2 == 0 else 2 * count)
+    for pairs in rounds:
+        vms = [vm for pair in pairs for vm in pair]
+        # Every VM takes part in at most one flow per round
+        assert len(vms) == len(set(vms))
+
+
+def test_round_robin_of_one_vm():
+    assert all(pairs == [] for pairs in round_robin([1]))
+
+
+def test_parse_tcp():
+    output = json.dumps({
+        'end': {
+            'sum_sent': {'bits_per_second': 940e6, 'retransmits': 12},
+            'sum_received': {'bits_per_second': 935e6, 'bytes': 1168750000},
+        },
+    })
+    assert parse_iperf(output) == {
+        'sent_bps': 940e6,
+        'received_bps': 935e6,
+        'received_bytes': 1168750000,
+        'retransmits': 12,
+    }
+
+
+def test_parse_udp():
+    output = json.dumps({
+        'end': {'sum': {'bits_per_second': 100e6, 'bytes': 125000000, 'jitter_ms': 0.03, 'lost_percent': 0.1}},
+    })
+    assert parse_iperf(output) == {
+        'sent_bps': 100e6,
+        'received_bps': 100e6,
+        'received_bytes': 125000000,
+        'jitter_ms': 0.03,
+        'lost_percent': 0.1,
+    }
+
+
+def test_parse_udp_with_each_direction():
+    output = json.dumps({
+        'start': {'test_start': {'protocol': 'UDP'}},
+        'end': {
+            'sum': {'bits_per_second': 99e6, 'bytes': 123750000, 'jitter_ms': 0.03, 'lost_percent': 1.0},
+            'sum_sent': {'bits_per_second': 100e6, 'bytes': 125000000, 'jitter_ms': 0, 'lost_percent': 0},
+            'sum_received': {'bits_per_second': 99e6, 'bytes': 123750000, 'jitter_ms': 0.03, 'lost_percent': 1.0},
+        },
+    })
+    assert parse_iperf(output) == {
+        'sent_bps': 100e6,
+        'received_bps': 99e6,
+        'received_bytes': 123750000,
+        'jitter_ms': 0.03,
+        'lost_percent': 1.0,
+    }
+
+
+def test_parse_errors():
+    assert parse_iperf(json.dumps({'error': 'unable to connect to server'})) == {
+        'error': 'unable to connect to server',
+    }
+    assert parse_iperf('bash: iperf3: command not found')['error'].startswith('Could not parse iperf3 output')
+
+
+def test_east_west_matrix():
+    vms = [{'id': 2, 'server_id': 1}, {'id': 1, 'server_id': 1}, {'id': 3, 'server_id': 2}]
+    flows = {(a, b): {'received_bps': 1e9} for a, b in itertools.permutations([1, 2, 3], 2)}
+    flows[(1, 3)] = {'error': 'Timed out'}
+    assert [line.split() for line in east_west_matrix(vms, flows) if line] == [
+        ['from/to', '1@1', '2@1', '3@2'],
+        ['1@1', '-', '1000.0', '-'],
+        ['2@1', '1000.0', '-', '1000.0'],
+        ['3@2', '1000.0', '1000.0', '-'],
+        ['from/to', 'server', '1', 'server', '2'],
+        ['server', '1', '1000.0', '1000.0'],
+        ['server', '2', '1000.0', '-'],
+    ]
+
+
+def test_aggregate_only_counts_tcp_tests(monkeypatch):
+    now = [0.0]
+    tests = []
+
+    def run_iperf(ip, duration, parallel=4, udp=False):
+        tests.append((ip, 'udp' if udp else 'tcp'))
+        now[0] += duration
+        return {'jitter_ms': 0.1, 'lost_percent': 0.0} if udp else {'received_bps': 8e6, 'received_bytes': 10e6}
+
+    monkeypatch.setattr(bandwidth, 'run_iperf', run_iperf)
+    monkeypatch.setattr(bandwidth.time, 'time', lambda: now[0])
+    ports = {ip: {port: (OPEN, 0.001) for port in SERVICE_PORTS} for ip in ('10.0.0.1', '10.0.0.2')}
+    results, aggregate = BandwidthTester(duration=10).test_all({1: '10.0.0.1', 2: '10.0.0.2'}, ports)
+
+    # Both TCP tests run before either UDP test, and the 20s they take are all the aggregate is measured over
+    assert [test for _, test in tests] == ['tcp', 'tcp', 'udp', 'udp']
+    assert aggregate == 2 * 10e6 * 8 / 20
+    assert [result.error for result in results] == [None, None]
@@ -0,0 +1,112 @@
+# stdlib
+import json
+from typing import Any, List, Union
+# lib
+import pytest
+import requests
+# local
+import calls
+import clock
+from calls import APIError, backoff, call
+
+
+def response(status_code: int, body: Any = None) -> requests.Response:
+    result = requests.Response()
+    result.status_code = status_code
+    result._content = json.dumps(body or {}).encode()
+    return result
+
+
+class FakeMethod:
+    """
+    An API method answering each call with the next of the given responses, or raising it if it is an error.
+    """
+
+    def __init__(self, *outcomes: Union[requests.Response, Exception]):
+        self.outcomes = list(outcomes)
+        self.calls: List[dict] = []
+
+    def __call__(self, **kwargs) -> requests.Response:
+        self.calls.append(kwargs)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> List[float]:
+    waited: List[float] = []
+    monkeypatch.setattr(clock, 'sleep', waited.append)
+    return waited
+
+
+def test_success_is_returned(sleeps):
+    method = FakeMethod(response(200, {'content': 1}))
+    assert call('read VM #1', method, token='t', pk=1).json() == {'content': 1}
+    assert method.calls == [{'token': 't', 'pk': 1}]
+    assert sleeps == []
+
+
+def test_transient_errors_are_retried(sleeps):
+    method = FakeMethod(response(503), requests.ConnectionError('reset'), response(429), response(200))
+    assert call('read VM #1', method, retries=3).status_code == 200
+    assert len(method.calls) == 4
+    assert len(sleeps) == 3
+
+
+def test_retries_run_out(sleeps):
+    method = FakeMethod(response(502), response(502), response(502))
+    with pytest.raises(APIError) as error:
+        call('read VM #1', method, retries=2)
+    assert error.value.status_code == 502
+    assert len(method.calls) == 3
+
+
+def test_client_errors_are_not_retried(sleeps):
+    method = FakeMethod(response(400, {'error_code': 'bad'}))
+    with pytest.raises(APIError) as error:
+        call('update project', method)
+    assert error.value.status_code == 400
+    assert 'bad' in error.value.detail
+    assert sleeps == []
+
+
+def test_ok_statuses_can_be_overridden(sleeps):
+    assert call('create project', FakeMethod(response(201)), ok=(201,)).status_code == 201
+    with pytest.raises(APIError):
+        call('create project', FakeMethod(response(200)), ok=(201,))
+
+
+@pytest.mark.parametrize('error', [requests.ConnectTimeout('timed out'), response(429)])
+def test_non_idempotent_calls_are_retried_if_they_did_not_reach_the_api(sleeps, error):
+    method = FakeMethod(error, response(201))
+    assert call('create project', method, ok=(201,), idempotent=False).status_code == 201
+    assert len(method.calls) == 2
+
+
+@pytest.mark.parametrize('error', [requests.ConnectionError('reset'), requests.ReadTimeout('timed out'), response(503)])
+def test_non_idempotent_calls_are_not_retried_if_they_may_have_reached_the_api(sleeps, error):
+    method = FakeMethod(error, response(201))
+    with pytest.raises(APIError):
+        call('create project', method, ok=(201,), idempotent=False)
+    assert len(method.calls) == 1
+    assert sleeps == []
+
+
+def test_connection_errors_have_no_status(sleeps):
+    with pytest.raises(APIError) as error:
+        call('read VM #1', FakeMethod(requests.ConnectionError('refused')), retries=0)
+    assert error.value.status_code is None
+    assert 'no response' in str(error.value)
+
+
+def test_backoff_doubles_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(calls.random, 'uniform', lambda low, high: high)
+    assert [backoff(attempt, base=1, cap=30) for attempt in range(7)] == [1, 2, 4, 8, 16, 30, 30]
+
+
+def test_backoff_is_jittered():
+    waits = [backoff(3, base=1) for _ in range(100)]
+    assert all(0 <= wait <= 8 for wait in waits)
+    assert len(set(waits)) > 1
@@ -0,0 +1,85 @@
+# stdlib
+import asyncio
+import time
+# local
+import clock
+
+
+def test_sleep_skips_ahead(virtual):
+    started = time.monotonic()
+    clock.sleep(3600)
+    assert clock.monotonic() == 3600
+    assert time.monotonic() - started < 1
+
+
+def test_time_stands_still_while_a_thread_works(virtual):
+    seen = []
+
+    def work():
+        before = clock.monotonic()
+        time.sleep(0.05)
+        seen.append((before, clock.monotonic()))
+
+    sleeper = clock.Thread(target=lambda: clock.sleep(3600))
+    worker = clock.Thread(target=work)
+    sleeper.start()
+    worker.start()
+    sleeper.join()
+    worker.join()
+    assert seen == [(0, 0)]
+    assert clock.monotonic() == 3600
+
+
+def test_lock_waiters_let_the_holder_wait(virtual):
+    lock = clock.Lock()
+    order = []
+
+    def hold(name: str, seconds: float):
+        with lock:
+            order.append((name, clock.monotonic()))
+            clock.sleep(seconds)
+
+    threads = [clock.Thread(target=hold, args=(name, 10)) for name in 'abc']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert order == [('a', 0), ('b', 10), ('c', 20)]
+
+
+def test_join_timeout_is_in_clock_time(virtual):
+    thread = clock.Thread(target=lambda: clock.sleep(60))
+    thread.start()
+    thread.join(5)
+    assert clock.monotonic() == 5
+    assert thread.is_alive()
+    thread.join()
+    assert clock.monotonic() == 60
+
+
+def test_event_loops_wait_on_the_clock(virtual):
+    async def wait() -> bool:
+        try:
+            await asyncio.wait_for(asyncio.sleep(600), 30)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    assert asyncio.run(wait()) is False
+    assert clock.monotonic() == 30
+
+
+def test_real_clock_threads_and_locks():
+    lock = clock.Lock()
+    results = []
+
+    def add():
+        with lock:
+            results.append(clock.monotonic())
+
+    threads = [clock.Thread(target=add) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 3
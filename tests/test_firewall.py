@@ -0,0 +1,96 @@
+# stdlib
+import asyncio
+# local
+import firewall
+import prober
+
+SOURCE = '203.0.113.5'
+
+
+def rule(allow: bool, protocol: str = 'any', port: str = '', source: str = '*', destination: str = '10.0.0.0/24'):
+    return {
+        'allow': allow,
+        'protocol': protocol,
+        'port': port,
+        'source': source,
+        'destination': destination,
+        'description': '',
+        'pci_logging': False,
+        'debug_logging': False,
+    }
+
+
+def vm(private: str, public: str, service_port=22):
+    return {
+        'ip_addresses': [
+            {'address': private, 'public_ip': {'address': public}},
+            {'address': '192.168.0.2', 'public_ip': None},
+        ],
+        'service_port': service_port,
+    }
+
+
+def test_first_matching_rule_decides():
+    rules = [rule(False, 'tcp', '22'), rule(True)]
+    assert not firewall.expected(rules, SOURCE, ('198.18.0.2', '10.0.0.2', 'tcp', 22))
+    assert firewall.expected(rules, SOURCE, ('198.18.0.2', '10.0.0.2', 'tcp', 80))
+    assert firewall.expected(rules, SOURCE, ('198.18.0.2', '10.0.0.2', 'icmp', None))
+
+
+def test_unmatched_traffic_is_blocked():
+    rules = [rule(True, 'tcp', '80-90'), rule(True, destination='10.0.1.0/24')]
+    assert firewall.expected(rules, SOURCE, ('198.18.0.2', '10.0.0.2', 'tcp', 85))
+    assert not firewall.expected(rules, SOURCE, ('198.18.0.2', '10.0.0.2', 'tcp', 91))
+    assert not firewall.expected(rules, SOURCE, ('198.18.0.2', '10.0.0.2', 'udp', 85))
+
+
+def test_rules_from_other_sources_only_apply_to_a_known_source():
+    rules = [rule(True, source='203.0.113.0/24')]
+    probe = ('198.18.0.2', '10.0.0.2', 'icmp', None)
+    assert firewall.expected(rules, SOURCE, probe)
+    assert not firewall.expected(rules, '198.51.100.1', probe)
+    assert not firewall.expected(rules, '', probe)
+
+
+def test_plan_probes_each_rule_once():
+    rules = [
+        rule(True, 'tcp', '8000-8080'),
+        rule(False, 'udp', '53', destination='10.0.0.3/32'),
+        rule(True),
+    ]
+    vms = [vm('10.0.0.2', '198.18.0.2'), vm('10.0.0.3', '198.18.0.3', service_port=3389)]
+    assert firewall.plan(rules, vms, SOURCE) == {
+        ('198.18.0.2', '10.0.0.2', 'tcp', 8000): True,
+        ('198.18.0.3', '10.0.0.3', 'udp', 53): False,
+        ('198.18.0.2', '10.0.0.2', 'tcp', 22): True,
+    }
+
+
+def test_plan_pings_vms_without_a_service():
+    vms = [vm('10.0.0.2', '198.18.0.2', service_port=None)]
+    assert firewall.plan([rule(True)], vms, SOURCE) == {('198.18.0.2', '10.0.0.2', 'icmp', None): True}
+
+
+def test_plan_skips_rules_it_cannot_probe():
+    rules = [
+        # Traffic from elsewhere
+        rule(True, source='198.51.100.0/24'),
+        # No VM in the destination
+        rule(True, destination='10.9.0.0/24'),
+    ]
+    assert firewall.plan(rules, [vm('10.0.0.2', '198.18.0.2')], SOURCE) == {}
+
+
+def test_verify_compares_outcomes(monkeypatch):
+    # Only SSH gets through
+    monkeypatch.setattr(prober, 'responder', lambda ip, protocol, port: protocol == 'tcp' and port == 22)
+    probes = {
+        ('198.18.0.2', '10.0.0.2', 'tcp', 22): True,
+        ('198.18.0.2', '10.0.0.2', 'icmp', None): True,
+        ('198.18.0.2', '10.0.0.2', 'tcp', 80): False,
+    }
+    assert asyncio.run(firewall.verify(probes)) == {
+        ('198.18.0.2', '10.0.0.2', 'tcp', 22): True,
+        ('198.18.0.2', '10.0.0.2', 'icmp', None): False,
+        ('198.18.0.2', '10.0.0.2', 'tcp', 80): True,
+    }
@@ -0,0 +1,61 @@
+# lib
+import pytest
+# local
+from metrics import NO_PHASE, CallRecorder, Histogram
+
+
+def test_empty_histogram():
+    histogram = Histogram()
+    assert histogram.percentile(50) is None
+    summary = histogram.to_dict()
+    assert summary['count'] == 0
+    assert summary['mean'] is None
+    assert summary['max'] is None
+
+
+def test_percentiles_are_within_ten_percent():
+    histogram = Histogram()
+    for millisecond in range(1, 1001):
+        histogram.add(millisecond / 1000)
+    for percent in (50, 90, 99):
+        exact = percent / 100
+        assert exact <= histogram.percentile(percent) <= exact * 1.1
+    assert histogram.count == 1000
+    assert histogram.total == pytest.approx(500.5)
+
+
+def test_percentiles_never_exceed_the_longest():
+    histogram = Histogram()
+    histogram.add(0.0005)
+    histogram.add(0.2)
+    assert histogram.percentile(50) == 0.001
+    assert histogram.percentile(100) == 0.2
+
+
+def test_merging_is_the_same_as_adding():
+    seconds = [0.01, 0.02, 0.5, 1.5, 0.003]
+    merged, first, second = Histogram(), Histogram(), Histogram()
+    for value in seconds:
+        merged.add(value)
+    for value in seconds[:2]:
+        first.add(value)
+    for value in seconds[2:]:
+        second.add(value)
+    first.merge(second)
+    assert first.buckets == merged.buckets
+    assert first.count == merged.count
+    assert first.total == pytest.approx(merged.total)
+    assert first.longest == merged.longest
+
+
+def test_calls_are_recorded_by_phase_and_endpoint():
+    recorder = CallRecorder()
+    recorder.record('IAAS.vm.read', 200, 0, 100, 0.05)
+    with recorder.phase('create'):
+        recorder.record('IAAS.cloud.create', 201, 2000, 500, 0.5)
+        recorder.record('IAAS.vm.read', 503, 0, 30, 0.1)
+    recorded = recorder.to_dict()
+    assert list(recorded['phases']) == [NO_PHASE, 'create']
+    assert recorded['phases']['create']['calls'] == 2
+    assert recorded['endpoints']['IAAS.vm.read']['statuses'] == {'200': 1, '503': 1}
+    assert recorded['by_phase']['create']['IAAS.cloud.create']['sent_bytes'] == 2000
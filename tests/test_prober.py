@@ -0,0 +1,46 @@
+# stdlib
+import asyncio
+import struct
+from typing import List, Tuple
+# local
+from prober import ICMP_ECHO_REPLY, Prober
+
+
+class FakeSocket:
+    """
+    A raw ICMP socket that has received the given packets.
+    """
+
+    def __init__(self, packets: List[Tuple[bytes, Tuple[str, int]]]):
+        self.packets = packets
+
+    def recvfrom(self, size: int) -> Tuple[bytes, Tuple[str, int]]:
+        if not self.packets:
+            raise BlockingIOError
+        return self.packets.pop(0)
+
+
+def reply(ident: int, sequence: int) -> bytes:
+    # A 20 byte IP header, as raw sockets receive it, followed by the echo reply
+    return b'\x45' + b'\x00' * 19 + struct.pack('!BBHHH', ICMP_ECHO_REPLY, 0, 0, ident, sequence)
+
+
+def test_probers_have_their_own_identifiers():
+    assert len({Prober()._ident for _ in range(10)}) == 10
+
+
+def test_replies_to_another_prober_are_ignored():
+    async def receive() -> Tuple[bool, bool]:
+        prober, other = Prober(), Prober()
+        loop = asyncio.get_running_loop()
+        mine, theirs = loop.create_future(), loop.create_future()
+        prober._waiting = {('10.0.0.1', 0): mine, ('10.0.0.2', 0): theirs}
+        prober._raw = True
+        prober._socket = FakeSocket([  # type: ignore
+            (reply(other._ident, 0), ('10.0.0.2', 0)),
+            (reply(prober._ident, 0), ('10.0.0.1', 0)),
+        ])
+        prober._receive()
+        return mine.done(), theirs.done()
+
+    assert asyncio.run(receive()) == (True, False)
@@ -0,0 +1,55 @@
+# lib
+import pytest
+# local
+import clock
+from ratelimit import RateLimiter, TokenBucket
+
+
+def test_bucket_spaces_requests_to_the_rate():
+    bucket = TokenBucket(rate=2, burst=1)
+    assert [bucket.reserve(0) for _ in range(4)] == [0, 0.5, 1.0, 1.5]
+
+
+def test_bucket_lets_a_burst_through():
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.reserve(0) for _ in range(5)] == [0, 0, 0, 0.5, 1.0]
+
+
+def test_bucket_refills_after_a_quiet_spell():
+    bucket = TokenBucket(rate=2, burst=3)
+    for _ in range(5):
+        bucket.reserve(0)
+    assert [bucket.reserve(10) for _ in range(4)] == [10, 10, 10, 10.5]
+
+
+def test_bucket_does_not_save_up_more_than_a_burst():
+    bucket = TokenBucket(rate=1, burst=2)
+    assert [bucket.reserve(100) for _ in range(3)] == [100, 100, 101]
+
+
+def test_limiter_holds_calls_back(virtual):
+    limiter = RateLimiter(rate=10, burst=1, endpoints={'IAAS.cloud.create': 0.5})
+    delays = [limiter.acquire('IAAS.cloud.create') for _ in range(3)]
+    assert delays == [0, 2, 2]
+    assert clock.monotonic() == 4
+    # Other endpoints are only held to the overall rate
+    assert limiter.acquire('IAAS.vm.read') == pytest.approx(0.1)
+    stats = limiter.delays['IAAS.cloud.create']
+    assert (stats.calls, stats.held, stats.total, stats.longest) == (3, 2, 4, 2)
+
+
+def test_limiter_without_limits_never_waits(virtual):
+    limiter = RateLimiter(rate=0, endpoints={})
+    assert [limiter.acquire('IAAS.vm.read') for _ in range(100)] == [0] * 100
+    assert clock.monotonic() == 0
+
+
+def test_report_averages_over_calls_held_back(virtual, capsys):
+    limiter = RateLimiter(rate=0, burst=1, endpoints={'IAAS.cloud.create': 0.5})
+    for _ in range(2):
+        limiter.acquire('IAAS.cloud.create')
+    limiter.acquire('IAAS.vm.read')
+    limiter.report()
+    assert capsys.readouterr().out == (
+        ' - IAAS.cloud.create: 1 of 2 calls held back, for 2000ms on average and 2000ms at longest\n'
+    )
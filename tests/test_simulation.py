@@ -0,0 +1,55 @@
+# stdlib
+import subprocess
+import sys
+# lib
+import pytest
+# local
+from conftest import ROOT
+
+pytest.importorskip('cloudcix')
+
+# Runs Validator Light against a seeded simulator on a virtual clock, printing how long the run took on that clock
+LIGHT = '''
+import os
+import sys
+# paramiko's cryptography needs the standard library's dataclasses, which the repository's package hides once imported
+# from the repository
+root = sys.path.pop(0)
+import paramiko  # noqa: F401
+sys.path.insert(0, root)
+sys.modules.pop('dataclasses', None)
+import settings
+settings.CLOUDCIX_API_URL = settings.CLOUDCIX_API_V2_URL = 'https://api.example.com/'
+import clock
+from simulator import Simulator
+from transport import transport
+transport.install()
+clock.install(clock.VirtualClock())
+Simulator(seed=1).install(transport)
+import validator
+os.system = lambda command: 0
+started = clock.monotonic()
+validator.validator_light('1')
+print(f'Validator Light took {clock.monotonic() - started:.6f} seconds')
+'''
+
+
+def run_light() -> str:
+    result = subprocess.run(
+        [sys.executable, '-c', LIGHT],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+
+def test_light_repeats_exactly():
+    first = run_light()
+    assert 'Timelines' in first
+    assert 'Validator Light took' in first
+    # Red lines are failed checks
+    assert '\033[91m' not in first
+    assert run_light() == first
@@ -0,0 +1,83 @@
+# lib
+import pytest
+
+ssh = pytest.importorskip('ssh')
+
+
+class FakeTransport:
+    def is_active(self) -> bool:
+        return True
+
+    def send_ignore(self):
+        pass
+
+
+class FakeClient:
+    """
+    An SSH client that connects without a network.
+    """
+
+    def __init__(self):
+        self.closed = False
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, host: str, **kwargs):
+        pass
+
+    def get_transport(self) -> FakeTransport:
+        return FakeTransport()
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(ssh, 'SSHClient', FakeClient)
+    return ssh.SSHPool(idle_timeout=60)
+
+
+def test_connections_are_reused(pool):
+    with pool.client('10.0.0.1', 'user', 'secret') as first:
+        pass
+    with pool.client('10.0.0.1', 'user', 'secret') as second:
+        pass
+    assert first is second
+    assert not first.closed
+
+
+def test_connections_in_use_are_not_evicted(pool, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ssh.time, 'monotonic', lambda: now[0])
+    with pool.client('10.0.0.1', 'user', 'secret') as client:
+        # A long command, e.g. iperf3, outlasting the idle timeout
+        now[0] += 600
+        pool.evict_idle()
+        assert not client.closed
+    # The connection was last used when the command finished
+    now[0] += 30
+    pool.evict_idle()
+    assert not client.closed
+    now[0] += 60
+    pool.evict_idle()
+    assert client.closed
+
+
+def test_displaced_connections_are_closed(pool):
+    with pool.client('10.0.0.1', 'user', 'old') as old:
+        with pool.client('10.0.0.1', 'user', 'new') as new:
+            # Still in use by the outer block
+            assert not old.closed
+        assert not new.closed
+    assert old.closed
+    with pool.client('10.0.0.1', 'user', 'new') as reused:
+        assert reused is new
+
+
+def test_discarded_connections_are_closed_once_unused(pool):
+    with pool.client('10.0.0.1', 'user', 'secret') as client:
+        pool.discard('10.0.0.1', 'user')
+        assert not client.closed
+    assert client.closed
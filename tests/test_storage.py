@@ -0,0 +1,65 @@
+# stdlib
+import json
+# lib
+import pytest
+
+pytest.importorskip('cloudcix')
+# local
+from storage import match_devices, parse_dd, parse_fio  # noqa: E402
+
+
+def fio_output(read):
+    return json.dumps({'jobs': [{'jobname': 'randread', 'read': read}]})
+
+
+def test_parse_fio():
+    output = fio_output({
+        'iops': 25000.5,
+        'bw_bytes': 102402048,
+        'bw': 100002,
+        'clat_ns': {'percentile': {'50.000000': 1171456, '99.000000': 2506752, '99.900000': 4292608}},
+    })
+    assert parse_fio(output) == {
+        'iops': 25000.5,
+        'bw_bytes': 102402048,
+        'lat_p50_ms': pytest.approx(1.171456),
+        'lat_p99_ms': pytest.approx(2.506752),
+        'lat_p999_ms': pytest.approx(4.292608),
+    }
+
+
+def test_parse_fio_bandwidth_in_kib():
+    # Older releases of fio only report the bandwidth in KiB/s, and no percentiles unless asked for them
+    assert parse_fio(fio_output({'iops': 100.0, 'bw': 400})) == {
+        'iops': 100.0,
+        'bw_bytes': 409600,
+        'lat_p50_ms': None,
+        'lat_p99_ms': None,
+        'lat_p999_ms': None,
+    }
+    assert parse_fio(fio_output({'iops': 100.0}))['bw_bytes'] is None
+
+
+def test_parse_fio_errors():
+    assert parse_fio('fio: command not found')['error'].startswith('Could not parse fio output')
+    assert 'error' in parse_fio(json.dumps({'jobs': []}))
+
+
+def test_parse_dd():
+    output = '1024+0 records in\n1024+0 records out\n1073741824 bytes (1.1 GB, 1.0 GiB) copied, 2.0 s, 537 MB/s\n'
+    assert parse_dd(output) == {'bw_bytes': 1073741824 / 2.0}
+    assert parse_dd("dd: failed to open '/dev/vdb': Permission denied")['error'].startswith('Could not parse dd')
+    assert 'error' in parse_dd('1024 bytes (1.0 kB, 1.0 KiB) copied, 0 s, inf B/s')
+
+
+def test_match_devices():
+    storages = [{'name': 'HDD', 'gb': 50}, {'name': 'Data', 'gb': 100}]
+    # Disks are a little larger or smaller than the storage they were made for
+    disks = [('vda', 50 * 1024 ** 3 + 1048576), ('vdb', 100 * 1024 ** 3 - 1048576), ('vdc', 10 * 1024 ** 3)]
+    assert match_devices(storages, disks) == {'Data': '/dev/vdb', 'HDD': '/dev/vda'}
+
+
+def test_match_devices_with_fewer_disks():
+    storages = [{'name': 'HDD', 'gb': 50}, {'name': 'Data', 'gb': 100}]
+    assert match_devices(storages, [('vda', 50 * 1024 ** 3)]) == {'Data': '/dev/vda'}
+    assert match_devices(storages, []) == {}
@@ -0,0 +1,72 @@
+# stdlib
+import json
+# lib
+import pytest
+import requests
+
+pytest.importorskip('cloudcix')
+# local
+import utils  # noqa: E402
+from calls import APIError  # noqa: E402
+from tokens import TokenManager  # noqa: E402
+
+
+def manager(created):
+    tokens = TokenManager(lifetime=60 * 60, refresh_margin=10 * 60)
+
+    def creator(kind):
+        def create():
+            created.append(kind)
+            return f'{kind}-{len(created)}'
+        return create
+
+    tokens._creators = {kind: creator(kind) for kind in tokens._creators}
+    return tokens
+
+
+def test_tokens_are_cached(virtual):
+    created = []
+    tokens = manager(created)
+    assert tokens.admin == 'admin-1'
+    assert tokens.admin == 'admin-1'
+    virtual.sleep(60 * 60)
+    assert tokens.admin == 'admin-2'
+    assert created == ['admin', 'admin']
+
+
+def test_refresh_skips_tokens_never_asked_for():
+    created = []
+    tokens = manager(created)
+    tokens.admin
+    tokens.start()
+    tokens.stop()
+    assert created == ['admin']
+
+
+def test_token_creation_is_retried(virtual, monkeypatch):
+    statuses = [502, 502, 201]
+    sent = []
+
+    def create(**kwargs):
+        sent.append(kwargs)
+        result = requests.Response()
+        result.status_code = statuses.pop(0)
+        result._content = json.dumps({'token': 'admin'} if result.status_code == 201 else {}).encode()
+        return result
+
+    monkeypatch.setattr(utils.api.Membership.token, 'create', create)
+    assert TokenManager().admin == 'admin'
+    assert len(sent) == 3
+
+
+def test_failure_to_create_a_token_is_an_api_error(virtual, monkeypatch):
+    def create(**kwargs):
+        result = requests.Response()
+        result.status_code = 502
+        result._content = b'Bad Gateway'
+        return result
+
+    monkeypatch.setattr(utils.api.Membership.token, 'create', create)
+    with pytest.raises(APIError) as error:
+        TokenManager().robot
+    assert error.value.status_code == 502
@@ -0,0 +1,116 @@
+# stdlib
+import threading
+from typing import Callable, Dict, Optional, Tuple
+# local
+import clock
+from calls import APIError
+from settings import VALIDATOR_TOKEN_LIFETIME
+from utils import get_admin_token, get_robot_token
+
+
+class TokenManager:
+    """
+    Class handing out the admin and robot tokens to everything that calls the cloudcix API.
+
+    Each token is created once and cached. Once `start`ed, a background thread creates a new token `refresh_margin`
+    seconds before the cached one expires, so that callers never wait for a token or use an expired one. Without the
+    thread, a token is created by the first caller to ask for it after it expires.
+    """
+
+    lifetime: float
+    refresh_margin: float
+    tokens: Dict[str, Tuple[str, float]]
+
+    def __init__(self, lifetime: float = VALIDATOR_TOKEN_LIFETIME, refresh_margin: float = 10 * 60):
+        """
+        Initialise an instance of the TokenManager class.
+        :param lifetime: The number of seconds a token is valid for after it is created.
+        :param refresh_margin: The number of seconds before a token expires that the background thread replaces it.
+        """
+        self.lifetime = lifetime
+        self.refresh_margin = refresh_margin
+        self.tokens = {}
+        self._creators: Dict[str, Callable[[], str]] = {'admin': get_admin_token, 'robot': get_robot_token}
+        self._locks = {kind: clock.Lock() for kind in self._creators}
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def admin(self) -> str:
+        """
+        The admin token, for the validator's own projects.
+        """
+        return self.get('admin')
+
+    @property
+    def robot(self) -> str:
+        """
+        The robot token, for reading resources across the region.
+        """
+        return self.get('robot')
+
+    def get(self, kind: str) -> str:
+        """
+        Get a token, creating it if it is not cached or has expired.
+        :param kind: Either 'admin' or 'robot'.
+        :return: The token.
+        """
+        cached = self.tokens.get(kind)
+        if cached is not None and clock.monotonic() < cached[1]:
+            return cached[0]
+        with self._locks[kind]:
+            # Another thread may have created the token while this one waited for the lock
+            cached = self.tokens.get(kind)
+            if cached is not None and clock.monotonic() < cached[1]:
+                return cached[0]
+            return self.refresh(kind)
+
+    def refresh(self, kind: str) -> str:
+        """
+        Create a new token and cache it, whether or not the cached one has expired.
+        :param kind: Either 'admin' or 'robot'.
+        :return: The new token.
+        :raises APIError: If the token could not be created.
+        """
+        created = clock.monotonic()
+        token = self._creators[kind]()
+        self.tokens[kind] = (token, created + self.lifetime)
+        return token
+
+    def start(self):
+        """
+        Start the background thread replacing tokens before they expire.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='token-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            # Only tokens that have been asked for are kept fresh, so no robot token is created for runs not using one
+            for kind, (_, expires) in list(self.tokens.items()):
+                if clock.monotonic() < expires - self.refresh_margin:
+                    continue
+                try:
+                    with self._locks[kind]:
+                        self.refresh(kind)
+                except APIError as e:
+                    # Callers still create the token themselves once it expires, so try again shortly
+                    print(f'\r\033[91m - Could not refresh the {kind} token: {e} \033[0m')
+            due = min(expires for _, expires in self.tokens.values()) - self.refresh_margin if self.tokens else 0
+            self._stopped.wait(max(30.0, due - clock.monotonic()))
+
+
+# Tokens shared by the whole validator
+tokens = TokenManager()
@@ -0,0 +1,163 @@
+# stdlib
+import os
+from typing import List, Optional, Tuple
+from urllib.parse import urlsplit
+# lib
+import requests
+import requests.api
+from requests.adapters import HTTPAdapter
+# local
+import clock
+from metrics import CallRecorder
+from ratelimit import RateLimiter
+from settings import VALIDATOR_API_REPORT, VALIDATOR_HTTP_POOL_SIZE
+# cloudcix
+os.environ['CLOUDCIX_SETTINGS_MODULE'] = 'settings'
+from cloudcix import api  # noqa: E402
+
+# The name of the client method sending each HTTP method. A GET without an ID is a `list`
+OPERATIONS = {
+    'GET': 'read',
+    'HEAD': 'head',
+    'POST': 'create',
+    'PUT': 'update',
+    'PATCH': 'partial_update',
+    'DELETE': 'delete',
+}
+
+
+class TimedSession(requests.Session):
+    """
+    Session recording every request it sends against the endpoint it is for, and holding requests back to the rate
+    limits if it has a limiter.
+    """
+
+    def __init__(self, limiter: Optional[RateLimiter] = None, recorder: Optional[CallRecorder] = None):
+        super().__init__()
+        self.limiter = limiter
+        self.recorder = recorder or CallRecorder()
+        # The name of the cloudcix client sending requests to each URL, e.g. 'IAAS.vm', longest URL first
+        self.clients: List[Tuple[str, str]] = []
+
+    def resolve(self, url: str) -> Optional[Tuple[str, str]]:
+        """
+        Find the cloudcix client a URL belongs to.
+        :param url: The URL of a request.
+        :return: The name of the client, e.g. 'IAAS.vm', and the rest of the URL's path, e.g. '12' when reading by ID,
+                 or None if no client sends requests to the URL.
+        """
+        url = url.split('?', 1)[0]
+        for prefix, client in self.clients:
+            if url.startswith(prefix):
+                return client, url[len(prefix):].strip('/')
+        return None
+
+    def endpoint(self, method: str, url: str) -> str:
+        """
+        Name the endpoint a request is for after the cloudcix client method sending it, e.g. 'IAAS.vm.read'. Requests
+        to any other URL are named after the URL's host and path.
+        """
+        resolved = self.resolve(url)
+        if resolved is None:
+            parts = urlsplit(url)
+            return f'{parts.netloc}{parts.path}'
+        client, pk = resolved
+        operation = OPERATIONS.get(method.upper(), method.lower())
+        if operation == 'read' and not pk:
+            operation = 'list'
+        return f'{client}.{operation}'
+
+    def request(self, method, url, *args, **kwargs):
+        endpoint = self.endpoint(method, url)
+        if self.limiter is not None:
+            self.limiter.acquire(endpoint)
+        started = clock.monotonic()
+        response = None
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            return response
+        finally:
+            duration = clock.monotonic() - started
+            if response is None:
+                self.recorder.record(endpoint, None, 0, 0, duration)
+            else:
+                body = response.request.body or b''
+                sent = len(body.encode() if isinstance(body, str) else body)
+                self.recorder.record(endpoint, response.status_code, sent, len(response.content), duration)
+
+
+class Transport:
+    """
+    Class sending every cloudcix API call over one shared, pooled HTTP session.
+
+    The session keeps a pool of up to `pool_size` keep-alive connections to each COP host, so that frequent state polls
+    from many threads reuse warm connections rather than each doing a new TCP and TLS handshake.
+    """
+
+    limiter: RateLimiter
+    pool_size: int
+    recorder: CallRecorder
+    session: TimedSession
+
+    def __init__(self, pool_size: int = VALIDATOR_HTTP_POOL_SIZE, limiter: Optional[RateLimiter] = None):
+        """
+        Initialise an instance of the Transport class.
+        :param pool_size: The maximum number of connections kept open to each host. Should be at least the number of
+                          threads making API calls at once, or connections will be opened and thrown away.
+        :param limiter: The rate limiter every API call is held back by. Defaults to one with the limits in settings.
+        """
+        self.pool_size = pool_size
+        self.limiter = limiter or RateLimiter()
+        self.recorder = CallRecorder()
+        self.session = TimedSession(self.limiter, self.recorder)
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def install(self):
+        """
+        Route every cloudcix API call through the shared session.
+        Clients holding their own session are given the shared one. Only if none does, as with older clients that call
+        requests' module level functions directly, are those functions replaced with ones that use it, which routes
+        every other user of requests in the process through it too.
+        """
+        clients = []
+        swapped = False
+        for name, application in vars(api).items():
+            if not isinstance(application, type):
+                continue
+            for service, client in vars(application).items():
+                if isinstance(getattr(client, '_session', None), requests.Session):
+                    client._session = self.session
+                    swapped = True
+                if isinstance(getattr(client, 'base_url', None), str) and '{' not in client.base_url:
+                    clients.append((client.base_url, f'{name}.{service}'))
+        if not swapped:
+            requests.api.request = self.session.request
+            requests.request = self.session.request
+        # Match the longest URL first, so a client nested under another's URL is not mistaken for it
+        self.session.clients = sorted(clients, key=lambda client: len(client[0]), reverse=True)
+
+    def phase(self, name: str):
+        """
+        Record the API calls made within the block, or the decorated function, against a phase of the run, e.g.
+        'create'. See `CallRecorder.phase`.
+        """
+        return self.recorder.phase(name)
+
+    def report(self, path: str = VALIDATOR_API_REPORT):
+        """
+        Print the number of API calls made to each endpoint and in each phase, what they were answered with and how
+        long they took, and write them to a JSON file.
+        :param path: The path of the JSON file. Leave empty to not write one.
+        """
+        self.recorder.report()
+        print('\nTime held back by the API rate limits:')
+        self.limiter.report()
+        if path:
+            self.recorder.write(path)
+            print(f'\r - API call report written to {path}')
+
+
+# Transport shared by the whole validator, installed at startup
+transport = Transport()
@@ -1,23 +1,88 @@
 # stdlib
 import os
+import threading
+from typing import Any, Callable, List, Optional
 # local
-from settings import ROBOT_USERNAME, ROBOT_PASSWORD, ROBOT_API_KEY
+import clock
+from calls import call
+from settings import (
+    CLOUDCIX_API_KEY,
+    CLOUDCIX_API_PASSWORD,
+    CLOUDCIX_API_USERNAME,
+    ROBOT_USERNAME,
+    ROBOT_PASSWORD,
+    ROBOT_API_KEY,
+)
 # cloudcix
 os.environ['CLOUDCIX_SETTINGS_MODULE'] = 'settings'
 from cloudcix import api  # noqa: E402
 
 
-def get_robot_token():
+def create_token(kind: str, email: str, password: str, api_key: str) -> str:
     """
-    Generates an `admin` token using the credentials specified in the settings module
-    (``CLOUDCIX_API_USERNAME``, ``CLOUDCIX_API_PASSWORD``, and ``CLOUDCIX_API_KEY``).
+    Create a token for the given credentials, retrying the call like any other API call.
+    :param kind: What the token is for, for error messages, e.g. 'admin'.
+    :return: The token.
+    :raises APIError: If the token could not be created.
     """
     data = {
-        'email': ROBOT_USERNAME,
-        'password': ROBOT_PASSWORD,
-        'api_key': ROBOT_API_KEY,
+        'email': email,
+        'password': password,
+        'api_key': api_key,
     }
-    response = api.Membership.token.create(data=data)
-    if response.status_code == 201:
-        return response.json()['token']
-    raise Exception(response.json()['error_code'])
+    response = call(f'create {kind} token', api.Membership.token.create, ok=(201,), data=data)
+    return response.json()['token']
+
+
+def get_admin_token() -> str:
+    """
+    Generates an `admin` token using the credentials specified in the settings module
+    (``CLOUDCIX_API_USERNAME``, ``CLOUDCIX_API_PASSWORD``, and ``CLOUDCIX_API_KEY``).
+    """
+    return create_token('admin', CLOUDCIX_API_USERNAME, CLOUDCIX_API_PASSWORD, CLOUDCIX_API_KEY)
+
+
+def get_robot_token() -> str:
+    """
+    Generates a `robot` token using the credentials specified in the settings module
+    (``ROBOT_USERNAME``, ``ROBOT_PASSWORD``, and ``ROBOT_API_KEY``).
+    """
+    return create_token('robot', ROBOT_USERNAME, ROBOT_PASSWORD, ROBOT_API_KEY)
+
+
+def run_concurrently(tasks: List[Callable[[], Any]], workers: int) -> List[Any]:
+    """
+    Run the given tasks on a pool of threads and return their results in the same order as the tasks.
+    If any task raised, including a `SystemExit` from a failed check, the first such error in task order is raised
+    again once every task has finished.
+    The threads are `clock.Thread`s, so that a virtual clock waits for them.
+    :param tasks: The callables to be run.
+    :param workers: The maximum number of tasks to be run at once.
+    :return: The result of each task, in the order the tasks were given.
+    """
+    results: List[Any] = [None] * len(tasks)
+    errors: List[Optional[BaseException]] = [None] * len(tasks)
+    pending = iter(enumerate(tasks))
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            with lock:
+                index, task = next(pending, (None, None))
+            if task is None:
+                return
+            try:
+                results[index] = task()
+            except BaseException as e:
+                errors[index] = e
+
+    threads = [clock.Thread(target=work) for _ in range(min(max(1, workers), len(tasks)))]
+    for thread in threads:
+        thread.start()
+    # Every thread is waited for, so no check is left running when an error is raised
+    for thread in threads:
+        thread.join()
+    for error in errors:
+        if error is not None:
+            raise error
+    return results
@@ -4,12 +4,16 @@ import os
 import sys
 from typing import Any, Dict, List, Union
 # local
+import clock
+from calls import APIError, call
 from project import Project
-from utils import get_robot_token
+from settings import VALIDATOR_SIMULATE, VALIDATOR_SIMULATOR, VALIDATOR_VIRTUAL_CLOCK
+from simulator import Simulator
+from tokens import tokens
+from transport import transport
 # cloudcix
 os.environ['CLOUDCIX_SETTINGS_MODULE'] = 'settings'
 from cloudcix import api  # noqa: E402
-from cloudcix.auth import get_admin_token  # noqa: E402
 
 
 def region_validator(password):
@@ -23,8 +27,8 @@ def region_validator(password):
     """
 
     # Get the list of Regions
-    token = get_admin_token()
-    robot_token = get_robot_token()
+    token = tokens.admin
+    robot_token = tokens.robot
     params = {'search[cloud_region]': True, 'order': 'id'}
     response = api.Membership.address.list(token=token, params=params)
     if response.status_code != 200:
@@ -93,13 +97,15 @@ def validator_light(region: str):
 
     # Clear terminal window
     os.system('clear')
-    token = get_admin_token()
-    project = Project(region=region, token=token)
-    project.create()
+    project = Project(region=region)
+    if not project.create():
+        exit(1)
     project.check_create()
     project.restart()
     project.update()
     project.delete()
+    project.report_timelines()
+    project.report_failures()
 
 
 def validator_custom(region: str):
@@ -115,7 +121,6 @@ def validator_custom(region: str):
 
     # Clear terminal window
     os.system('clear')
-    token = get_admin_token()
     configs = {i + 1: f for i, f in enumerate(os.listdir('configs')) if os.path.isfile(os.path.join('configs', f))}
     for conf in configs:
         print(f'{conf}. {configs[conf]}')
@@ -125,12 +130,16 @@ def validator_custom(region: str):
         print('\nYou did not select a valid configuration.')
         exit(1)
     os.system('clear')
-    project = Project(region=region, token=token, file=selected)
-    project.create()
+    project = Project(region=region, file=selected)
+    if not project.create():
+        exit(1)
     project.check_create()
     project.check_bandwidth()
+    project.check_storage()
     project.restart()
     project.delete()
+    project.report_timelines()
+    project.report_failures()
 
 
 def validator_heavy(region: str):
@@ -146,7 +155,7 @@ def validator_heavy(region: str):
 
     # Clear terminal window
     os.system('clear')
-    robot_token = get_robot_token()
+    robot_token = tokens.robot
 
     # Oversubscription Value
     OVERSUBSCRIPTION_VALUE = 8
@@ -297,11 +306,13 @@ def validator_heavy(region: str):
     while len(types) > 0:
         for selected_type in types:
             try:
-                token = get_admin_token()
-                project = Project(region=region, token=token, file='', heavy=True, cores=1, ram=1, storage=50, **selected_type)  # type: ignore # noqa
-                project.create()
-                projects.append(project)
+                project = Project(region=region, file='', heavy=True, cores=1, ram=1, storage=50, **selected_type)  # type: ignore # noqa
+                created = project.create()
             except SystemExit:
+                created = False
+            if created:
+                projects.append(project)
+            else:
                 storage = 'HDD' if selected_type['storage_type_id'] == 1 else 'SSD'
                 print(f'\n - Projects of this type have errored out. Unix: {selected_type["unix"]}; Storage: {storage}')
                 print()
@@ -309,22 +320,41 @@ def validator_heavy(region: str):
                 types.remove(selected_type)
 
     for project in projects:
-        new_token = get_admin_token()
-        project.update_token(token=new_token)
         project.check_create()
 
     # List VMs using robot token
-    robot_token = get_robot_token()
+    robot_token = tokens.robot
     # Exclude VMs in the Closed State (99)
     params = {'exclude[state]': 99}
-    response = api.IAAS.vm.list(token=robot_token, params=params)
-    if response.status_code == 200:
-        vms = response.json()['content']
+    # The projects are already built, so carry on without the utilisation if the VMs cannot be listed
+    try:
+        response = call('list VMs', api.IAAS.vm.list, token=robot_token, params=params)
+    except APIError as e:
+        print(f'\033[91m - {e} \033[0m')
+        print()
     else:
-        print(response.status_code)
-        print(response.json())
-        exit()
+        report_utilisation(servers, response.json()['content'], OVERSUBSCRIPTION_VALUE)
 
+    for method in ['restart', 'delete']:
+        for project in projects:
+            try:
+                getattr(project, method)()
+            except SystemExit:
+                print('\nContinuing exceution.')
+                print()
+
+    for project in projects:
+        project.report_timelines()
+        project.report_failures()
+
+
+def report_utilisation(servers: List[Dict[str, Any]], vms: List[Dict[str, Any]], oversubscription: int):
+    """
+    Print how much of each server's cores, RAM and storage the VMs in the region use.
+    :param servers: The servers in the region.
+    :param vms: The VMs in the region.
+    :param oversubscription: The number of VM cores each physical core can be shared by.
+    """
     servers_vms = {
         server['id']: [vm for vm in vms if vm['server_id'] == server['id']]
         for server in servers
@@ -353,7 +383,7 @@ def validator_heavy(region: str):
             for storage in vm['storages']
             if vm['server_id'] == id and server['storage_type']['id'] == 1
         ])
-        percent_cores = round(server_used_cores / (server['cores'] * OVERSUBSCRIPTION_VALUE) * 100, 3)
+        percent_cores = round(server_used_cores / (server['cores'] * oversubscription) * 100, 3)
         percent_ram = round(server_used_ram / server['ram'] * 100, 3)
         percent_hdd = round(server_used_hdd / server['gb'] * 100, 3) if server['storage_type']['id'] == 1 else 0
         percent_ssd = round(server_used_ssd / server['gb'] * 100, 3) if server['storage_type']['id'] == 2 else 0
@@ -368,16 +398,6 @@ def validator_heavy(region: str):
     print('└───────────────────┴─────────────────────────┴──────────────────┴──────────────────┴──────────────────┘')
     print()
 
-    for method in ['restart', 'delete']:
-        for project in projects:
-            try:
-                new_token = get_admin_token()
-                project.update_token(token=new_token)
-                getattr(project, method)()
-            except SystemExit:
-                print('\nContinuing exceution.')
-                print()
-
 
 def get_servers(region: str, token: str):
     """
@@ -482,4 +502,16 @@ if __name__ == '__main__':
         password = getpass.getpass('[validator] Provide network password (exit quits); ')
     if password == 'exit':
         sys.exit()
-    region_validator(password)
+    transport.install()
+    if VALIDATOR_SIMULATE:
+        if VALIDATOR_VIRTUAL_CLOCK:
+            clock.install(clock.VirtualClock())
+        Simulator(**VALIDATOR_SIMULATOR).install(transport)
+    if not VALIDATOR_SIMULATE or not VALIDATOR_VIRTUAL_CLOCK:
+        # The refresh thread waits in real time, so under a virtual clock tokens are replaced by their callers instead
+        tokens.start()
+    try:
+        region_validator(password)
+    finally:
+        print('\nAPI calls:')
+        transport.report()
@@ -1,81 +1,122 @@
 # stdlib
 import os
-import time
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 # local
+import clock
+import polling
 import state
-from mixins import HardwareMixin
-from utils import get_robot_token
+from calls import APIError, Failure, call
+from mixins import FailureMixin, HardwareMixin
+from polling import PollingPolicy
+from tokens import tokens
+from waiter import FAILURE, SUCCESS, Timeline, Waiter
 # cloudcix
 os.environ['CLOUDCIX_SETTINGS_MODULE'] = 'settings'
 from cloudcix import api  # noqa: E402
 
 
-class VirtualRouter(HardwareMixin):
+class VirtualRouter(FailureMixin, HardwareMixin):
     """
     Class representing a virtual_router instance on the cloudcix platform.
     """
 
+    failures: List[Failure]
     obj: Dict[str, Any]
     vpns: list
     project_id: int
-    token: str
+    state: Optional[int]
+    timelines: Dict[str, Timeline]
 
-    def __init__(self, obj: Dict[str, Any], vpns: list, token: str, project_id: int):
+    def __init__(self, obj: Dict[str, Any], vpns: list, project_id: int):
         """
         Initialise an instance of the virtual_router class.
         :param obj: The virtual router object created on the CloudCIX platform
         :param vpns: A list of vpns created on the CloudCIX platform for the obj
-        :param token: The access token for the cloudcix API.
         :param project_id: The ID of the project related to this virtual_router.
         """
         self.obj = obj
         self.vpns = vpns
-        self.token = token
         self.project_id = project_id
+        self.state = None
+        self.timelines = {}
+        self.failures = []
 
-    def software_check_build(self):
+    @property
+    def token(self) -> str:
+        """
+        The access token for the cloudcix API, from the shared token manager.
+        """
+        return tokens.admin
+
+    def read_state(self) -> int:
+        """
+        Read the current state of the virtual_router from the API.
+        """
+        name = f'Virtual Router #{self.obj["id"]}'
+        try:
+            response = call(f'read {name}', api.IAAS.virtual_router.read, token=self.token, pk=self.obj['id'])
+        except APIError as e:
+            # Keep waiting on the last known state, the next read may succeed
+            self.record_failure(name, e)
+            return self.state  # type: ignore
+        self.state = response.json()['content']['state']
+        return self.state  # type: ignore
+
+    def software_check_build(self, policy: Optional[PollingPolicy] = None, quiet: bool = False):
         """
         Verify that the Virtual Router has been built using the API.
+        :param policy: The polling policy to use. Defaults to `polling.BUILD`.
+        :param quiet: If True, print nothing unless the build fails, leaving the caller to report the result.
         """
 
         # VPN Tunnels verification tests are separated and are not available in this version.
 
-        # Loop through every minute reading virtual router State
-        loop_count = 0
-        timeout = time.time() + 30 * 60
-        while time.time() < timeout:
-            loop_count += 1
-            status = api.IAAS.virtual_router.read(token=self.token, pk=self.obj['id']).json()['content']['state']
-            if status in [state.REQUESTED, state.BUILDING]:
-                print(
-                    f'\r - Building Virtual Router #{self.obj["id"]} for project #{self.project_id}{"." * loop_count}',
-                    end='',
-                )
-            elif status == state.UNRESOURCED:
-                print(f'\r\033[31m - Error! Virtual Router #{self.obj["id"]} was not built.{" " * 100}\033[0m')
-                exit(1)
-            elif status == state.RUNNING:
-                print(f'\r - Virtual Router #{self.obj["id"]} was built{" " * 100}')
-                break
-            time.sleep(60)
-
-        if time.time() > timeout:
+        waiter = Waiter(
+            read=self.read_state,
+            pending=[state.REQUESTED, state.BUILDING],
+            success=[state.RUNNING],
+            failure=[state.UNRESOURCED],
+            timeout=30 * 60,
+            policy=policy or polling.BUILD,
+            key='Virtual Router',
+        )
+        outcome = waiter.wait(
+            None if quiet else lambda status, loop_count: print(
+                f'\r - Building Virtual Router #{self.obj["id"]} for project #{self.project_id}{"." * loop_count}',
+                end='',
+            ),
+        )
+        self.timelines['build'] = waiter.timeline
+
+        if outcome == FAILURE:
+            print(f'\r\033[31m - Error! Virtual Router #{self.obj["id"]} was not built.{" " * 100}\033[0m')
+            exit(1)
+        elif outcome != SUCCESS:
             print(f'\n\033[91m - Virtual Router #{self.obj["id"]} was not built in time. \033[0m')
             exit(1)
+        if not quiet:
+            print(f'\r - Virtual Router #{self.obj["id"]} was built{" " * 100}')
 
-    def hardware_check_build(self):
+    def hardware_check_build(self, policy: Optional[PollingPolicy] = None):
         """
         Verify that the virtual router has been built using ping.
+        :param policy: The polling policy to use. Defaults to `polling.PING`.
         """
         # Test ping
-        self.ping(type='VirtualRouter', id=self.obj['id'], ip=self.obj['ip_address']['address'], response=True)
+        self.ping(
+            type='VirtualRouter',
+            id=self.obj['id'],
+            ip=self.obj['ip_address']['address'],
+            response=True,
+            policy=policy,
+        )
         print()
 
-    def _router_reponse(self, data):
+    def _router_reponse(self, data, policy: Optional[PollingPolicy] = None):
         """
         send data to the router and analyse the results
         :param data:
+        :param policy: The polling policy to use. Defaults to `polling.ROUTER`.
         :return: output
         """
         result = {
@@ -83,80 +124,91 @@ class VirtualRouter(HardwareMixin):
             'output': None,
         }
         # read the router until timeout or result found
-        timeout = time.time() + 3 * 60
+        timeout = clock.time() + 3 * 60
+        started = clock.time()
+        policy = policy or polling.ROUTER
         loop_count = 0
-        while time.time() < timeout:
+        while clock.time() < timeout:
             loop_count += 1
             result = self.fetcher(data)
             if 'output' not in result.keys() and 'error' not in result.keys():
                 print(f'\r - Checking the status of VPN from the router {"." * loop_count}', end='')
             else:
                 break
-            time.sleep(30)
-        if time.time() > timeout and 'output' not in result.keys() and 'error' not in result.keys():
+            clock.sleep(policy.interval(None, loop_count - 1, clock.time() - started))
+        if clock.time() > timeout and 'output' not in result.keys() and 'error' not in result.keys():
             result = {
                 'error': 'No response from router.',
             }
         return result
 
-    def software_check_update(self):
+    def software_check_update(self, policy: Optional[PollingPolicy] = None):
         """
         Verify that the virtual_router has been updated using the API and back in a running state.
-        """
-        # Read until timeout or state is correct
-        timeout = time.time() + 10 * 60
-        loop_count = 0
-        while time.time() < timeout:
-            loop_count += 1
-            status = api.IAAS.virtual_router.read(token=self.token, pk=self.obj['id']).json()['content']['state']
-            if status in [state.UPDATE, state.UPDATING]:
-                print(f'\r - Updating Virtual Router #{self.obj["id"]}{"." * loop_count}', end='')
-            elif status == state.RUNNING:
-                print(f'\r - Virtual Router #{self.obj["id"]} Updated{" " * 100}')
-                break
-            time.sleep(60)
-
-        if time.time() > timeout:
+        :param policy: The polling policy to use. Defaults to `polling.UPDATE`.
+        """
+        waiter = Waiter(
+            read=self.read_state,
+            pending=[state.UPDATE, state.UPDATING],
+            success=[state.RUNNING],
+            timeout=10 * 60,
+            policy=policy or polling.UPDATE,
+            key='Virtual Router',
+        )
+        outcome = waiter.wait(
+            lambda status, loop_count: print(
+                f'\r - Updating Virtual Router #{self.obj["id"]}{"." * loop_count}',
+                end='',
+            ),
+        )
+        self.timelines['update'] = waiter.timeline
+
+        if outcome != SUCCESS:
             print(f'\n\033[91m - Virtual Router #{self.obj["id"]} was not updated. \033[0m')
             exit(1)
+        print(f'\r - Virtual Router #{self.obj["id"]} Updated{" " * 100}')
 
-    def software_check_delete(self):
+    def software_check_delete(self, policy: Optional[PollingPolicy] = None):
         """
         Verify that the virtual_router has been deleted using the API.
-        """
-
-        # Read until timeout or state is correct
-        timeout = time.time() + 10 * 60
-        loop_count = 0
-        while time.time() < timeout:
-            loop_count += 1
-            status = api.IAAS.virtual_router.read(token=self.token, pk=self.obj['id']).json()['content']['state']
-            if status in [state.SCRUB, state.SCRUB_PREP]:
-                print(f'\r - Deleting Virtual Router #{self.obj["id"]}{"." * loop_count}', end='')
-            elif status == state.SCRUB_QUEUE:
-                print(f'\r - Virtual Router #{self.obj["id"]} Deleted{" " * 100}')
-                break
-            time.sleep(60)
-
-        if time.time() > timeout:
+        :param policy: The polling policy to use. Defaults to `polling.DELETE`.
+        """
+
+        waiter = Waiter(
+            read=self.read_state,
+            pending=[state.SCRUB, state.SCRUB_PREP],
+            success=[state.SCRUB_QUEUE],
+            timeout=10 * 60,
+            policy=policy or polling.DELETE,
+            key='Virtual Router',
+        )
+        outcome = waiter.wait(
+            lambda status, loop_count: print(
+                f'\r - Deleting Virtual Router #{self.obj["id"]}{"." * loop_count}',
+                end='',
+            ),
+        )
+        self.timelines['delete'] = waiter.timeline
+
+        if outcome != SUCCESS:
             print(f'\n\033[91m - Virtual Router #{self.obj["id"]} was not deleted. \033[0m')
             exit(1)
+        print(f'\r - Virtual Router #{self.obj["id"]} Deleted{" " * 100}')
 
-    def hardware_check_delete(self):
+    def hardware_check_delete(self, policy: Optional[PollingPolicy] = None):
         """
         Verify that the virtual_router has been deleted using ping.
+        :param policy: The polling policy to use. Defaults to `polling.PING`.
         """
 
         # Test ping
-        self.ping(type='VirtualRouter', id=self.obj['id'], ip=self.obj['ip_address']['address'], response=False)
-
-    def update_token(self, token: str):
-        """
-        Method to update token.
-        Used for when Validator runs exceed 2 hours.
-        """
-
-        self.token = token
+        self.ping(
+            type='VirtualRouter',
+            id=self.obj['id'],
+            ip=self.obj['ip_address']['address'],
+            response=False,
+            policy=policy,
+        )
 
     def find_router_login_details(self):
         """
@@ -164,8 +216,12 @@ class VirtualRouter(HardwareMixin):
         :return: mgnt_ip: address(ipv6)
         """
         # Read Router to find Management IP
-        robot_token = get_robot_token()
-        response = api.IAAS.router.read(token=robot_token, pk=self.obj['router_id'])
+        response = call(
+            f'read Router #{self.obj["router_id"]}',
+            api.IAAS.router.read,
+            token=tokens.robot,
+            pk=self.obj['router_id'],
+        )
         management_ip = response.json()['content']['management_ip']
         username = response.json()['content']['username']
         credentials = response.json()['content']['credentials']
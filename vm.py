@@ -1,421 +1,544 @@
 # stdlib
-import asyncio
 import os
-import time
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 # local
-from mixins import HardwareMixin
+import clock
+from bandwidth import BandwidthResult
+from calls import APIError, Failure, call
+from mixins import FailureMixin, HardwareMixin
+from poller import StatePoller
+from prober import Prober
+import polling
+from polling import PollingPolicy
+from settings import VALIDATOR_SERVICE_PROBES
 import state
+from tokens import tokens
+from waiter import FAILURE, SUCCESS, Timeline, Waiter
 # cloudcix
 os.environ['CLOUDCIX_SETTINGS_MODULE'] = 'settings'
 from cloudcix import api  # noqa: E402
 
 
-class VM(HardwareMixin):
+class VM(FailureMixin, HardwareMixin):
     """
     Class representing a VM instance on the cloudcix platform.
     """
     obj: Dict[str, Any]
+    bandwidth: Optional[BandwidthResult]
+    failures: List[Failure]
     phantom: bool
-    token: str
+    poller: Optional[StatePoller]
+    state: Optional[int]
+    state_changed: float
+    timelines: Dict[str, Timeline]
 
-    def __init__(self, token: str, obj: Dict[str, Any]):
+    def __init__(self, obj: Dict[str, Any], poller: Optional[StatePoller] = None):
         """
         Initialise an instance of the VM class.
-        :param token: The API token used to connect to cloudcix API.
-        :param id: The ID of the VM on the cloudcix platform.
+        :param obj: The VM object created on the CloudCIX platform.
+        :param poller: The shared poller to read the VM state from. If not given, the VM reads its own state.
         """
-        self.token = token
         self.obj = obj
         self.phantom = self.obj['image']['display_name'] == 'Manual'
+        self.state = self.obj.get('state')
+        self.state_changed = clock.time()
+        self.timelines = {}
+        self.bandwidth = None
+        self.failures = []
+        self.poller = poller
+        if self.poller is not None:
+            self.poller.track(self)
+
+    @property
+    def token(self) -> str:
+        """
+        The access token for the cloudcix API, from the shared token manager.
+        """
+        return tokens.admin
 
-    def stop(self):
+    @property
+    def public_ip(self) -> Optional[str]:
         """
-        Stop the VM.
+        The first public IP address of the VM, if it has one.
         """
+        for private_ip in self.obj['ip_addresses']:
+            if private_ip['public_ip'] is not None:
+                return private_ip['public_ip']['address']
+        return None
 
-        response = api.IAAS.vm.partial_update(token=self.token, pk=self.obj['id'], data={'state': state.QUIESCE})
-        if not response.status_code == 200:
-            print(response.json())
-            exit(1)
+    @property
+    def storage_type_id(self) -> Optional[int]:
+        """
+        The ID of the type of storage (e.g. HDD or SSD) the VM's storages are on.
+        """
+        if 'storage_type_id' in self.obj:
+            return self.obj['storage_type_id']
+        return (self.obj.get('storage_type') or {}).get('id')
 
-    def start(self):
+    @property
+    def service_port(self) -> Optional[int]:
         """
-        Start the VM
+        The port the VM's main remote access service listens on, chosen by its image: RDP for Windows and SSH for
+        Ubuntu and CentOS.
+        """
+        answer_file = self.obj['image'].get('answer_file_name') or self.obj['image']['display_name']
+        answer_file = answer_file.lower()
+        if 'windows' in answer_file:
+            return 3389
+        if 'ubuntu' in answer_file or 'centos' in answer_file:
+            return 22
+        return None
+
+    def update_state(self, status: int):
         """
+        Record the latest state of the VM, noting the time whenever the state changes.
+        :param status: The state of the VM as read from the API.
+        """
+        if status != self.state:
+            # Set the time first, as the state may be read from another thread
+            self.state_changed = clock.time()
+            self.state = status
 
-        response = api.IAAS.vm.partial_update(token=self.token, pk=self.obj['id'], data={'state': state.RESTART})
-        if not response.status_code == 200:
-            print(response.json())
-            exit(1)
+    def read_state(self) -> int:
+        """
+        Read the current state of the VM, from the shared poller if there is one or else from the API directly.
+        """
+        if self.poller is not None:
+            return self.poller.read(self)
+
+        try:
+            response = call(f'read VM #{self.obj["id"]}', api.IAAS.vm.read, token=self.token, pk=self.obj['id'])
+        except APIError as e:
+            # Keep waiting on the last known state, the next read may succeed
+            self.record_failure(f'VM #{self.obj["id"]}', e)
+            return self.state
+        self.update_state(response.json()['content']['state'])
+        return self.state
+
+    def stop(self) -> bool:
+        """
+        Stop the VM.
+        :return: False if the request to stop the VM failed.
+        """
+        return self._request_state(state.QUIESCE, 'stop')
 
-    def software_check_updating(self):
+    def start(self) -> bool:
+        """
+        Start the VM
+        :return: False if the request to start the VM failed.
+        """
+        return self._request_state(state.RESTART, 'start')
+
+    def _request_state(self, requested: int, verb: str) -> bool:
+        try:
+            call(
+                f'{verb} VM #{self.obj["id"]}',
+                api.IAAS.vm.partial_update,
+                token=self.token,
+                pk=self.obj['id'],
+                data={'state': requested},
+            )
+        except APIError as e:
+            self.record_failure(f'VM #{self.obj["id"]}', e)
+            return False
+        if self.poller is not None:
+            self.poller.invalidate()
+        return True
+
+    def software_check_updating(self, policy: Optional[PollingPolicy] = None):
         """
         Verify that a VM moves through the correct states when updated.
+        :param policy: The polling policy to use. Defaults to `polling.UPDATE`.
         """
 
-        loop_count = 0
-        timeout = time.time() + 480 * 60
-
         image = self.obj['image']['display_name']
-        # Loop through every minute reading VM state
-        while time.time() < timeout:
-            loop_count += 1
-
-            response = api.IAAS.vm.read(token=self.token, pk=self.obj['id'])
-            if response.status_code == 200:
-                status = response.json()['content']['state']
-            else:
-                print(response.status_code)
-                print(response.json())
-                exit()
 
+        def progress(status: int, loop_count: int):
             if status == state.UPDATE:
                 print(f'\r - VM #{self.obj["id"]} ({image}) update requested{"." * loop_count}{" " * 100}', end='')
-            elif status == state.UPDATING:
-                print(f'\r - VM #{self.obj["id"]} ({image}) is updating{"." * loop_count}{" " * 100}', end='')
-            elif status == state.RUNNING:
-                print(f'\r - VM #{self.obj["id"]} ({image}) was updated and is running!{" " * 100}')
-                break
             else:
-                print(f'\r\033[31m - Error! VM #{self.obj["id"]} ({image}) was not updated.{" " * 100}\033[0m')
-                exit(1)
-
-            # Sleep for 60 seconds
-            time.sleep(60)
+                print(f'\r - VM #{self.obj["id"]} ({image}) is updating{"." * loop_count}{" " * 100}', end='')
 
-        if time.time() > timeout:
+        waiter = Waiter(
+            read=self.read_state,
+            pending=[state.UPDATE, state.UPDATING],
+            success=[state.RUNNING],
+            strict=True,
+            timeout=480 * 60,
+            policy=policy or polling.UPDATE,
+            key=image,
+        )
+        outcome = waiter.wait(progress)
+        self.timelines['update'] = waiter.timeline
+
+        if outcome == SUCCESS:
+            print(f'\r - VM #{self.obj["id"]} ({image}) was updated and is running!{" " * 100}')
+        elif outcome == FAILURE:
+            print(f'\r\033[31m - Error! VM #{self.obj["id"]} ({image}) was not updated.{" " * 100}\033[0m')
+            exit(1)
+        else:
             print(f'\n\033[91m - VM #{self.obj["id"]} ({image}) was not updated in time. \033[0m')
             exit(1)
 
-    def software_check_build(self) -> bool:
+    def software_check_build(self, policy: Optional[PollingPolicy] = None, quiet: bool = False) -> bool:
         """
         Verify that the VM has been built on the cloudcix platform using API.
+        :param policy: The polling policy to use. Defaults to `polling.BUILD`.
+        :param quiet: If True, print nothing unless the build fails, leaving the caller to report the result. Used when
+                      many resources are checked at once, whose progress lines would overwrite each other.
+        :return: True if the VM was built, False if it was not built in time.
         """
 
-        loop_count = 0
-        timeout = time.time() + 480 * 60
-        success = False
-
         image = self.obj['image']['display_name']
 
-        # Loop through every minute reading VM state
-        while time.time() < timeout:
-            loop_count += 1
-
-            response = api.IAAS.vm.read(token=self.token, pk=self.obj['id'])
-            if response.status_code == 200:
-                status = response.json()['content']['state']
-            else:
-                print(response.status_code)
-                print(response.json())
-                exit()
-
-            if status in [state.REQUESTED, state.BUILDING]:
-                print(f'\r - Building VM #{self.obj["id"]} with image \'{image}\'{"." * loop_count}', end='')
-            elif status == state.UNRESOURCED:
-                print(
-                    f'\r\033[31m - Error! VM #{self.obj["id"]} was not built with image \'{image}\'.{" " * 100}\033[0m',
-                )
-                exit(1)
-            elif status == state.RUNNING:
+        waiter = Waiter(
+            read=self.read_state,
+            pending=[state.REQUESTED, state.BUILDING],
+            success=[state.RUNNING],
+            failure=[state.UNRESOURCED],
+            timeout=480 * 60,
+            policy=policy or polling.BUILD,
+            key=image,
+        )
+        outcome = waiter.wait(
+            None if quiet else lambda status, loop_count: print(
+                f'\r - Building VM #{self.obj["id"]} with image \'{image}\'{"." * loop_count}',
+                end='',
+            ),
+        )
+        self.timelines['build'] = waiter.timeline
+
+        if outcome == SUCCESS:
+            if not quiet:
                 print(f'\r - VM #{self.obj["id"]} was built with image \'{image}\'!{" " * 100}')
-                success = True
-                break
-            # Sleep for 60 seconds
-            time.sleep(60)
-
-        if time.time() > timeout:
+            return True
+        if outcome == FAILURE:
+            print(
+                f'\r\033[31m - Error! VM #{self.obj["id"]} was not built with image \'{image}\'.{" " * 100}\033[0m',
+            )
+            exit(1)
+        if not quiet:
             print(f'\n\033[91m - VM #{self.obj["id"]} was not built with image \'{image}\' in time. \033[0m')
+        return False
 
-        return success
-
-    def hardware_check_build(self):
+    def hardware_check_build(self, policy: Optional[PollingPolicy] = None, service: bool = VALIDATOR_SERVICE_PROBES):
         """
-        Verify that the VM has been built on the cloudcix platform using ping.
+        Verify that the VM has been built on the cloudcix platform using ping, and its service port if requested.
+        :param policy: The polling policy to use. Defaults to `polling.PING`.
+        :param service: If True, also try to connect to the VM's service port, and treat the VM as up if either answers.
         """
         if self.phantom:
             print(
                 f'\r\033[91m - VM #{self.obj["id"]} ({self.obj["image"]["display_name"]}) is phantom, '
                 f'sleeping for 1 minute.{" " * 100} \033[0m',
             )
-            time.sleep(60)
+            clock.sleep(60)
             return
 
-        public_ip = None
-
-        for private_ip in self.obj['ip_addresses']:
-            if private_ip['public_ip'] is not None:
-                public_ip = private_ip['public_ip']['address']
-                break
-
+        public_ip = self.public_ip
         if not public_ip:
             print(
                 f'\r\033[91m - VM #{self.obj["id"]} does not have a public ip, '
                 f'sleeping for 1 minute.{" " * 100} \033[0m',
             )
-            time.sleep(60)
+            clock.sleep(60)
             return
 
-        self.ping(type='VM', id=self.obj['id'], ip=public_ip, response=True)
-
-    def check_bandwidth(self):
-        public_ip = None
-
-        for private_ip in self.obj['ip_addresses']:
-            if private_ip['public_ip'] is not None:
-                public_ip = private_ip['public_ip']['address']
-                break
+        if service and self.service_port is not None:
+            self.reach(
+                type='VM',
+                id=self.obj['id'],
+                ip=public_ip,
+                port=self.service_port,
+                policy=policy,
+                key=self.obj['image']['display_name'],
+            )
+            return
 
+        self.ping(
+            type='VM',
+            id=self.obj['id'],
+            ip=public_ip,
+            response=True,
+            policy=policy,
+            key=self.obj['image']['display_name'],
+        )
+
+    def check_bandwidth(
+        self,
+        prepared: bool = False,
+        ports: Optional[Dict[Tuple[str, int], Tuple[str, Optional[float]]]] = None,
+    ):
+        """
+        Run the bandwidth tests against the VM.
+        :param prepared: True if the VM has already been prepared for the tests.
+        :param ports: The results of scanning the VM's service ports, if it has already been scanned.
+        """
+        public_ip = self.public_ip
         if not public_ip:
             print(
                 f'\r\033[91m - VM #{self.obj["id"]} does not have a public ip, '
                 f'sleeping for 1 minute.{" " * 100} \033[0m',
             )
-            time.sleep(60)
+            clock.sleep(60)
             return
 
-        return self.stress_test(public_ip, vm_id=self.obj['id'])
+        return self.stress_test(public_ip, vm_id=self.obj['id'], prepare=not prepared, ports=ports)
 
-    def software_check_stopped(self):
+    def software_check_stopped(self, policy: Optional[PollingPolicy] = None):
         """
         Verify that the VM has stopped using the API.
+        :param policy: The polling policy to use. Defaults to `polling.STOP`.
         """
 
-        timeout = time.time() + 480 * 60
-        loop_count = 0
-
         image = self.obj['image']['display_name']
 
-        # Read until timeout or response shows correct state
-        while time.time() < timeout:
-            loop_count += 1
-
-            response = api.IAAS.vm.read(token=self.token, pk=self.obj['id'])
-            if response.status_code == 200:
-                status = response.json()['content']['state']
-            else:
-                print(response.status_code)
-                print(response.json())
-                exit()
-
-            if status in [state.QUIESCE, state.QUIESCING]:
-                print(f'\r - Stopping VM #{self.obj["id"]} ({image}){"." * loop_count}', end='')
-            elif status == state.QUIESCED:
-                print(f'\r - VM #{self.obj["id"]} ({image}) stopped.{" " * 100}')
-                break
-            time.sleep(5)
-
-        if time.time() > timeout:
+        waiter = Waiter(
+            read=self.read_state,
+            pending=[state.QUIESCE, state.QUIESCING],
+            success=[state.QUIESCED],
+            timeout=480 * 60,
+            policy=policy or polling.STOP,
+            key=image,
+        )
+        outcome = waiter.wait(
+            lambda status, loop_count: print(
+                f'\r - Stopping VM #{self.obj["id"]} ({image}){"." * loop_count}',
+                end='',
+            ),
+        )
+        self.timelines['stop'] = waiter.timeline
+
+        if outcome != SUCCESS:
             print(f'\r\033[91m - VM #{self.obj["id"]} ({image}) was not stopped.{" " * 100} \033[0m')
             exit(1)
+        print(f'\r - VM #{self.obj["id"]} ({image}) stopped.{" " * 100}')
 
-    def software_check_started(self):
+    def software_check_started(self, policy: Optional[PollingPolicy] = None):
         """
         Verify that the VM has started using the API.
+        :param policy: The polling policy to use. Defaults to `polling.START`.
         """
 
-        timeout = time.time() + 480 * 60
-        loop_count = 0
-
         image = self.obj['image']['display_name']
 
-        # Read until response shows correct state
-        while time.time() < timeout:
-            loop_count += 1
-
-            response = api.IAAS.vm.read(token=self.token, pk=self.obj['id'])
-            if response.status_code == 200:
-                status = response.json()['content']['state']
-            else:
-                print(response.status_code)
-                print(response.json())
-                exit()
-
-            if status in [state.RESTART, state.RESTARTING]:
-                print(f'\r - Starting VM #{self.obj["id"]} ({image}){"." * loop_count}', end='')
-            elif status == state.RUNNING:
-                print(f'\r - VM #{self.obj["id"]} ({image}) started.{" " * 100}')
-                break
-
-            time.sleep(5)
-
-        if time.time() > timeout:
+        waiter = Waiter(
+            read=self.read_state,
+            pending=[state.RESTART, state.RESTARTING],
+            success=[state.RUNNING],
+            timeout=480 * 60,
+            policy=policy or polling.START,
+            key=image,
+        )
+        outcome = waiter.wait(
+            lambda status, loop_count: print(
+                f'\r - Starting VM #{self.obj["id"]} ({image}){"." * loop_count}',
+                end='',
+            ),
+        )
+        self.timelines['start'] = waiter.timeline
+
+        if outcome != SUCCESS:
             print(f'\r\033[91m - VM #{self.obj["id"]} ({image}) was not started.{" " * 100} \033[0m')
             exit(1)
+        print(f'\r - VM #{self.obj["id"]} ({image}) started.{" " * 100}')
 
-    def hardware_check_stopped(self):
+    def hardware_check_stopped(self, policy: Optional[PollingPolicy] = None):
         """
         Verify that the VM has stopped using ping.
+        :param policy: The polling policy to use. Defaults to `polling.PING`.
         """
         if self.phantom:
             print(
                 f'\r\033[91m - VM #{self.obj["id"]} ({self.obj["image"]["display_name"]}) is phantom,'
                 f' sleeping for 1 minute.{" " * 100} \033[0m',
             )
-            time.sleep(60)
+            clock.sleep(60)
             return
 
-        for private_ip in self.obj['ip_addresses']:
-            if private_ip['public_ip'] is not None:
-                public_ip = private_ip['public_ip']['address']
-                break
-
+        public_ip = self.public_ip
         if not public_ip:
             print(
                 f'\r\033[91m - VM #{self.obj["id"]} does not have a public ip, '
                 f'sleeping for 1 minute.{" " * 100} \033[0m',
             )
-            time.sleep(60)
+            clock.sleep(60)
             return
 
-        self.ping(type='VM', id=self.obj['id'], ip=public_ip, response=False)
+        self.ping(
+            type='VM',
+            id=self.obj['id'],
+            ip=public_ip,
+            response=False,
+            policy=policy,
+            key=self.obj['image']['display_name'],
+        )
 
-    def hardware_check_started(self):
+    def hardware_check_started(self, policy: Optional[PollingPolicy] = None, service: bool = VALIDATOR_SERVICE_PROBES):
         """
-        Verify that the VM has started using ping
+        Verify that the VM has started using ping, and its service port if requested.
+        :param policy: The polling policy to use. Defaults to `polling.PING`.
+        :param service: If True, also try to connect to the VM's service port, and treat the VM as up if either answers.
         """
         if self.phantom:
             print(
                 f'\r\033[91m - VM #{self.obj["id"]} ({self.obj["image"]["display_name"]}) is phantom, '
                 f'sleeping for 1 minute.{" " * 100} \033[0m',
             )
-            time.sleep(60)
+            clock.sleep(60)
             return
 
-        public_ip = None
-
-        for private_ip in self.obj['ip_addresses']:
-            if private_ip['public_ip'] is not None:
-                public_ip = private_ip['public_ip']['address']
-
+        public_ip = self.public_ip
         if not public_ip:
             print(
                 f'\r\033[91m - VM #{self.obj["id"]} does not have a public ip, '
                 f'sleeping for 1 minute.{" " * 100} \033[0m',
             )
-            time.sleep(60)
+            clock.sleep(60)
+            return
+
+        if service and self.service_port is not None:
+            self.reach(
+                type='VM',
+                id=self.obj['id'],
+                ip=public_ip,
+                port=self.service_port,
+                policy=policy,
+                key=self.obj['image']['display_name'],
+            )
             return
 
-        self.ping(type='VM', id=self.obj['id'], ip=public_ip, response=True)
+        self.ping(
+            type='VM',
+            id=self.obj['id'],
+            ip=public_ip,
+            response=True,
+            policy=policy,
+            key=self.obj['image']['display_name'],
+        )
 
-    def software_check_delete(self):
+    def software_check_delete(self, policy: Optional[PollingPolicy] = None):
         """
         Verify that the VM has been deleted on the cloudcix platform using the API.
+        :param policy: The polling policy to use. Defaults to `polling.DELETE`.
         """
 
-        loop_count = 0
-        timeout = time.time() + 480 * 60
-
         image = self.obj['image']['display_name']
 
-        # Read until timeout or state is correct
-        while time.time() < timeout:
-            loop_count += 1
-
-            response = api.IAAS.vm.read(token=self.token, pk=self.obj['id'])
-            if response.status_code == 200:
-                status = response.json()['content']['state']
-            else:
-                print(response.status_code)
-                print(response.json())
-                exit()
-
-            if status in [state.SCRUB, state.SCRUB_PREP]:
-                print(f'\r - Deleting VM #{self.obj["id"]} ({image}){"." * loop_count}', end='')
-            elif status == state.SCRUB_QUEUE:
-                print(
-                    f'\r\033[92m - VM #{self.obj["id"]} ({image}) successfully marked for deletion!{" " * 100}\033[0m',
-                )
-                break
-            time.sleep(60)
-
-        if time.time() > timeout:
+        waiter = Waiter(
+            read=self.read_state,
+            pending=[state.SCRUB, state.SCRUB_PREP],
+            success=[state.SCRUB_QUEUE],
+            timeout=480 * 60,
+            policy=policy or polling.DELETE,
+            key=image,
+        )
+        outcome = waiter.wait(
+            lambda status, loop_count: print(
+                f'\r - Deleting VM #{self.obj["id"]} ({image}){"." * loop_count}',
+                end='',
+            ),
+        )
+        self.timelines['delete'] = waiter.timeline
+
+        if outcome != SUCCESS:
             print(f'\r\033[91m - VM #{self.obj["id"]} ({image}) was not deleted.{" " * 100} \033[0m')
             exit(1)
+        print(
+            f'\r\033[92m - VM #{self.obj["id"]} ({image}) successfully marked for deletion!{" " * 100}\033[0m',
+        )
 
-    def hardware_check_delete(self):
+    def hardware_check_delete(self, policy: Optional[PollingPolicy] = None):
         """
         Verify that the VM has been deleted on the cloudcix platform using ping.
+        :param policy: The polling policy to use. Defaults to `polling.PING`.
         """
         if self.phantom:
             print(
                 f'\r\033[91m - VM #{self.obj["id"]} ({self.obj["image"]["display_name"]}) is phantom, '
                 f'sleeping for 1 minute.{" " * 100} \033[0m',
             )
-            time.sleep(60)
+            clock.sleep(60)
             return
 
-        public_ip = None
-
-        for private_ip in self.obj['ip_addresses']:
-            if private_ip['public_ip'] is not None:
-                public_ip = private_ip['public_ip']['address']
-                break
-
+        public_ip = self.public_ip
         if not public_ip:
             print(
                 f'\r\033[91m - VM #{self.obj["id"]} does not have a public ip, '
                 f'sleeping for 1 minute.{" " * 100} \033[0m',
             )
-            time.sleep(60)
+            clock.sleep(60)
             return
 
-        self.ping(type='VM', id=self.obj['id'], ip=public_ip, response=False)
+        self.ping(
+            type='VM',
+            id=self.obj['id'],
+            ip=public_ip,
+            response=False,
+            policy=policy,
+            key=self.obj['image']['display_name'],
+        )
 
-    def update_token(self, token: str):
-        """
-        Method to update token.
-        Used for when Validator runs exceed 2 hours.
-        """
-
-        self.token = token
-
-    def sofware_check_state(self):
+    def sofware_check_state(self) -> bool:
         """
         Used to check if VM is in running state.
+        :return: False if the state of the VM could not be read, even after retrying, so the check could not be made.
         """
-        response = api.IAAS.vm.read(token=self.token, pk=self.obj['id'])
-        if response.status_code == 200:
-            vm_state = response.json()['content']['state']
-        else:
-            print(response.status_code)
-            print(response.json())
-            exit()
+        try:
+            response = call(f'read VM #{self.obj["id"]}', api.IAAS.vm.read, token=self.token, pk=self.obj['id'])
+        except APIError as e:
+            self.record_failure(f'VM #{self.obj["id"]}', e)
+            return False
+        vm_state = response.json()['content']['state']
         # Verify the VMs status using ping/rdp
         if vm_state != state.RUNNING:
             exit(1)
         print(f'\r - VM is in Running state.{" " * 100}')
+        return True
 
-    async def hardware_check_state(self):
+    async def hardware_check_state(self, prober: Prober, duration: float = 5 * 60, interval: float = 10) -> bool:
         """
         Pings the VMs for 5min and check if VMs are replying or not.
+        Runs entirely on the event loop, so many VMs can be checked at once with `asyncio.gather`.
+        :param prober: The prober to send pings through, shared by every VM being checked.
+        :param duration: The number of seconds to keep pinging for.
+        :param interval: The number of seconds between pings.
+        :return: False if the VM did not reply to any ping, True otherwise.
         """
         if self.phantom:
             print(
                 f'\r\033[91m - VM #{self.obj["id"]} ({self.obj["image"]["display_name"]}) is phantom, '
                 f'sleeping for 1 minute.{" " * 100} \033[0m',
             )
-            time.sleep(60)
-            return
-
-        for private_ip in self.obj['ip_addresses']:
-            if private_ip['public_ip'] is not None:
-                public_ip = private_ip['public_ip']['address']
-                break
+            await clock.asleep(60)
+            return True
 
+        public_ip = self.public_ip
         if not public_ip:
             print(
                 f'\r\033[91m - VM #{self.obj["id"]} does not have a public ip, '
                 f'sleeping for 1 minute.{" " * 100} \033[0m',
             )
-            return
+            return True
 
         print(f'\r - Pinging the VM # {self.obj["id"]}')
-        timeout = time.time() + 5 * 60
+        timeout = clock.monotonic() + duration
+        replies = 0
         loop_count = 0
 
-        while time.time() < timeout:
+        while clock.monotonic() < timeout:
             loop_count += 1
-            self.ping(type='VM', id=self.obj['id'], ip=public_ip, response=True)
-            await asyncio.sleep(10)
+            if await prober.probe(public_ip):
+                replies += 1
+            else:
+                print(f'\r\033[93m - VM #{self.obj["id"]} did not reply to ping at IP {public_ip} \033[0m')
+            await clock.asleep(max(0.0, min(interval, timeout - clock.monotonic())))
+
+        if replies == 0:
+            print(f'\r\033[91m - VM #{self.obj["id"]} is not pingable at IP {public_ip}{" " * 100} \033[0m')
+        else:
+            print(
+                f'\r\033[92m - VM #{self.obj["id"]} replied to {replies} of {loop_count} pings '
+                f'at IP {public_ip}{" " * 100} \033[0m',
+            )
+        return replies > 0
@@ -0,0 +1,168 @@
+# stdlib
+from typing import Callable, Collection, Dict, Hashable, List, Optional, Tuple
+# local
+import clock
+import state
+from polling import PollingPolicy
+
+# Outcomes of a wait
+SUCCESS = 'success'
+FAILURE = 'failure'
+TIMEOUT = 'timeout'
+
+# Names of the states, for printing timelines
+STATE_NAMES = {value: name for name, value in vars(state).items() if name.isupper()}
+
+
+class Timeline:
+    """
+    Class recording every state a resource was seen in while being waited on, and when it was first seen in it.
+    """
+
+    entries: List[Tuple[float, Optional[int]]]
+    finished: Optional[float]
+    started: float
+    started_at: float
+
+    def __init__(self):
+        self.entries = []
+        self.finished = None
+        self.started = clock.monotonic()
+        self.started_at = clock.time()
+
+    def add(self, status: Optional[int]):
+        """
+        Record that the resource was seen in the given state, if it was not already in it.
+        :param status: The state read for the resource.
+        """
+        if not self.entries or self.entries[-1][1] != status:
+            self.entries.append((clock.monotonic() - self.started, status))
+
+    def finish(self):
+        """
+        Mark the end of the wait, closing off the time spent in the last state.
+        """
+        self.finished = clock.monotonic() - self.started
+
+    @property
+    def states(self) -> List[Optional[int]]:
+        """
+        The states seen, in the order they were seen.
+        """
+        return [status for _, status in self.entries]
+
+    def durations(self) -> Dict[Optional[int], float]:
+        """
+        The number of seconds the resource was seen in each state.
+        The last state is counted up to the end of the wait, or up to now if the wait has not finished.
+        """
+        end = self.finished if self.finished is not None else clock.monotonic() - self.started
+        durations: Dict[Optional[int], float] = {}
+        for i, (offset, status) in enumerate(self.entries):
+            until = self.entries[i + 1][0] if i + 1 < len(self.entries) else end
+            durations[status] = durations.get(status, 0.0) + until - offset
+        return durations
+
+    def to_dict(self) -> Dict[str, object]:
+        """
+        A JSON serialisable representation of the timeline.
+        """
+        return {
+            'started_at': self.started_at,
+            'duration': self.finished,
+            'entries': [
+                {'offset': round(offset, 3), 'state': status, 'name': STATE_NAMES.get(status, str(status))}
+                for offset, status in self.entries
+            ],
+        }
+
+    def __str__(self) -> str:
+        durations = self.durations()
+        return ' → '.join(
+            f'{STATE_NAMES.get(status, status)} ({durations[status]:.1f}s)' for status in dict.fromkeys(self.states)
+        )
+
+
+class Waiter:
+    """
+    Class waiting for a resource to move through a set of intermediate states to a terminal state.
+
+    The resource is read until it reaches one of the success or failure states, or until the deadline passes. Every
+    state seen is recorded in a timeline so the time spent in each state can be profiled.
+    """
+
+    deadline: float
+    failure: Collection[int]
+    key: Optional[Hashable]
+    pending: Collection[int]
+    policy: PollingPolicy
+    read: Callable[[], int]
+    status: Optional[int]
+    strict: bool
+    success: Collection[int]
+    timeline: Timeline
+
+    def __init__(
+        self,
+        read: Callable[[], int],
+        pending: Collection[int],
+        success: Collection[int],
+        timeout: float,
+        policy: PollingPolicy,
+        failure: Collection[int] = (),
+        strict: bool = False,
+        key: Optional[Hashable] = None,
+    ):
+        """
+        Initialise an instance of the Waiter class.
+        :param read: Callable returning the current state of the resource.
+        :param pending: The intermediate states the resource is allowed to be in while the transition is in progress.
+        :param success: The terminal states that mean the transition succeeded.
+        :param timeout: The number of seconds to wait before giving up.
+        :param policy: The polling policy deciding how long to wait between reads.
+        :param failure: The terminal states that mean the transition failed.
+        :param strict: If True, any state that is not pending or success is treated as a failure. Otherwise states that
+                       are not listed are waited through.
+        :param key: The key transition durations are recorded against in the policy, e.g. an image name.
+        """
+        self.read = read
+        self.pending = pending
+        self.success = success
+        self.failure = failure
+        self.strict = strict
+        self.policy = policy
+        self.key = key
+        self.deadline = clock.monotonic() + timeout
+        self.status = None
+        self.timeline = Timeline()
+
+    def wait(self, progress: Optional[Callable[[int, int], None]] = None) -> str:
+        """
+        Read the resource until it reaches a terminal state or the deadline passes.
+        :param progress: Callable given the state and the number of reads so far whenever the resource is read in one
+                         of the pending states. Used for printing messages.
+        :return: One of `SUCCESS`, `FAILURE` or `TIMEOUT`.
+        """
+        loop_count = 0
+        outcome = TIMEOUT
+        while clock.monotonic() < self.deadline:
+            loop_count += 1
+            self.status = self.read()
+            self.timeline.add(self.status)
+
+            if self.status in self.success:
+                self.policy.record(self.key, clock.monotonic() - self.timeline.started)
+                outcome = SUCCESS
+                break
+            if self.status in self.failure or (self.strict and self.status not in self.pending):
+                outcome = FAILURE
+                break
+            if self.status in self.pending and progress is not None:
+                progress(self.status, loop_count)
+
+            elapsed = clock.monotonic() - self.timeline.started
+            interval = self.policy.interval(self.status, loop_count - 1, elapsed, self.key)
+            clock.sleep(max(0.0, min(interval, self.deadline - clock.monotonic())))
+
+        self.timeline.finish()
+        return outcome